@@ -0,0 +1,75 @@
+# startup_time.py
+"""
+Measures cold-start cost of every entry point on its early-exit paths.
+
+Usage: python benchmarks/startup_time.py [--runs N] [--importtime]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (label, argv) — each case should exit before any model or LLM work
+CASES = [
+    ("main.py --help", ["main.py", "--help"]),
+    ("main.py (usage error)", ["main.py"]),
+    ("main.py missing file", ["main.py", "does_not_exist.c"]),
+    ("main.py --html-only", ["main.py", "--html-only"]),
+    ("src/main.py --help", ["src/main.py", "--help"]),
+    ("src/main.py missing file", ["src/main.py", "does_not_exist.c"]),
+    ("guidelines/viewer.py import", ["-c", "import runpy; runpy.run_path('guidelines/viewer.py', run_name='bench')"]),
+    ("knowledge_base/viewer.py import", ["-c", "import runpy; runpy.run_path('knowledge_base/viewer.py', run_name='bench')"]),
+]
+
+
+def time_case(argv, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def top_imports(argv, limit=8):
+    """
+    Returns the slowest top-level imports reported by `python -X importtime`.
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        # Nested imports are indented; only keep the ones the entry point pulls in directly
+        if not name.startswith("  "):
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for reviewer entry points")
+    parser.add_argument("--runs", type=int, default=5, help="Process launches per case")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports per case")
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_case(["-c", "pass"], args.runs))
+    print(f"{'entry point':<36} {'min ms':>9} {'median ms':>10} {'over python':>12}")
+    print(f"{'python -c pass':<36} {'':>9} {baseline:>10.1f} {'':>12}")
+    for label, argv in CASES:
+        samples = time_case(argv, args.runs)
+        median = statistics.median(samples)
+        print(f"{label:<36} {min(samples):>9.1f} {median:>10.1f} {median - baseline:>12.1f}")
+        if args.importtime:
+            for cumulative_us, name in top_imports(argv):
+                print(f"    {name:<32} {cumulative_us / 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
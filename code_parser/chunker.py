@@ -1,60 +1,147 @@
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from config import CHUNK_LINE_LIMIT
-from pycparser import c_parser
-from pycparser.plyparser import ParseError
 from code_parser.utils import remove_comments, read_code_file
+from code_parser.parse_cache import function_outline, parse_count
 logger = logging.getLogger(__name__)
 
 def split_into_chunks(code_lines, chunk_size=CHUNK_LINE_LIMIT):
     """Fallback: chunk raw lines by size if parsing fails."""
-    chunks = []
+    return [span["code"] for span in split_into_spans(code_lines, chunk_size)]
+
+
+def split_into_spans(code_lines, chunk_size=CHUNK_LINE_LIMIT):
+    """Fallback: line windows with their 1-based start/end lines."""
+    spans = []
     for i in range(0, len(code_lines), chunk_size):
         chunk = code_lines[i:i+chunk_size]
-        chunks.append('\n'.join(chunk))
-    total_chunks = len(code_lines) // chunk_size + 1
-    logger.info("Line-based fallback chunking: %d chunks of ~%d lines", total_chunks, chunk_size)    
-    return chunks
+        spans.append({
+            "name": None,
+            "code": '\n'.join(chunk),
+            "start_line": i + 1,
+            "end_line": i + len(chunk),
+        })
+    logger.info("Line-based fallback chunking: %d chunks of ~%d lines", len(spans), chunk_size)
+    return spans
 
-def extract_function_chunks(filepath: str):
+
+def extract_function_spans(filepath: str):
     """
-    Parses a C file and extracts each function definition as a chunk.
-    Falls back to line-based splitting if parsing fails.
+    Parses a C file and returns one span per function definition:
+    {"name", "code", "start_line", "end_line", "stmt_lines"} with 1-based line numbers.
+    Falls back to line-based spans if parsing fails.
     """
     logger.info("Reading file: %s", filepath)
-    with open(filepath, "r") as f:
-        raw_code = f.read()
     raw_code = read_code_file(filepath)
+    return spans_from_code(remove_comments(raw_code))
 
 
-    clean_code = remove_comments(raw_code)
+def spans_from_code(clean_code: str):
+    """
+    Function spans for already comment-stripped source; see extract_function_spans.
+    """
     lines = clean_code.splitlines()
     logger.debug("Total lines in code: %d", len(lines))
-    try:
-        parser = c_parser.CParser()
-        ast = parser.parse(clean_code)
-
-        chunks = []
-        for ext in ast.ext:
-            if ext.__class__.__name__ == "FuncDef":
-                start_line = ext.coord.line - 1
-                func_header = lines[start_line].strip()
-                body_lines = []
-
-                # Naively collect function lines by counting braces
-                brace_count = 0
-                for i in range(start_line, len(lines)):
-                    line = lines[i]
-                    body_lines.append(line)
-                    brace_count += line.count("{") - line.count("}")
-                    if brace_count == 0 and "{" in line:
-                        break
-                chunks.append("\n".join(body_lines))
-
-        if not chunks:
-            return split_into_chunks(lines)
-        logger.info("Function parsing successful — found %d functions", len(chunks))
-        return chunks
-
-    except ParseError:
+    outline = function_outline(clean_code)
+    if outline is None:
         logger.warning("Parse failed or no functions found, using fallback chunking")
-        return split_into_chunks(lines)
\ No newline at end of file
+        return split_into_spans(lines)
+
+    spans = []
+    for name, first_line, last_line, stmt_lines in outline:
+        start_line = first_line - 1
+        body_lines = lines[start_line:last_line or len(lines)]
+        spans.append({
+            "name": name,
+            "code": "\n".join(body_lines),
+            "start_line": start_line + 1,
+            "end_line": start_line + len(body_lines),
+            "stmt_lines": stmt_lines,
+        })
+
+    if not spans:
+        return split_into_spans(lines)
+    logger.info("Function parsing successful — found %d functions", len(spans))
+    return spans
+
+
+def extract_function_chunks(filepath: str):
+    """
+    Parses a C file and extracts each function definition as a chunk.
+    Falls back to line-based splitting if parsing fails.
+    """
+    return [span["code"] for span in extract_function_spans(filepath)]
+
+
+def chunk_source(filepath: str, code: str, with_references: bool = True, token_budget: int = None,
+                 static_rules=None, changed_lines=None):
+    """
+    Parses, chunks, runs static rules on and (optionally) traces references for
+    source already in memory, e.g. an unsaved editor buffer. filepath only labels the result.
+    With a token_budget, functions over it are split; small ones are merged
+    later, by review_spans, once stored reviews are known.
+    With changed_lines (diff mode), only functions containing one of those lines
+    are kept, and static remarks are limited to those lines.
+    """
+    from code_parser.references import extract_file_references
+    from code_parser.packer import split_oversized, link_spans
+    from code_parser.static_rules import check_code
+    from code_parser.diff_mapper import spans_touching, filter_remarks
+    parses = parse_count()
+    clean_code = remove_comments(code)
+    lines = clean_code.splitlines()
+    functions = spans_from_code(clean_code)
+    if token_budget:
+        functions = split_oversized(functions, lines, token_budget)
+    link_spans(functions, lines)
+    spans = functions if changed_lines is None else spans_touching(functions, changed_lines)
+    related = None
+    if with_references:
+        # Dropped spans still take their own references, so none are charged to the next kept span
+        refs = extract_file_references(clean_code, functions)
+        kept = {id(s) for s in spans}
+        related = [r for s, r in zip(functions, refs) if id(s) in kept]
+    static_remarks, static_ids = check_code(clean_code, static_rules or [])
+    if changed_lines is not None:
+        static_remarks = filter_remarks(static_remarks, changed_lines)
+    return {"file": filepath, "spans": spans, "related_files": related,
+            "static_remarks": static_remarks, "static_rules": static_ids,
+            "line_count": clean_code.count("\n") + 1, "parsed": parse_count() > parses,
+            "parse_ok": function_outline(clean_code) is not None}
+
+
+def _chunk_file_task(filepath: str, with_references: bool, token_budget: int = None, static_rules=None,
+                     changed_lines=None):
+    # Runs in a worker process: read one file and chunk it
+    try:
+        logger.info("Reading file: %s", filepath)
+        return chunk_source(filepath, read_code_file(filepath), with_references, token_budget, static_rules,
+                            changed_lines)
+    except (OSError, UnicodeDecodeError) as e:
+        logger.error("Could not chunk %s: %s", filepath, e)
+        return {"file": filepath, "spans": [], "related_files": None, "static_remarks": [], "static_rules": [],
+                "error": str(e)}
+
+
+def chunk_files_parallel(filepaths, max_workers=None, with_references=True, token_budget=None, static_rules=None,
+                         changed_lines=None, pool=None):
+    """
+    Parses and chunks many files in a process pool (pycparser is CPU-bound pure Python).
+    With a token_budget, functions over that many model tokens are split (see code_parser.packer).
+    static_rules (see code_parser.static_rules) are checked in the same pass.
+    changed_lines maps paths to their changed line numbers for diff mode (see chunk_source).
+    A long-lived executor can be passed as pool instead of starting one per call.
+    Returns one {"file", "spans", "related_files", "static_remarks", "static_rules"} entry
+    per input path, in input order.
+    """
+    changed = [changed_lines.get(path) for path in filepaths] if changed_lines is not None else [None] * len(filepaths)
+    if len(filepaths) <= 1:
+        return [_chunk_file_task(path, with_references, token_budget, static_rules, lines)
+                for path, lines in zip(filepaths, changed)]
+    logger.info("Chunking %d files in a process pool", len(filepaths))
+    n = len(filepaths)
+    args = (_chunk_file_task, filepaths, [with_references] * n, [token_budget] * n, [static_rules] * n, changed)
+    if pool is not None:
+        return list(pool.map(*args, chunksize=8))
+    with ProcessPoolExecutor(max_workers=max_workers) as own_pool:
+        return list(own_pool.map(*args, chunksize=8))
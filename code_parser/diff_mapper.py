@@ -0,0 +1,160 @@
+# code_parser/diff_mapper.py
+
+import logging
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Optional, Set
+
+from config import DIFF_REMARK_CONTEXT
+
+logger = logging.getLogger(__name__)
+
+HUNK_RE = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def _diff_path(header: str) -> Optional[str]:
+    path = header[4:].split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path.startswith('"') and path.endswith('"'):
+        path = path[1:-1]
+    # git prefixes a/ and b/ unless --no-prefix
+    if path[:2] in ("a/", "b/"):
+        path = path[2:]
+    return path
+
+
+def parse_unified_diff(diff_text: str) -> Dict[str, Set[int]]:
+    """
+    Maps each file in a unified diff to the line numbers (in the new version)
+    that were added or changed. Pure deletions mark the lines on both sides of
+    the cut, so the function they were removed from still counts as touched.
+    Deleted files are left out.
+
+    Hunk bodies are read by the line counts in their @@ header, so a removed
+    line starting with "-- " or an added one starting with "++ " is never
+    mistaken for a file header.
+    """
+    changed: Dict[str, Set[int]] = {}
+    current = None
+    new_line = 0
+    old_left = new_left = 0  # lines of the current hunk not read yet
+    deleted = False  # removed lines not (yet) replaced by added ones
+
+    def close_deletion():
+        nonlocal deleted
+        if deleted and current is not None:
+            current.update(l for l in (new_line - 1, new_line) if l > 0)
+        deleted = False
+
+    for line in diff_text.splitlines():
+        if old_left > 0 or new_left > 0:
+            if line.startswith("+"):
+                if current is not None:
+                    current.add(new_line)
+                new_line += 1
+                new_left -= 1
+                deleted = False
+            elif line.startswith("-"):
+                old_left -= 1
+                deleted = True
+            elif line.startswith(" ") or line == "":
+                close_deletion()
+                new_line += 1
+                old_left -= 1
+                new_left -= 1
+            continue
+        if line.startswith("+++ "):
+            close_deletion()
+            path = _diff_path(line)
+            current = changed.setdefault(path, set()) if path else None
+            continue
+        m = HUNK_RE.match(line)
+        if m:
+            close_deletion()
+            old_left = int(m.group(1) or 1)
+            new_line, new_left = int(m.group(2)), int(m.group(3) or 1)
+            if new_left == 0:
+                # Nothing added: the removed lines sat after new line <start>
+                new_line += 1
+    close_deletion()
+    return {path: lines for path, lines in changed.items() if lines}
+
+
+def read_diff(diff_file: str) -> Dict[str, Set[int]]:
+    """
+    Reads a patch file ("-" for stdin) into parse_unified_diff's mapping.
+    """
+    if diff_file == "-":
+        return parse_unified_diff(sys.stdin.read())
+    with open(diff_file, "r", encoding="utf-8", errors="replace") as f:
+        return parse_unified_diff(f.read())
+
+
+def git_diff(path: str, rev: str = None) -> Dict[str, Set[int]]:
+    """
+    Changed lines from `git diff --unified=0 [rev]` in the repository holding
+    path, keyed by absolute file path. Without rev this is the unstaged diff,
+    like plain `git diff`.
+    """
+    cwd = path if os.path.isdir(path) else os.path.dirname(os.path.abspath(path))
+    root = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=cwd, capture_output=True,
+                          text=True, check=True).stdout.strip()
+    cmd = ["git", "diff", "--unified=0", "--no-color", "--no-ext-diff"] + ([rev] if rev else [])
+    diff_text = subprocess.run(cmd, cwd=root, capture_output=True, text=True, check=True).stdout
+    return {os.path.join(root, p): lines for p, lines in parse_unified_diff(diff_text).items()}
+
+
+def changed_lines_for_files(diff_map: Dict[str, Set[int]], code_files: List[str]) -> Dict[str, Set[int]]:
+    """
+    Matches diff paths to the files being reviewed: exactly after resolving
+    both against the current directory, otherwise by trailing path components
+    (a patch made in another checkout). Files the diff does not touch are left out.
+    """
+    resolved = {os.path.abspath(p): lines for p, lines in diff_map.items()}
+    matched = {}
+    for code_file in code_files:
+        full = os.path.abspath(code_file)
+        lines = resolved.get(full)
+        if lines is None:
+            lines = next((l for p, l in diff_map.items()
+                          if full.endswith(os.sep + p.replace("/", os.sep))), None)
+        if lines:
+            matched[code_file] = lines
+    return matched
+
+
+def spans_touching(spans: List[Dict], changed: Set[int]) -> List[Dict]:
+    """
+    Keeps the spans whose line range contains a changed line and records
+    those lines on each as "changed_lines".
+    """
+    touched = []
+    for span in spans:
+        lines = sorted(l for l in changed if span["start_line"] <= l <= span["end_line"])
+        if lines:
+            span["changed_lines"] = lines
+            touched.append(span)
+    return touched
+
+
+def filter_remarks(remarks: List[Dict], changed_lines, context: int = DIFF_REMARK_CONTEXT) -> List[Dict]:
+    """
+    Drops remarks more than context lines away from every changed line.
+    Remarks without a usable line number are kept.
+    """
+    changed = set(changed_lines)
+    if context:
+        changed = {l + d for l in changed for d in range(-context, context + 1)}
+    kept = []
+    for remark in remarks:
+        try:
+            line = int(remark.get("line"))
+        except (TypeError, ValueError):
+            kept.append(remark)
+            continue
+        if line in changed:
+            kept.append(remark)
+    return kept
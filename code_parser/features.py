@@ -0,0 +1,200 @@
+# code_parser/features.py
+
+import logging
+import re
+from typing import List, Set
+
+from pycparser import c_ast
+from pycparser.plyparser import ParseError
+
+from code_parser.lexer import iter_tokens, strip_comments
+from code_parser import parse_cache
+from code_parser.references import C_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+ALLOC_FUNCS = {"malloc", "calloc", "realloc", "free", "pvPortMalloc", "vPortFree"}
+PRINT_FUNCS = {"printf", "sprintf", "snprintf", "fprintf", "puts", "putchar", "vprintf"}
+IRQ_FUNCS = {"__disable_irq", "__enable_irq", "cli", "sei", "taskENTER_CRITICAL", "taskEXIT_CRITICAL"}
+ISR_NAME_RE = re.compile(r"(?i)(isr|irq|_handler$|interrupt)")
+DELAY_RE = re.compile(r"(?i)delay|sleep|wait")
+RTOS_RE = re.compile(r"^(x|v|ux|pv)(Task|Semaphore|Queue|Timer|EventGroup)")
+BIT_OPS = {"&", "|", "^", "~", "<<", ">>", "&=", "|=", "^=", "<<=", ">>="}
+SUBWORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+# Feature tags shared by code and guideline text (see reviewer.hybrid_index)
+TAGS = (
+    "pp_paste", "pp_stringize", "macro", "include", "goto", "dyn_alloc", "recursion", "volatile",
+    "cast", "void_ptr", "func_ptr", "pointer", "bitop", "loop", "busy_wait", "delay", "print",
+    "isr", "irq_control", "hw_access", "switch", "deep_nesting", "magic_number", "rtos", "global",
+    "long_function", "const_static", "uninit", "return_ignored",
+)
+
+
+def identifier_terms(code: str) -> List[str]:
+    """
+    Lowercased identifier sub-words (camelCase and snake_case split), e.g.
+    HAL_GPIO_WritePin -> hal, gpio, write, pin. Keywords are left to the feature tags.
+    """
+    terms = []
+    for kind, text, _, _ in iter_tokens(code):
+        if kind == "ident" and text not in C_KEYWORDS:
+            terms.extend(word.lower() for word in SUBWORD_RE.findall(text) if len(word) > 1)
+    return terms
+
+
+def _lexical_tags(code: str) -> Set[str]:
+    tags = set()
+    tokens = [(kind, text) for kind, text, _, _ in iter_tokens(code)]
+    for i, (kind, text) in enumerate(tokens):
+        nxt = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+        prev = tokens[i - 1][1] if i else ""
+        if text == "##":
+            tags.add("pp_paste")
+        elif text == "#":
+            tags.add("macro")
+            if nxt == "include":
+                tags.add("include")
+            elif kind == "punct" and i + 1 < len(tokens) and tokens[i + 1][0] == "ident" and prev not in ("", ";", "}", "{"):
+                tags.add("pp_stringize")
+        elif text in BIT_OPS and prev not in ("(", ",", "=", "return"):
+            tags.add("bitop")
+        elif text in ("for", "while", "do"):
+            tags.add("loop")
+        elif text in ("goto", "volatile", "switch"):
+            tags.add(text)
+        elif text in ("const", "static"):
+            tags.add("const_static")
+        elif text == "->" or text == "*" and prev in ("", "(", "=", "return", ",", ";", "{"):
+            tags.add("pointer")
+        elif kind == "number" and text.lower().startswith("0x") and len(text) > 6:
+            tags.add("hw_access")
+        elif kind == "number" and text not in ("0", "1", "0u", "1u", "0U", "1U"):
+            tags.add("magic_number")
+        elif kind == "ident" and nxt == "(":
+            _call_tags(text, tags)
+    return tags
+
+
+def _call_tags(name: str, tags: Set[str]):
+    if name in ALLOC_FUNCS:
+        tags.add("dyn_alloc")
+    elif name in PRINT_FUNCS:
+        tags.add("print")
+    elif name in IRQ_FUNCS:
+        tags.add("irq_control")
+    elif RTOS_RE.match(name):
+        tags.add("rtos")
+    if DELAY_RE.search(name):
+        tags.add("delay")
+
+
+class _TagVisitor(c_ast.NodeVisitor):
+    def __init__(self, tags: Set[str]):
+        self.tags = tags
+        self.function = None
+        self.nesting = 0
+
+    def visit_FuncDef(self, node):
+        self.function = node.decl.name
+        if ISR_NAME_RE.search(node.decl.name or ""):
+            self.tags.add("isr")
+        self.generic_visit(node)
+        self.function = None
+
+    def visit_FuncCall(self, node):
+        name = getattr(node.name, "name", None)
+        if name:
+            if name == self.function:
+                self.tags.add("recursion")
+            _call_tags(name, self.tags)
+        else:
+            self.tags.add("func_ptr")
+        self.generic_visit(node)
+
+    def visit_Cast(self, node):
+        self.tags.add("cast")
+        if isinstance(node.to_type.type, c_ast.PtrDecl) and isinstance(node.expr, c_ast.Constant):
+            self.tags.add("hw_access")
+        self.generic_visit(node)
+
+    def visit_PtrDecl(self, node):
+        self.tags.add("pointer")
+        if isinstance(node.type, c_ast.FuncDecl):
+            self.tags.add("func_ptr")
+        elif isinstance(node.type, c_ast.TypeDecl) and getattr(node.type.type, "names", None) == ["void"]:
+            self.tags.add("void_ptr")
+        self.generic_visit(node)
+
+    def visit_Decl(self, node):
+        if "volatile" in (node.quals or []):
+            self.tags.add("volatile")
+        if self.function is None and not isinstance(node.type, c_ast.FuncDecl) and "extern" not in (node.storage or []):
+            self.tags.add("global")
+        if self.function is not None and node.init is None and isinstance(node.type, c_ast.TypeDecl):
+            self.tags.add("uninit")
+        self.generic_visit(node)
+
+    def _loop(self, node, body):
+        self.tags.add("loop")
+        if body is None or isinstance(body, c_ast.EmptyStatement) or (
+                isinstance(body, c_ast.Compound) and not body.block_items):
+            self.tags.add("busy_wait")
+        self._nest(node)
+
+    def visit_While(self, node):
+        self._loop(node, node.stmt)
+
+    def visit_DoWhile(self, node):
+        self._loop(node, node.stmt)
+
+    def visit_For(self, node):
+        self._loop(node, node.stmt)
+
+    def visit_If(self, node):
+        self._nest(node)
+
+    def visit_Switch(self, node):
+        self.tags.add("switch")
+        self._nest(node)
+
+    def visit_Compound(self, node):
+        for item in node.block_items or []:
+            # A bare call statement discards its return value
+            if isinstance(item, c_ast.FuncCall):
+                self.tags.add("return_ignored")
+        self.generic_visit(node)
+
+    def _nest(self, node):
+        self.nesting += 1
+        if self.nesting > 3:
+            self.tags.add("deep_nesting")
+        self.generic_visit(node)
+        self.nesting -= 1
+
+
+def _ast_tags(source: str):
+    try:
+        ast = parse_cache.parse(source)
+    except (ParseError, AssertionError):
+        return None
+    tags = set()
+    _TagVisitor(tags).visit(ast)
+    return sorted(tags)
+
+
+def code_tags(code: str) -> Set[str]:
+    """
+    Feature tags of a C snippet. Token-level tags always apply; the pycparser
+    AST adds structural ones (casts, pointer kinds, recursion, busy-wait loops,
+    nesting, uninitialized locals) when the snippet parses standalone.
+    """
+    tags = _lexical_tags(code)
+    if code.count("\n") + 1 > 50:
+        tags.add("long_function")
+    # Typedefs for common fixed-width and RTOS types come from the preprocessing stage
+    ast_tags = parse_cache.cached("tags", strip_comments(code), _ast_tags)
+    if ast_tags is None:
+        logger.debug("Snippet does not parse standalone, using token-level tags only")
+        return tags
+    return tags | set(ast_tags)
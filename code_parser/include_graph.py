@@ -0,0 +1,380 @@
+# code_parser/include_graph.py
+
+import logging
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from config import INCLUDE_DIRS, MAX_PROMPT_DECLARATIONS, MAX_DECLARATION_CHARS
+from code_parser.lexer import iter_tokens, strip_comments
+from code_parser.references import INCLUDE_RE, C_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+DEFINE_RE = re.compile(r"^\s*#\s*define\s+([A-Za-z_]\w*)")
+TAG_WORDS = ("struct", "union", "enum")
+
+
+def scan_includes(clean_code: str) -> List[Dict]:
+    """
+    The #include directives of a comment-stripped file: {"name", "system", "line"}.
+    """
+    includes = []
+    for line_no, line in enumerate(clean_code.splitlines(), start=1):
+        m = INCLUDE_RE.match(line)
+        if m:
+            includes.append({"name": m.group(2), "system": m.group(1) == "<", "line": line_no})
+    return includes
+
+
+def _declaration(kind: str, name: str, text: str, line: int) -> Dict:
+    text = " ".join(text.split())
+    if len(text) > MAX_DECLARATION_CHARS:
+        text = text[:MAX_DECLARATION_CHARS].rstrip() + " /* ... */"
+    return {"name": name, "kind": kind, "text": text, "line": line}
+
+
+def _macros(clean_code: str) -> List[Dict]:
+    macros = []
+    lines = clean_code.splitlines()
+    i = 0
+    while i < len(lines):
+        m = DEFINE_RE.match(lines[i])
+        start = i
+        # Continuation lines belong to the same #define
+        while lines[i].rstrip().endswith("\\") and i + 1 < len(lines):
+            i += 1
+        if m:
+            text = " ".join(l.rstrip().rstrip("\\") for l in lines[start:i + 1])
+            macros.append(_declaration("macro", m.group(1), text, start + 1))
+        i += 1
+    return macros
+
+
+def _classify(tokens: List[tuple], body: Optional[tuple], code: str) -> List[Dict]:
+    """
+    Names declared by one file-scope statement (tokens up to its ';', or a
+    function definition whose body spans the offsets in body).
+    """
+    texts = [t[1] for t in tokens]
+    line = tokens[0][3]
+    end = body[0] if body else tokens[-1][2] + len(tokens[-1][1])
+    text = code[tokens[0][2]:end].strip()
+    if body:
+        # Function definition (e.g. static inline in a header): keep only the prototype
+        name = next((texts[i - 1] for i in range(1, len(texts)) if texts[i] == "(" and tokens[i - 1][0] == "ident"), None)
+        return [_declaration("function", name, text + ";", line)] if name else []
+
+    declared = []
+    depth = 0
+    braces = None
+    names = []
+    for i, (kind, tok, _, _) in enumerate(tokens):
+        if tok in ("{", "(", "["):
+            if tok == "{" and depth == 0:
+                braces = i
+            depth += 1
+        elif tok in ("}", ")", "]"):
+            depth -= 1
+        elif kind == "ident" and tok not in C_KEYWORDS:
+            nxt = texts[i + 1] if i + 1 < len(texts) else ""
+            if depth == 0 and nxt in (";", ",", "=", "[", ")", "("):
+                names.append((tok, nxt))
+
+    if texts[0] == "typedef":
+        # typedef void (*handler_t)(int);  -- the name sits inside the first parentheses
+        pointer = next((texts[i + 2] for i in range(len(texts) - 2)
+                        if texts[i] == "(" and texts[i + 1] == "*" and tokens[i + 2][0] == "ident"), None)
+        name = pointer or next((n for n, nxt in reversed(names) if nxt in (";", ",", "[")), None)
+        if name:
+            declared.append(_declaration("typedef", name, text, line))
+    elif any(n for n, nxt in names if nxt == "(") and braces is None:
+        name = next(n for n, nxt in names if nxt == "(")
+        declared.append(_declaration("function", name, text, line))
+    else:
+        for name, nxt in names:
+            if nxt in (";", ",", "=", "["):
+                declared.append(_declaration("variable", name, text, line))
+    # struct/union/enum tags, and enum constants, point at the same declaration
+    for i in range(len(texts) - 1):
+        if texts[i] in TAG_WORDS and tokens[i + 1][0] == "ident":
+            declared.append(_declaration(texts[i], f"{texts[i]} {texts[i + 1]}", text, line))
+            break
+    if "enum" in texts and braces is not None:
+        depth = 0
+        for i, (kind, tok, _, _) in enumerate(tokens[braces:], start=braces):
+            depth += {"{": 1, "}": -1}.get(tok, 0)
+            if depth == 1 and kind == "ident" and texts[i - 1] in ("{", ","):
+                declared.append(_declaration("enum_constant", tok, text, line))
+    return declared
+
+
+def extract_declarations(clean_code: str) -> Dict[str, Dict]:
+    """
+    File-scope declarations of a comment-stripped C file or header, by name:
+    macros, typedefs, struct/union/enum tags ("struct name"), enum constants,
+    function prototypes (definitions are reduced to their prototype) and
+    global variables. Works on tokens, so headers full of preprocessor
+    conditionals that pycparser cannot parse still yield their declarations.
+    """
+    declarations = {}
+    for macro in _macros(clean_code):
+        declarations.setdefault(macro["name"], macro)
+    # Preprocessor lines (with their continuations) are blanked, keeping line numbers, before scanning statements
+    lines = clean_code.splitlines()
+    directive = False
+    for i, line in enumerate(lines):
+        if directive or line.lstrip().startswith("#"):
+            directive = line.rstrip().endswith("\\")
+            lines[i] = ""
+    code = "\n".join(lines)
+    tokens = list(iter_tokens(code))
+    statement = []
+    depth = 0
+    body_start = None
+    for tok in tokens:
+        text = tok[1]
+        if depth == 0 and text == "{" and statement and statement[-1][1] == ")":
+            body_start = tok[2]
+        if text == "{":
+            depth += 1
+        elif text == "}":
+            depth = max(0, depth - 1)
+            if depth == 0 and body_start is not None:
+                for d in _classify(statement, (body_start,), code):
+                    declarations.setdefault(d["name"], d)
+                statement, body_start = [], None
+                continue
+        if body_start is not None:
+            continue
+        statement.append(tok)
+        if depth == 0 and text == ";":
+            if len(statement) > 1:
+                for d in _classify(statement, None, code):
+                    declarations.setdefault(d["name"], d)
+            statement = []
+    return declarations
+
+
+class IncludeGraph:
+    """
+    #include dependency graph of the reviewed files, resolved against the
+    including file's directory and then the include roots (like -I), for both
+    "" and <> includes. System headers outside the roots stay unresolved.
+
+    Every file is read and scanned at most once per graph (again only when
+    its mtime or size changes), and its declarations are kept, so a header
+    included by thousands of files is parsed once and shared by all of them.
+    """
+
+    def __init__(self, include_dirs: Iterable[str] = INCLUDE_DIRS):
+        self.include_dirs = [os.path.abspath(d) for d in include_dirs]
+        self._files: Dict[str, Dict] = {}
+        self._resolved: Dict[tuple, Optional[str]] = {}
+        self._closure: Dict[str, List[str]] = {}
+        self._declared_in: Dict[str, Dict[str, Dict]] = {}  # name -> {path: declaration}
+        self._lock = threading.RLock()
+        self.parsed = 0
+        self.reused = 0
+
+    # --- files ---
+
+    def _stamp(self, path: str):
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def add_file(self, path: str, code: str = None) -> Dict:
+        """
+        Scans a file (or its given in-memory contents) and the headers it
+        includes, transitively. Returns its {"includes", "declarations", ...} entry.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            info = self._scan(path, code)
+            seen, pending = {path}, deque([info])
+            while pending:
+                for inc in pending.popleft()["includes"]:
+                    target = inc["path"]
+                    if target and target not in seen:
+                        seen.add(target)
+                        pending.append(self._scan(target))
+            return info
+
+    def _scan(self, path: str, code: str = None) -> Dict:
+        stamp = self._stamp(path) if code is None else ("memory", hash(code))
+        info = self._files.get(path)
+        if info is not None and info["stamp"] == stamp:
+            self.reused += 1
+            return info
+        try:
+            if code is None:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    code = f.read()
+        except OSError as e:
+            logger.debug("Cannot read %s: %s", path, e)
+            code = ""
+        clean = strip_comments(code)
+        includes = scan_includes(clean)
+        for inc in includes:
+            inc["path"] = self.resolve(inc["name"], path, inc["system"])
+        info = {"path": path, "stamp": stamp, "includes": includes,
+                "declarations": extract_declarations(clean)}
+        old = self._files.get(path)
+        for name in old["declarations"] if old else ():
+            self._declared_in[name].pop(path, None)
+        for name, decl in info["declarations"].items():
+            self._declared_in.setdefault(name, {})[path] = decl
+        self._files[path] = info
+        self._closure.clear()
+        self.parsed += 1
+        return info
+
+    def resolve(self, name: str, from_file: str, system: bool = False) -> Optional[str]:
+        """
+        Path of an included header: next to the including file first (quoted
+        includes only), then each include root in order.
+        """
+        base = os.path.dirname(os.path.abspath(from_file))
+        key = (base if not system else None, name)
+        if key not in self._resolved:
+            candidates = ([] if system else [base]) + self.include_dirs
+            self._resolved[key] = next((os.path.normpath(os.path.join(d, name)) for d in candidates
+                                        if os.path.isfile(os.path.join(d, name))), None)
+        return self._resolved[key]
+
+    # --- graph queries ---
+
+    def includes(self, path: str) -> List[str]:
+        info = self._files.get(os.path.abspath(path))
+        return [inc["path"] for inc in info["includes"] if inc["path"]] if info else []
+
+    def dependencies(self, path: str) -> List[str]:
+        """
+        Headers the file includes, directly or indirectly, nearest first.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._closure:
+                seen, order, pending = {path}, [], deque(self.includes(path))
+                while pending:
+                    header = pending.popleft()
+                    if header in seen:
+                        continue
+                    seen.add(header)
+                    order.append(header)
+                    pending.extend(self.includes(header))
+                self._closure[path] = order
+            return self._closure[path]
+
+    def fan_in(self, files: Iterable[str] = None) -> Dict[str, int]:
+        """
+        For every known file, how many of files (default: all known files)
+        include it directly or indirectly. High fan-in headers affect the most code.
+        """
+        counts = {path: 0 for path in self._files}
+        for path in (os.path.abspath(f) for f in files) if files is not None else list(self._files):
+            for header in self.dependencies(path):
+                counts[header] = counts.get(header, 0) + 1
+        return counts
+
+    def find_symbol(self, name: str, from_file: str) -> Optional[Dict]:
+        """
+        Declaration of name visible from from_file: its own declarations first,
+        then its headers nearest first, then any other known file (e.g. the .c
+        file defining an extern). Returns the declaration with its "file".
+        """
+        path = os.path.abspath(from_file)
+        with self._lock:
+            declared_in = self._declared_in.get(name)
+            if not declared_in:
+                return None
+            for candidate in [path] + self.dependencies(path):
+                if candidate in declared_in:
+                    return dict(declared_in[candidate], file=candidate)
+            candidate, decl = next(iter(declared_in.items()))
+            return dict(decl, file=candidate)
+
+    def declarations_for(self, code: str, from_file: str, limit: int = MAX_PROMPT_DECLARATIONS,
+                         local_names: Iterable[str] = (), lines: tuple = None) -> List[Dict]:
+        """
+        Declarations the chunk uses (macros, types, prototypes, globals) from
+        from_file itself and its headers, in order of first use, at most limit.
+        Names in local_names (e.g. functions defined in the chunk) and
+        declarations inside the chunk's own (start, end) lines are skipped.
+        """
+        path = os.path.abspath(from_file)
+        skip = set(local_names)
+        used = []
+        for kind, text, _, _ in iter_tokens(code):
+            if kind == "ident" and text not in C_KEYWORDS and text not in skip:
+                skip.add(text)
+                used.append(text)
+        with self._lock:
+            sources = [self._files[p] for p in [path] + self.dependencies(path) if p in self._files]
+        needed, texts = [], set()
+        for name in used:
+            for info in sources:
+                decl = info["declarations"].get(name)
+                if decl is not None:
+                    if info["path"] == path and lines and lines[0] <= decl["line"] <= lines[1]:
+                        break
+                    if decl["text"] not in texts:
+                        texts.add(decl["text"])
+                        needed.append(dict(decl, file=info["path"]))
+                    break
+            if len(needed) >= limit:
+                break
+        return needed
+
+    def resolve_references(self, path: str, related: Optional[Dict]):
+        """
+        Replaces guessed or "unresolved" fileName values in a related_files
+        structure with the header an include resolves to, or the file
+        declaring an extern or called function.
+        """
+        for ref in (related or {}).get("files", []):
+            if ref.get("kind") == "include":
+                resolved = self.resolve(ref["fileName"], path, False)
+                if resolved:
+                    ref["fileName"] = os.path.relpath(resolved)
+            elif ref.get("kind") in ("extern", "call") and ref.get("symbol"):
+                decl = self.find_symbol(ref["symbol"], path)
+                if decl and decl["file"] != os.path.abspath(path):
+                    ref["fileName"] = os.path.relpath(decl["file"])
+                    ref["declaration_line"] = decl["line"]
+
+    def annotate(self, spans: List[Dict], related_files: List[Optional[Dict]]):
+        """
+        Resolves the references of every span and attaches the declarations
+        it needs as span["declarations"]. Spans need "file" (see collect_spans).
+        """
+        for span, related in zip(spans, related_files):
+            self.resolve_references(span["file"], related)
+            local = span.get("functions") or ([span["name"]] if span.get("name") else [])
+            span["declarations"] = self.declarations_for(span["code"], span["file"], local_names=local,
+                                                         lines=(span["start_line"], span["end_line"]))
+
+    def to_dict(self, files: Iterable[str] = None) -> Dict:
+        """
+        The graph as JSON-ready data: per file its resolved and unresolved
+        includes and how many of the reviewed files depend on it.
+        """
+        fan_in = self.fan_in(files)
+        return {
+            os.path.relpath(path): {
+                "includes": [os.path.relpath(inc["path"]) for inc in info["includes"] if inc["path"]],
+                "unresolved": [inc["name"] for inc in info["includes"] if not inc["path"]],
+                "declarations": len(info["declarations"]),
+                "fan_in": fan_in.get(path, 0),
+            }
+            for path, info in sorted(self._files.items())
+        }
+
+    def stats(self) -> Dict:
+        return {"files": len(self._files), "parsed": self.parsed, "reused": self.reused,
+                "declarations": sum(len(info["declarations"]) for info in self._files.values())}
@@ -0,0 +1,95 @@
+# code_parser/lexer.py
+
+import re
+from bisect import bisect_left
+from typing import Iterator, List, Tuple
+
+C_KEYWORDS = {
+    "if", "else", "for", "while", "do", "switch", "case", "return", "sizeof",
+    "goto", "break", "continue", "default", "typedef", "struct", "union", "enum",
+    "static", "extern", "const", "volatile", "inline", "register", "auto",
+    "void", "char", "short", "int", "long", "float", "double", "signed", "unsigned",
+    "_Bool", "_Alignof", "_Static_assert", "__attribute__", "__asm__", "asm",
+}
+
+# Comments and literals in one alternation so a single left-to-right scan
+# decides which construct starts first: "//" inside a string stays a string,
+# and a quote inside a comment stays a comment.
+_COMMENT_OR_LITERAL = re.compile(
+    r'//(?:\\\n|[^\n])*'                 # line comment (a trailing backslash continues it)
+    r'|/\*.*?(?:\*/|\Z)'                 # block comment (unterminated runs to end of file)
+    r'|"(?:\\.|\\\n|[^"\\\n])*"?'        # string literal
+    r"|'(?:\\.|\\\n|[^'\\\n])*'?",       # char literal
+    re.S,
+)
+
+_TOKEN = re.compile(
+    r'(?P<newline>\n)'
+    r'|(?P<space>[ \t\r\f\v]+|\\\n)'
+    r'|(?P<comment>//(?:\\\n|[^\n])*|/\*.*?(?:\*/|\Z))'
+    r'|(?P<string>"(?:\\.|\\\n|[^"\\\n])*"?)'
+    r"|(?P<char>'(?:\\.|\\\n|[^'\\\n])*'?)"
+    r'|(?P<ident>[A-Za-z_]\w*)'
+    r'|(?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)'
+    r'|(?P<punct>##|#|\.\.\.|<<=|>>=|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^!=<>]=|[^\s\w])',
+    re.S,
+)
+
+
+def _blank(match) -> str:
+    text = match.group(0)
+    if text[0] in "\"'":
+        return text
+    # Comments become the newlines they spanned (or one space), so line numbers do not move
+    newlines = text.count("\n")
+    return "\n" * newlines if newlines else " "
+
+
+def strip_comments(code: str) -> str:
+    """
+    Removes // and /* */ comments in one linear pass, leaving string and char
+    literals untouched and keeping every newline so lines match the original file.
+    """
+    return _COMMENT_OR_LITERAL.sub(_blank, code)
+
+
+def iter_tokens(code: str, keep_comments: bool = False) -> Iterator[Tuple[str, str, int, int]]:
+    """
+    Yields (kind, text, offset, line) for each token; kind is one of ident,
+    number, string, char, punct (and comment if keep_comments). Lines are 1-based.
+    """
+    line = 1
+    for match in _TOKEN.finditer(code):
+        kind = match.lastgroup
+        text = match.group(0)
+        if kind == "newline":
+            line += 1
+            continue
+        if kind == "space" or (kind == "comment" and not keep_comments):
+            line += text.count("\n")
+            continue
+        yield kind, text, match.start(), line
+        line += text.count("\n")
+
+
+def brace_lines(code: str) -> List[Tuple[str, int]]:
+    """
+    Every { and } outside comments and literals, as (brace, line) in source order.
+    """
+    return [(text, line) for kind, text, _, line in iter_tokens(code) if text in ("{", "}")]
+
+
+def block_end_line(braces: List[Tuple[str, int]], start_line: int) -> int:
+    """
+    Line of the brace closing the first block that opens on or after start_line,
+    or None if the block is never closed.
+    """
+    depth = 0
+    first = bisect_left(braces, start_line, key=lambda b: b[1])
+    for brace, line in braces[first:]:
+        depth += 1 if brace == "{" else -1
+        if depth == 0:
+            return line
+        if depth < 0:
+            depth = 0
+    return None
@@ -0,0 +1,178 @@
+# code_parser/packer.py
+
+import logging
+from typing import Dict, List
+
+from config import CHUNK_TOKEN_BUDGET, MAX_PROMPT_DECLARATIONS
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate model token count. Uses tiktoken (installed with litellm) when
+    available, otherwise about four characters per token.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def _make_span(lines: List[str], start_line: int, end_line: int, name, functions) -> Dict:
+    return {
+        "name": name,
+        "functions": functions,
+        "code": "\n".join(lines[start_line - 1:end_line]),
+        "start_line": start_line,
+        "end_line": end_line,
+    }
+
+
+def _split_lines(lines: List[str], start_line: int, end_line: int, budget: int) -> List[tuple]:
+    """
+    Last resort for a single statement over budget: cut at line boundaries.
+    """
+    ranges = []
+    begin, used = start_line, 0
+    for line_no in range(start_line, end_line + 1):
+        cost = count_tokens(lines[line_no - 1]) + 1
+        if used and used + cost > budget:
+            ranges.append((begin, line_no - 1))
+            begin, used = line_no, 0
+        used += cost
+    ranges.append((begin, end_line))
+    return ranges
+
+
+def split_span(span: Dict, lines: List[str], budget: int) -> List[Dict]:
+    """
+    Splits an oversized function at its top-level statement boundaries from the
+    AST, packing consecutive statements into pieces that fit the budget.
+    """
+    cuts = sorted(l for l in span.get("stmt_lines", []) if span["start_line"] < l <= span["end_line"])
+    # Segments: header up to the first statement, then one segment per statement
+    bounds = [span["start_line"]] + cuts + [span["end_line"] + 1]
+    segments = [(bounds[i], bounds[i + 1] - 1) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+    ranges = []
+    begin, end, used = None, None, 0
+    for seg_start, seg_end in segments:
+        cost = count_tokens("\n".join(lines[seg_start - 1:seg_end]))
+        if begin is not None and used + cost > budget:
+            ranges.append((begin, end))
+            begin, used = None, 0
+        if cost > budget:
+            ranges.extend(_split_lines(lines, seg_start, seg_end, budget))
+            continue
+        if begin is None:
+            begin = seg_start
+        end, used = seg_end, used + cost
+    if begin is not None:
+        ranges.append((begin, end))
+
+    name = span.get("name")
+    pieces = [_make_span(lines, a, b, name, [name] if name else []) for a, b in ranges]
+    for i, piece in enumerate(pieces):
+        piece["part"] = f"{i + 1}/{len(pieces)}"
+    logger.debug("Split %s into %d pieces", name or "chunk", len(pieces))
+    return pieces
+
+
+def split_oversized(spans: List[Dict], lines: List[str], budget: int = CHUNK_TOKEN_BUDGET) -> List[Dict]:
+    """
+    Splits the function spans over the token budget at statement boundaries
+    (split_span); the others are returned as they are. Merging small
+    functions happens later, once stored reviews are known (pack_groups).
+    """
+    result = []
+    split = 0
+    for span in spans:
+        if count_tokens(span["code"]) > budget:
+            result.extend(split_span(span, lines, budget))
+            split += 1
+        else:
+            result.append(span)
+    if split:
+        logger.info("Split %d oversized functions into %d pieces (budget %d tokens)",
+                    split, len(result) - len(spans) + split, budget)
+    return result
+
+
+def link_spans(spans: List[Dict], lines: List[str]):
+    """
+    Numbers the spans of one file ("index") and records the file lines between
+    each span and the one before it ("lead"), so neighbours can later be merged
+    into one contiguous chunk.
+    """
+    previous_end = None
+    for index, span in enumerate(spans):
+        span["index"] = index
+        span["lead"] = lines[previous_end:span["start_line"] - 1] if previous_end is not None else []
+        previous_end = span["end_line"]
+
+
+def pack_groups(spans: List[Dict], budget: int = CHUNK_TOKEN_BUDGET) -> List[List[int]]:
+    """
+    Groups the spans still to be reviewed (indices into spans, in order) to a
+    token budget: neighbouring spans of the same file (consecutive "index",
+    see link_spans) are merged while their code and the lines between them
+    fit. Spans whose neighbours were reused from the store or dropped stay
+    apart, so packing never re-sends reviewed code.
+    """
+    groups = []
+    group_tokens = 0
+    for i, span in enumerate(spans):
+        tokens = count_tokens(span["code"])
+        if groups:
+            last = spans[groups[-1][-1]]
+            neighbour = ("index" in span and last.get("file") == span.get("file")
+                         and last.get("index") == span["index"] - 1)
+            cost = tokens + (count_tokens("\n".join(span["lead"])) if span["lead"] else 0)
+            if neighbour and group_tokens + cost <= budget:
+                groups[-1].append(i)
+                group_tokens += cost
+                continue
+        groups.append([i])
+        group_tokens = tokens
+    if len(groups) < len(spans):
+        logger.info("Packed %d spans into %d chunks (budget %d tokens)", len(spans), len(groups), budget)
+    return groups
+
+
+def merge_group(spans: List[Dict]) -> Dict:
+    """
+    One span covering a pack_groups group, with the file lines between its members.
+    """
+    if len(spans) == 1:
+        return spans[0]
+    code_lines = spans[0]["code"].split("\n")
+    for span in spans[1:]:
+        code_lines += span["lead"] + span["code"].split("\n")
+    functions = [f for span in spans for f in span.get("functions", [span["name"]] if span.get("name") else [])]
+    changed = sorted({l for span in spans for l in span.get("changed_lines") or ()})
+    declarations = list({(d["kind"], d["name"]): d for span in spans
+                         for d in span.get("declarations") or ()}.values())[:MAX_PROMPT_DECLARATIONS]
+    merged = {
+        "name": ", ".join(dict.fromkeys(functions)) or None,
+        "functions": functions,
+        "code": "\n".join(code_lines),
+        "start_line": spans[0]["start_line"],
+        "end_line": spans[-1]["end_line"],
+        "static_rules": spans[0].get("static_rules", []),
+    }
+    if "file" in spans[0]:
+        merged["file"] = spans[0]["file"]
+    if changed:
+        merged["changed_lines"] = changed
+    if declarations:
+        merged["declarations"] = declarations
+    return merged
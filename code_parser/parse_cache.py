@@ -0,0 +1,187 @@
+# code_parser/parse_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import pycparser
+from pycparser import c_parser
+from pycparser.plyparser import ParseError
+
+from config import PARSE_CACHE_ENABLED, PARSE_CACHE_PATH
+from code_parser.lexer import brace_lines, block_end_line
+from code_parser.preprocess import parse_source, preprocess, CONFIG_DIGEST
+
+logger = logging.getLogger(__name__)
+
+# Bump when the shape of any cached result changes
+CACHE_FORMAT = 2
+AST_MEMO_SIZE = 8
+
+_local = threading.local()
+_memo_lock = threading.Lock()
+_ast_memo = OrderedDict()
+
+
+def source_hash(clean_code: str) -> str:
+    return hashlib.sha256(clean_code.encode("utf-8")).hexdigest()
+
+
+def get_parser() -> c_parser.CParser:
+    """
+    A warm CParser for the calling thread. Building one regenerates the PLY
+    tables, which costs more than parsing a typical file; instances are not
+    thread-safe, so each thread (and each worker process) keeps its own.
+    """
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = c_parser.CParser()
+    return parser
+
+
+def parse(clean_code: str):
+    """
+    Preprocesses and parses comment-stripped source with the thread's warm
+    parser (see code_parser.preprocess.parse_source). The last few ASTs are
+    memoized by content, so the chunker, reference extraction and static rules
+    share one parse of a file. Raises ParseError like CParser.parse (or
+    AssertionError, which pycparser raises on some malformed input).
+    """
+    key = source_hash(clean_code)
+    with _memo_lock:
+        if key in _ast_memo:
+            _ast_memo.move_to_end(key)
+            return _ast_memo[key]
+    _local.parses = getattr(_local, "parses", 0) + 1
+    ast = parse_source(get_parser(), clean_code)
+    with _memo_lock:
+        _ast_memo[key] = ast
+        while len(_ast_memo) > AST_MEMO_SIZE:
+            _ast_memo.popitem(last=False)
+    return ast
+
+
+def parse_count() -> int:
+    """
+    Parses attempted by the calling thread (memo and disk cache hits excluded).
+    """
+    return getattr(_local, "parses", 0)
+
+
+class ParseCache:
+    """
+    Results derived from parsing (function outlines, AST rule hits, feature
+    tags), keyed by kind and the hash of the comment-stripped source, stored
+    as zlib-compressed compact JSON. Unchanged files are never parsed again,
+    including files that failed to parse. Several worker processes can share
+    the file; each opens its own connection.
+    """
+
+    def __init__(self, path: str = PARSE_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS parse_results (key TEXT PRIMARY KEY, value BLOB, created REAL)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(kind: str, clean_code: str) -> str:
+        return f"{kind}:{CACHE_FORMAT}:{pycparser.__version__}:{CONFIG_DIGEST}:{source_hash(clean_code)}"
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM parse_results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, value):
+        blob = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO parse_results (key, value, created) VALUES (?, ?, ?)",
+                               (key, blob, time.time()))
+            self._conn.commit()
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_parse_cache() -> Optional[ParseCache]:
+    """
+    Per-process cache instance (a forked worker opens its own connection),
+    or None when disabled or the store cannot be opened.
+    """
+    global _cache, _cache_pid
+    if not PARSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache_pid != os.getpid():
+            try:
+                _cache = ParseCache()
+                _cache_pid = os.getpid()
+            except sqlite3.Error as e:
+                logger.warning("Parse cache unavailable (%s), parsing every file", e)
+                return None
+        return _cache
+
+
+def cached(kind: str, clean_code: str, compute: Callable[[str], object]):
+    """
+    compute(clean_code) through the on-disk cache. The result must be
+    JSON-serializable (tuples come back as lists); None is cached too.
+    """
+    cache = get_parse_cache()
+    if cache is None:
+        return compute(clean_code)
+    key = ParseCache.key(kind, clean_code)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit["value"]
+    value = compute(clean_code)
+    try:
+        cache.put(key, {"value": value})
+    except sqlite3.Error as e:
+        logger.debug("Could not store parse result: %s", e)
+    return value
+
+
+def _outline(clean_code: str):
+    try:
+        ast = parse(clean_code)
+    except (ParseError, AssertionError):
+        return None
+    # Braces of branches the preprocessor dropped must not count
+    braces = brace_lines(preprocess(clean_code))
+    outline = []
+    for ext in ast.ext:
+        if ext.__class__.__name__ == "FuncDef":
+            # Match braces on lexer tokens so braces in strings/chars are ignored
+            end_line = block_end_line(braces, ext.coord.line)
+            # Top-level statement lines are the safe split points for oversized functions
+            items = ext.body.block_items or []
+            outline.append([ext.decl.name, ext.coord.line, end_line,
+                            [item.coord.line for item in items if item.coord is not None]])
+    return outline
+
+
+def function_outline(clean_code: str):
+    """
+    [name, first_line, last_line, stmt_lines] per function definition, or None
+    when the source does not parse. last_line is None if its brace is unmatched.
+    """
+    return cached("functions", clean_code, _outline)
@@ -0,0 +1,251 @@
+# code_parser/preprocess.py
+
+import hashlib
+import json
+import logging
+import re
+from bisect import bisect_right
+from typing import Iterable, List, Optional, Set
+
+from pycparser.plyparser import ParseError
+
+from config import (PREPROCESS_TYPEDEFS, PREPROCESS_TYPE_NAME_RE, PREPROCESS_MACROS, PREPROCESS_STRIP_CALLS,
+                    PREPROCESS_ASM_KEYWORDS, PREPROCESS_UNDEFINED, PREPROCESS_MAX_TYPE_GUESSES)
+from code_parser.lexer import iter_tokens, C_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+# File name of the reviewed source in pycparser coordinates; nodes from the typedef prelude have another one
+SOURCE_NAME = "<source>"
+
+# Changes whenever the preprocessing configuration does, so cached parse results follow it
+CONFIG_DIGEST = hashlib.sha256(json.dumps(
+    [PREPROCESS_TYPEDEFS, PREPROCESS_TYPE_NAME_RE, PREPROCESS_MACROS, PREPROCESS_STRIP_CALLS,
+     PREPROCESS_ASM_KEYWORDS, PREPROCESS_UNDEFINED, PREPROCESS_MAX_TYPE_GUESSES], sort_keys=True
+).encode("utf-8")).hexdigest()[:12]
+
+DIRECTIVE_RE = re.compile(r"^\s*#\s*(\w*)(.*)$")
+OBJECT_MACRO_RE = re.compile(r"([A-Za-z_]\w*)(?:\s+(.*))?$")
+TYPE_NAME_RE = re.compile(PREPROCESS_TYPE_NAME_RE)
+ERROR_RE = re.compile(r":(\d+):(\d+): before: ")
+ASM_QUALIFIERS = {"volatile", "__volatile__", "__volatile", "goto", "inline"}
+QUALIFIERS = {"static", "extern", "const", "volatile", "inline", "register", "restrict", "auto"}
+STATEMENT_BOUNDARIES = {";", "{", "}", "(", ","}
+CLOSING = {"(": ")", "{": "}"}
+
+
+def _blank(text: str) -> str:
+    return re.sub(r"[^\n]", " ", text)
+
+
+def _condition(keyword: str, expr: str) -> Optional[bool]:
+    """
+    Value of a conditional directive when it can be decided locally, else None.
+    """
+    expr = expr.strip()
+    if keyword in ("ifdef", "ifndef"):
+        if expr in PREPROCESS_UNDEFINED:
+            return keyword == "ifndef"
+        return None
+    m = re.fullmatch(r"\(?\s*(\d+)[uUlL]*\s*\)?", expr)
+    if m:
+        return int(m.group(1)) != 0
+    m = re.fullmatch(r"(!?)\s*defined\s*\(?\s*(\w+)\s*\)?", expr)
+    if m and m.group(2) in PREPROCESS_UNDEFINED:
+        return bool(m.group(1))
+    return None
+
+
+def strip_directives(clean_code: str):
+    """
+    Blanks every preprocessor line (with its continuations) and the lines of
+    conditional branches that are not taken: a branch decided by a literal or
+    a PREPROCESS_UNDEFINED name goes the way the compiler would, anything else
+    keeps the first branch. Returns the text, with every line where it was,
+    and the object-like macros defined in taken branches ({name: body}).
+    """
+    lines = clean_code.split("\n")
+    stack = []  # [active, branch_taken] per open #if
+    active = True
+    macros = {}
+    i = 0
+    while i < len(lines):
+        m = DIRECTIVE_RE.match(lines[i])
+        if m is None:
+            if not active:
+                lines[i] = ""
+            i += 1
+            continue
+        start = i
+        while lines[i].rstrip().endswith("\\") and i + 1 < len(lines):
+            i += 1
+        keyword = m.group(1)
+        rest = " ".join([m.group(2)] + lines[start + 1:i + 1]).replace("\\", " ")
+        for k in range(start, i + 1):
+            lines[k] = ""
+        i += 1
+
+        if keyword in ("if", "ifdef", "ifndef"):
+            take = _condition(keyword, rest) is not False
+            stack.append([active, take])
+            active = active and take
+        elif keyword == "elif" and stack:
+            parent, taken = stack[-1]
+            take = not taken and _condition("if", rest) is not False
+            stack[-1][1] = taken or take
+            active = parent and take
+        elif keyword == "else" and stack:
+            parent, taken = stack[-1]
+            stack[-1][1] = True
+            active = parent and not taken
+        elif keyword == "endif" and stack:
+            active = stack.pop()[0]
+        elif keyword == "define" and active:
+            # "NAME(" is function-like; only "NAME" or "NAME body" is an object-like macro
+            d = OBJECT_MACRO_RE.match(rest.strip())
+            if d and not rest.strip()[len(d.group(1)):].startswith("("):
+                macros[d.group(1)] = (d.group(2) or "").strip()
+    return "\n".join(lines), macros
+
+
+def _group_end(tokens: list, j: int) -> Optional[int]:
+    if j >= len(tokens) or tokens[j][1] not in CLOSING:
+        return None
+    opening, closing = tokens[j][1], CLOSING[tokens[j][1]]
+    depth = 0
+    for k in range(j, len(tokens)):
+        if tokens[k][1] == opening:
+            depth += 1
+        elif tokens[k][1] == closing:
+            depth -= 1
+            if depth == 0:
+                return k
+    return None
+
+
+def rewrite_extensions(code: str, macros: dict = None) -> str:
+    """
+    Drops compiler extensions pycparser does not know (__attribute__((...))
+    and the other PREPROCESS_STRIP_CALLS, inline assembly) and rewrites
+    PREPROCESS_MACROS keywords, plus any of the given object-like macros that
+    expand to nothing but qualifiers (`#define INLINE static inline`, an empty
+    `#define ISR_ATTR`). Newlines are kept, so lines do not move.
+    """
+    replacements = dict(PREPROCESS_MACROS)
+    for name, body in (macros or {}).items():
+        expanded = rewrite_extensions(body) if body else ""
+        if all(kind == "ident" and text in QUALIFIERS for kind, text, _, _ in iter_tokens(expanded)):
+            replacements[name] = " ".join(expanded.split())
+
+    tokens = list(iter_tokens(code))
+    edits = []
+    i = 0
+    while i < len(tokens):
+        kind, text, offset, _ = tokens[i]
+        if kind == "ident" and (text in PREPROCESS_STRIP_CALLS or text in PREPROCESS_ASM_KEYWORDS):
+            j = i + 1
+            if text in PREPROCESS_ASM_KEYWORDS:
+                while j < len(tokens) and tokens[j][1] in ASM_QUALIFIERS:
+                    j += 1
+            end = _group_end(tokens, j)
+            if end is not None:
+                edits.append((offset, tokens[end][2] + 1, None))
+                i = end + 1
+                continue
+        elif kind == "ident" and text in replacements:
+            edits.append((offset, offset + len(text), replacements[text]))
+        i += 1
+
+    out, pos = [], 0
+    for start, end, replacement in edits:
+        out.append(code[pos:start])
+        out.append(replacement if replacement else _blank(code[start:end]))
+        pos = end
+    out.append(code[pos:])
+    return "".join(out)
+
+
+def preprocess(clean_code: str) -> str:
+    """
+    Comment-stripped source made parseable by pycparser without a compiler:
+    directives resolved (strip_directives), extensions removed (rewrite_extensions).
+    Line N of the result is line N of the input.
+    """
+    text, macros = strip_directives(clean_code)
+    return rewrite_extensions(text, macros)
+
+
+def type_names(tokens: list) -> List[str]:
+    """
+    PREPROCESS_TYPEDEFS plus the identifiers that look like type names
+    (PREPROCESS_TYPE_NAME_RE) and are never called like a function.
+    """
+    names, called = set(), set()
+    for k, (kind, text, _, _) in enumerate(tokens):
+        if kind == "ident" and TYPE_NAME_RE.fullmatch(text):
+            if k + 1 < len(tokens) and tokens[k + 1][1] == "(":
+                called.add(text)
+            else:
+                names.add(text)
+    names -= called | C_KEYWORDS | set(PREPROCESS_TYPEDEFS)
+    return list(PREPROCESS_TYPEDEFS) + sorted(names)
+
+
+def prelude(names: Iterable[str]) -> str:
+    """
+    Typedefs for names, then a line marker so the source that follows starts at line 1 of SOURCE_NAME.
+    """
+    return "".join(f"typedef int {name};\n" for name in names) + f'# 1 "{SOURCE_NAME}"\n'
+
+
+def _guess_type(tokens: list, text: str, message: str, known: Set[str]) -> Optional[str]:
+    """
+    The undeclared type a parse error most likely points at: the first unknown
+    identifier of the statement that the offending token belongs to.
+    """
+    m = ERROR_RE.search(message)
+    if m is None:
+        return None
+    line, col = int(m.group(1)), int(m.group(2))
+    lines = text.split("\n")
+    if line > len(lines):
+        return None
+    offset = sum(len(l) + 1 for l in lines[:line - 1]) + col - 1
+    k = bisect_right(tokens, offset, key=lambda t: t[2]) - 1
+    window = []
+    while k >= 0 and tokens[k][1] not in STATEMENT_BOUNDARIES:
+        window.append(tokens[k])
+        k -= 1
+    for kind, name, _, _ in reversed(window):
+        if kind == "ident" and name not in C_KEYWORDS and name not in known:
+            return name
+    return None
+
+
+def parse_source(parser, clean_code: str):
+    """
+    Parses comment-stripped source after preprocess(), with likely type names
+    declared up front (type_names). While a parse error points at a statement
+    starting with an undeclared identifier, that identifier is declared as a
+    type and the parse retried, up to PREPROCESS_MAX_TYPE_GUESSES times.
+    Coordinates of the returned AST are lines of the original file.
+    Raises ParseError if the source still does not parse.
+    """
+    text = preprocess(clean_code)
+    tokens = list(iter_tokens(text))
+    names = type_names(tokens)
+    guesses = []
+    while True:
+        try:
+            ast = parser.parse(prelude(names + guesses) + text)
+        except ParseError as e:
+            if len(guesses) >= PREPROCESS_MAX_TYPE_GUESSES:
+                raise
+            guess = _guess_type(tokens, text, str(e), set(names) | set(guesses))
+            if guess is None:
+                raise
+            guesses.append(guess)
+            continue
+        if guesses:
+            logger.debug("Parsed after declaring %s as types", ", ".join(guesses))
+        return ast
@@ -0,0 +1,128 @@
+# code_parser/references.py
+
+import logging
+import re
+from typing import Dict, List
+
+from code_parser.lexer import C_KEYWORDS
+from code_parser.parse_cache import function_outline
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_LIST_NAME = "Potentially Impactful files to be reviewed later"
+
+INCLUDE_RE = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]')
+DEFINE_FUNC_RE = re.compile(r'^\s*#\s*define\s+([A-Za-z_]\w*)\(')
+EXTERN_RE = re.compile(r'^\s*extern\s+(?!"C")[^;]*?\b([A-Za-z_]\w*)\s*(?:\(|\[|;|=|,)')
+FUNC_DEF_RE = re.compile(r'^\s*[A-Za-z_][\w\s\*]*?\b([A-Za-z_]\w*)\s*\([^;]*$')
+CALL_RE = re.compile(r'\b([A-Za-z_]\w*)\s*\(')
+STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+
+
+def defined_functions(clean_code: str) -> set:
+    """
+    Names of functions and function-like macros defined in the file.
+    Uses the pycparser AST when the file parses, otherwise a line heuristic.
+    """
+    names = {m.group(1) for m in map(DEFINE_FUNC_RE.match, clean_code.splitlines()) if m}
+    outline = function_outline(clean_code)
+    if outline is not None:
+        return names | {entry[0] for entry in outline}
+    logger.debug("Parse failed, detecting function definitions heuristically")
+
+    depth = 0
+    for line in clean_code.splitlines():
+        stripped = STRING_RE.sub('""', line)
+        if depth == 0 and not stripped.lstrip().startswith("#"):
+            m = FUNC_DEF_RE.match(stripped)
+            if m and m.group(1) not in C_KEYWORDS:
+                names.add(m.group(1))
+        depth = max(0, depth + stripped.count("{") - stripped.count("}"))
+    return names
+
+
+def span_start_depth(span: Dict) -> int:
+    """
+    Brace depth at the first line of a chunk span: 1 for the pieces of a split
+    function after the first, which start inside its body, else 0.
+    """
+    part = span.get("part")
+    return 1 if part and not part.startswith("1/") else 0
+
+
+def extract_references(code: str, start_line: int = 1, local_names=(), depth: int = 0) -> List[Dict]:
+    """
+    Finds #include lines, extern declarations and calls to functions that are
+    not defined locally. Line numbers are reported relative to start_line.
+    Calls count inside braces only; depth is the brace depth code starts at
+    (see span_start_depth).
+    """
+    local_names = set(local_names)
+    refs = []
+    for offset, line in enumerate(code.splitlines()):
+        line_no = start_line + offset
+
+        include = INCLUDE_RE.match(line)
+        if include:
+            system = include.group(1) == "<"
+            refs.append({
+                "fileName": include.group(2),
+                "explanation": f"{'System header' if system else 'Header file'} included in lineNumber {line_no}",
+                "kind": "include",
+                "line": line_no,
+            })
+            continue
+        stripped = STRING_RE.sub('""', line)
+        if stripped.lstrip().startswith("#"):
+            continue
+
+        extern = EXTERN_RE.match(stripped)
+        if extern:
+            refs.append({
+                "fileName": "unresolved",
+                "explanation": f"extern declaration of '{extern.group(1)}' in lineNumber {line_no}",
+                "kind": "extern",
+                "symbol": extern.group(1),
+                "line": line_no,
+            })
+        else:
+            for call in CALL_RE.finditer(stripped):
+                name = call.group(1)
+                if name in C_KEYWORDS or name in local_names:
+                    continue
+                # Depth at the call itself, so `void f(void) { g(); }` on one line counts g
+                before = stripped[:call.start()]
+                if depth + before.count("{") - before.count("}") <= 0:
+                    continue
+                refs.append({
+                    "fileName": "unresolved",
+                    "explanation": f"Call to externally defined function '{name}' in lineNumber {line_no}",
+                    "kind": "call",
+                    "symbol": name,
+                    "line": line_no,
+                })
+        depth = max(0, depth + stripped.count("{") - stripped.count("}"))
+    return refs
+
+
+def extract_file_references(clean_code: str, spans: List[Dict]) -> List[Dict]:
+    """
+    Builds the related_files structure for every span of a file.
+
+    References inside a span belong to it; file-scope lines between spans
+    (includes, extern declarations) are attached to the span that follows them.
+    Repeated calls to the same function are reported once per span.
+    """
+    refs = extract_references(clean_code, 1, defined_functions(clean_code))
+    buckets = [[] for _ in spans]
+    seen = [set() for _ in spans]
+    for ref in refs:
+        target = next((i for i, span in enumerate(spans) if ref["line"] <= span["end_line"]), len(spans) - 1)
+        if target < 0:
+            break
+        if ref["kind"] == "call":
+            if ref["symbol"] in seen[target]:
+                continue
+            seen[target].add(ref["symbol"])
+        buckets[target].append(ref)
+    return [{"name": REFERENCE_LIST_NAME, "files": files} for files in buckets]
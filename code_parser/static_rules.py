@@ -0,0 +1,198 @@
+# code_parser/static_rules.py
+
+import hashlib
+import json
+import logging
+import re
+from bisect import bisect_right
+from typing import Dict, List, Tuple
+
+from pycparser import c_ast
+from pycparser.plyparser import ParseError
+
+from code_parser.lexer import iter_tokens, brace_lines, block_end_line
+from code_parser import parse_cache
+from code_parser.preprocess import preprocess, SOURCE_NAME
+
+logger = logging.getLogger(__name__)
+
+MATCHER_TYPES = ("token", "regex", "ast")
+
+
+def static_guidelines(guidelines: List[Dict]) -> List[Dict]:
+    """
+    Guidelines that declare a deterministic "matcher" and are checked locally
+    instead of by the LLM. A matcher is one of:
+
+      {"type": "token", "tokens": ["##"]}                  token sequence
+      {"type": "regex", "pattern": "\\bvoid\\s*\\*"}          regex over comment-stripped source
+      {"type": "ast", "node": "FuncDef", "max_lines": 50}  AST node type, optionally with
+                                                           "names", "max_lines" or "max_depth"
+    """
+    rules = []
+    for g in guidelines:
+        matcher = g.get("matcher")
+        if not matcher:
+            continue
+        if matcher.get("type") not in MATCHER_TYPES:
+            logger.warning("Guideline %s has unknown matcher type %r, leaving it to the LLM", g.get("id"), matcher.get("type"))
+            continue
+        rules.append(g)
+    return rules
+
+
+def _remark(rule: Dict, line: int, detail: str = None) -> Dict:
+    matcher = rule["matcher"]
+    issue = matcher.get("message") or rule["rule"]
+    return {
+        "line": line,
+        "guideline_id": rule["id"],
+        "issue": f"{issue} ({detail})" if detail else issue,
+        "suggestion": matcher.get("suggestion") or rule.get("description", ""),
+        "source": "static",
+    }
+
+
+def _token_matches(rule: Dict, tokens: List[Tuple]) -> List[Dict]:
+    pattern = rule["matcher"]["tokens"]
+    n = len(pattern)
+    hits = []
+    for i in range(len(tokens) - n + 1):
+        if all(tokens[i + k][1] == pattern[k] for k in range(n)):
+            hits.append(_remark(rule, tokens[i][3]))
+    return hits
+
+
+def _regex_matches(rule: Dict, clean_code: str, line_starts: List[int]) -> List[Dict]:
+    pattern = re.compile(rule["matcher"]["pattern"], re.M)
+    return [_remark(rule, bisect_right(line_starts, m.start())) for m in pattern.finditer(clean_code)]
+
+
+def _node_name(node) -> str:
+    if isinstance(node, c_ast.FuncCall):
+        return getattr(node.name, "name", None)
+    if isinstance(node, c_ast.FuncDef):
+        return node.decl.name
+    return getattr(node, "name", None)
+
+
+class _AstMatcher(c_ast.NodeVisitor):
+    """
+    Walks the AST once per rule, tracking nesting depth of the matched node types.
+    """
+
+    def __init__(self, rule: Dict, braces: List[Tuple[str, int]]):
+        matcher = rule["matcher"]
+        self.rule = rule
+        self.types = tuple(getattr(c_ast, name) for name in matcher["node"].split("|"))
+        self.names = set(matcher.get("names", ()))
+        self.max_lines = matcher.get("max_lines")
+        self.max_depth = matcher.get("max_depth")
+        self.braces = braces
+        self.depth = 0
+        self.hits = []
+
+    def generic_visit(self, node):
+        matched = isinstance(node, self.types)
+        if matched:
+            self.depth += 1
+            self._check(node)
+        for name, child in node.children():
+            # "else if" continues the same level rather than nesting one deeper
+            chained = matched and name == "iffalse" and isinstance(node, c_ast.If) and isinstance(child, c_ast.If)
+            self.depth -= chained
+            self.visit(child)
+            self.depth += chained
+        if matched:
+            self.depth -= 1
+
+    def _check(self, node):
+        if node.coord is None or node.coord.file != SOURCE_NAME:
+            return
+        line = node.coord.line
+        if self.names and _node_name(node) not in self.names:
+            return
+        if self.max_depth is not None:
+            # Report only the level that first crosses the limit, not every deeper one
+            if self.depth == self.max_depth + 1:
+                self.hits.append(_remark(self.rule, line, f"nesting depth {self.depth} > {self.max_depth}"))
+            return
+        if self.max_lines is not None:
+            end = block_end_line(self.braces, line) or line
+            length = end - line + 1
+            if length > self.max_lines:
+                self.hits.append(_remark(self.rule, line, f"{_node_name(node)} is {length} lines"))
+            return
+        self.hits.append(_remark(self.rule, line, _node_name(node)))
+
+
+def _ast_matches(clean_code: str, rules: List[Dict]):
+    """
+    [remarks, applied rule ids] for the AST rules, or None if the file does not parse.
+    """
+    try:
+        ast = parse_cache.parse(clean_code)
+    except (ParseError, AssertionError):
+        return None
+    braces = brace_lines(preprocess(clean_code))
+    remarks, applied = [], []
+    for rule in rules:
+        try:
+            visitor = _AstMatcher(rule, braces)
+            visitor.visit(ast)
+        except (KeyError, AttributeError) as e:
+            logger.warning("Static rule %s is misconfigured (%s), leaving it to the LLM", rule.get("id"), e)
+            continue
+        remarks.extend(visitor.hits)
+        applied.append(rule["id"])
+    return [remarks, applied]
+
+
+def check_code(clean_code: str, rules: List[Dict]) -> Tuple[List[Dict], List[str]]:
+    """
+    Runs the static rules over comment-stripped source. Returns the remarks
+    (same schema as LLM remarks, tagged "source": "static") and the ids of the
+    rules that were actually checked: AST rules are skipped when the file does
+    not parse, so the caller can leave those to the LLM.
+    """
+    if not rules:
+        return [], []
+    remarks, applied = [], []
+    tokens = None
+    line_starts = None
+    ast_rules = []
+
+    for rule in rules:
+        kind = rule["matcher"]["type"]
+        try:
+            if kind == "token":
+                if tokens is None:
+                    tokens = list(iter_tokens(clean_code))
+                remarks.extend(_token_matches(rule, tokens))
+            elif kind == "regex":
+                if line_starts is None:
+                    line_starts = [0] + [m.end() for m in re.finditer("\n", clean_code)]
+                remarks.extend(_regex_matches(rule, clean_code, line_starts))
+            else:
+                ast_rules.append(rule)
+                continue
+        except (KeyError, AttributeError, re.error) as e:
+            logger.warning("Static rule %s is misconfigured (%s), leaving it to the LLM", rule.get("id"), e)
+            continue
+        applied.append(rule["id"])
+
+    if ast_rules:
+        # Hits depend on the source and the rule definitions only, so unchanged files skip the parse
+        digest = hashlib.sha256(json.dumps(ast_rules, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        matched = parse_cache.cached(f"ast_rules:{digest}", clean_code, lambda c: _ast_matches(c, ast_rules))
+        if matched is None:
+            logger.debug("Parse failed, AST rules are left to the LLM")
+        else:
+            remarks.extend(matched[0])
+            applied.extend(matched[1])
+
+    # One remark per rule and line
+    unique = {(r["guideline_id"], r["line"]): r for r in remarks}
+    remarks = sorted(unique.values(), key=lambda r: (r["line"], r["guideline_id"]))
+    logger.info("Static rules: %d checked, %d remarks", len(applied), len(remarks))
+    return remarks, applied
@@ -1,15 +1,15 @@
 # code_parser/utils.py
 
-import re
 import os
+from code_parser.lexer import strip_comments
 
 def remove_comments(code: str) -> str:
     """
     Removes single-line (//) and multi-line (/* */) comments from C code.
+    Newlines are kept, so line numbers match the original file, and comment
+    markers inside string or char literals are left alone.
     """
-    code = re.sub(r'//.*', '', code)
-    code = re.sub(r'/\*[\s\S]*?\*/', '', code)
-    return code
+    return strip_comments(code)
 
 
 def is_c_file(filename: str) -> bool:
@@ -25,3 +25,14 @@ def read_code_file(filepath: str) -> str:
     """
     with open(filepath, "r", encoding="utf-8") as f:
         return f.read()
+
+
+def find_c_files(root: str) -> list:
+    """
+    Recursively collects .c and .h files under root, skipping hidden directories.
+    """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        found.extend(os.path.join(dirpath, name) for name in sorted(filenames) if is_c_file(name))
+    return found
@@ -15,6 +15,37 @@ LITELLM_MODEL = "meta-llama-3-70b-instruct"  # Replace if using a different mode
 LITELLM_API_BASE = "https://your-api-proxy.com/v1"  # Replace with actual proxy URL
 LITELLM_API_KEY = "sk-your-api-key"  # Keep it secure — never commit this
 
+# === LLM Request Scheduling ===
+LLM_REQUESTS_PER_MINUTE = 60       # Per model; 0 disables the limit
+LLM_TOKENS_PER_MINUTE = 200000     # Prompt + completion tokens per model; 0 disables the limit
+LLM_MODEL_LIMITS = {}              # Per-model overrides, e.g. {"gpt-4o": {"requests_per_minute": 30, "max_concurrency": 4}}
+LLM_MAX_RETRIES = 5                # Retries on 429 / timeout / 5xx / connection errors
+LLM_BACKOFF_BASE = 1.0             # Seconds; doubles per attempt, with full jitter
+LLM_BACKOFF_MAX = 60.0
+LLM_MAX_CONCURRENCY = 8            # Starting (and highest) concurrent requests per model
+LLM_MIN_CONCURRENCY = 1
+LLM_TARGET_LATENCY = 30.0          # Seconds; slower responses shrink the concurrency limit
+
+# === LLM Response Cache ===
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_PATH = ".cache/llm_responses.sqlite"
+RESPONSE_CACHE_MAX_ENTRIES = 100000
+RESPONSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+RESPONSE_CACHE_MAX_AGE_DAYS = 30
+REVIEW_STORE_PATH = ".cache/chunk_reviews.sqlite"  # Per-function remarks for --incremental runs
+PARSE_CACHE_ENABLED = True
+PARSE_CACHE_PATH = ".cache/parse_results.sqlite"   # Function outlines, AST rule hits and tags by source hash
+
+# === Output ===
+RESULT_FSYNC_EVERY = 25    # fsync the JSONL result stream every N chunk results
+HTML_ROWS_PER_PAGE = 200   # Chunk rows per HTML report page
+
+# === Review Server ===
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_WORKERS = 2        # Review jobs run at once; LLM limits are shared through the scheduler
+SERVER_JOB_TTL = 600      # Seconds a finished job's results stay available to clients
+
 # === General Project Paths ===
 GUIDELINE_JSON_PATH = "guidelines/guidelines.json"
 REVIEW_OUTPUT_JSON = "output/review.json"
@@ -23,3 +54,62 @@ REVIEW_OUTPUT_HTML = "output/report.html"
 # === Prompting and Control ===
 MAX_GUIDELINE_MATCHES = 5  # Number of top guidelines to inject per code chunk
 CHUNK_LINE_LIMIT = 200     # Max lines per code chunk
+CHUNK_TOKEN_BUDGET = 1500  # Code tokens per review request; small functions are merged, large ones split (0 = off)
+MAX_IN_FLIGHT_REQUESTS = 8  # Concurrent LLM requests in the async review pipeline
+PARSE_WORKERS = None        # Processes used to parse/chunk files in directory mode (None = CPU count)
+REFERENCE_TRACE_MODE = "static"  # "static" (local include/extern/call extraction) or "llm"
+DIFF_REMARK_CONTEXT = 0    # Diff mode keeps remarks within this many lines of a changed line
+INCLUDE_DIRS = []          # Include roots searched after the including file's directory (like -I)
+MAX_PROMPT_DECLARATIONS = 15   # Header declarations a chunk uses that are added to its prompt
+MAX_DECLARATION_CHARS = 400    # Longer declarations (big structs) are cut
+
+# === Preprocessing (before pycparser; line numbers are preserved) ===
+PREPROCESS_TYPEDEFS = (    # Fake libc/RTOS/HAL type names, declared ahead of every parse
+    "int8_t", "int16_t", "int32_t", "int64_t", "uint8_t", "uint16_t", "uint32_t", "uint64_t",
+    "intptr_t", "uintptr_t", "size_t", "ssize_t", "ptrdiff_t", "bool", "va_list", "FILE", "time_t",
+    "BaseType_t", "UBaseType_t", "TickType_t", "TaskHandle_t", "SemaphoreHandle_t", "QueueHandle_t",
+    "TimerHandle_t", "EventGroupHandle_t", "HAL_StatusTypeDef",
+)
+PREPROCESS_TYPE_NAME_RE = r"[A-Za-z_]\w*(?:_t|_T|TypeDef)"  # Undeclared identifiers like these are taken as types
+PREPROCESS_MACROS = {      # Compiler keywords and common vendor macros rewritten to standard C ("" drops them)
+    "__inline": "inline", "__inline__": "inline", "__forceinline": "inline", "__INLINE": "inline",
+    "__STATIC_INLINE": "static inline", "__STATIC_FORCEINLINE": "static inline",
+    "__volatile__": "volatile", "__volatile": "volatile", "__IO": "volatile", "__I": "volatile const",
+    "__O": "volatile", "__const": "const", "__restrict": "restrict", "__restrict__": "restrict",
+    "__signed__": "signed", "__extension__": "", "__interrupt": "", "__irq": "", "__fiq": "",
+    "__weak": "", "__WEAK": "", "__packed": "", "__PACKED": "", "__noreturn": "", "__NO_RETURN": "",
+    "__ramfunc": "", "__no_init": "", "__root": "", "__far": "", "__near": "", "__reentrant": "",
+}
+PREPROCESS_STRIP_CALLS = ("__attribute__", "__attribute", "__declspec", "__ALIGNED", "_Pragma", "__pragma")
+PREPROCESS_ASM_KEYWORDS = ("asm", "__asm", "__asm__")  # Inline assembly statements are dropped
+PREPROCESS_UNDEFINED = ("__cplusplus",)  # #if/#ifdef on these take the other branch; otherwise the first
+PREPROCESS_MAX_TYPE_GUESSES = 20  # Retries that declare the identifier a parse error points at as a type
+
+# === Review Gating ===
+GATE_ENABLED = False               # Skipping chunks can lose remarks; turn on here or per run with --gate
+GATE_SCORE_THRESHOLD = 0.25        # Chunks whose best guideline match scores lower (and have no risky constructs) skip the LLM
+GATE_MAX_TRIVIAL_STATEMENTS = 2    # Call-free chunks with at most this many statements count as boilerplate
+GATE_AUDIT_RATE = 0.05             # Fraction of skippable chunks reviewed anyway to estimate the recall lost
+
+# === Near-Duplicate Chunks ===
+DEDUP_ENABLED = True
+DEDUP_MAX_DISTANCE = 0.2    # Chunks this close (1 - Jaccard of token shingles) to a reviewed chunk reuse its remarks
+DEDUP_SHINGLE_TOKENS = 5    # Normalized tokens per shingle
+DEDUP_NUM_PERM = 64         # MinHash signature length
+DEDUP_BANDS = 16            # LSH bands (DEDUP_NUM_PERM / DEDUP_BANDS values each) used to find candidates
+DEDUP_MIN_TOKENS = 12       # Smaller functions are always reviewed on their own
+
+# === Retrieval ===
+RETRIEVAL_MODE = "embedding"       # "embedding", "lexical" (BM25 over guideline terms and code feature tags, no torch) or "hybrid"
+HYBRID_EMBEDDING_WEIGHT = 0.5      # Share of the embedding score in "hybrid" mode
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_SCORE_SCALE = 5.0             # BM25 scores map to [0, 1) as s / (s + scale), comparable with GATE_SCORE_THRESHOLD
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_DIR = ".cache/embeddings"  # Content-addressed guideline embeddings (memory-mapped)
+GUIDELINE_INDEX_BACKEND = "exact"  # "exact", "faiss-flat", "faiss-ivf" or "faiss-hnsw" (needs faiss-cpu)
+GUIDELINE_INDEX_DIR = ".cache/guideline_index"  # Persisted vector indexes, one per guideline file and backend
+FAISS_IVF_NLIST = 256      # Upper bound on IVF lists; reduced automatically for small rule sets
+FAISS_IVF_NPROBE = 16      # IVF lists probed per query
+FAISS_IVF_RETRAIN_FACTOR = 4  # Retrain IVF once the rule count supports this many times the trained lists
+FAISS_HNSW_M = 32          # HNSW graph degree
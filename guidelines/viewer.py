@@ -1,72 +1,69 @@
-from flask import Flask, render_template, request, redirect, url_for
-import json
+from flask import Flask, render_template, request, redirect, url_for, abort
 import os
+import sys
 import logging
 logger = logging.getLogger(__name__)
 
+# Make the reviewer package importable when run as `python <dir>/viewer.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reviewer.guideline_store import GuidelineStore
+
 app = Flask(__name__)
 GUIDELINE_PATH = os.path.join(os.path.dirname(__file__), "guidelines.json")
+FORM_FIELDS = ("rule", "severity", "category", "description", "example")
+
+# Shared, lock-protected access to guidelines.json (safe with several editors)
+store = GuidelineStore(GUIDELINE_PATH)
 
 
-# Load guidelines from JSON
-def load_guidelines():
-    logger.info("Loading guidelines from %s", GUIDELINE_PATH)
-    with open(GUIDELINE_PATH, "r") as f:
-        return json.load(f)
+def form_entry():
+    return {field: request.form[field] for field in FORM_FIELDS}
 
 
-# Save updated list to JSON
-def save_guidelines(data):
-    logger.info("Saving %d guidelines to %s", len(data), GUIDELINE_PATH)
-    with open(GUIDELINE_PATH, "w") as f:
-        json.dump(data, f, indent=2)
+# Incrementally update the persisted guideline vector index from the latest file contents
+# (read under the index lock, so concurrent edits cannot leave an older list indexed last)
+def refresh_index():
+    try:
+        from reviewer.guideline_index import load_guideline_index
+        load_guideline_index(GUIDELINE_PATH)
+    except Exception:
+        # The edit itself is saved; the reviewer resyncs the index on its next run
+        logger.exception("Could not update guideline index for %s", GUIDELINE_PATH)
 
 
 @app.route("/")
 def index():
-    guidelines = load_guidelines()
+    guidelines = store.all()
     return render_template("index.html", guidelines=guidelines)
 
 
 @app.route("/add", methods=["POST"])
 def add():
-    guidelines = load_guidelines()
-    new_id = f"G{len(guidelines)+1:03d}"
-    new_entry = {
-        "id": new_id,
-        "rule": request.form["rule"],
-        "severity": request.form["severity"],
-        "category": request.form["category"],
-        "description": request.form["description"],
-        "example": request.form["example"]
-    }
-    guidelines.append(new_entry)
-    save_guidelines(guidelines)
+    new_entry = form_entry()
+    new_id = store.add(new_entry)
+    refresh_index()
     logger.info("Added new guideline %s - %s", new_id, new_entry["rule"])
     return redirect(url_for("index"))
 
 
 @app.route("/delete/<guideline_id>")
 def delete(guideline_id):
-    guidelines = load_guidelines()
-    guidelines = [g for g in guidelines if g["id"] != guideline_id]
-    save_guidelines(guidelines)
     logger.warning("Deleting guideline: %s", guideline_id)
+    if store.delete(guideline_id):
+        refresh_index()
     return redirect(url_for("index"))
 
 
 @app.route("/edit/<guideline_id>", methods=["GET", "POST"])
 def edit(guideline_id):
-    guidelines = load_guidelines()
-    entry = next((g for g in guidelines if g["id"] == guideline_id), None)
+    entry = store.get(guideline_id)
+    if entry is None:
+        abort(404)
 
     if request.method == "POST":
-        entry["rule"] = request.form["rule"]
-        entry["severity"] = request.form["severity"]
-        entry["category"] = request.form["category"]
-        entry["description"] = request.form["description"]
-        entry["example"] = request.form["example"]
-        save_guidelines(guidelines)
+        if store.update(guideline_id, form_entry()):
+            refresh_index()
         logger.info("Updating guideline: %s", guideline_id)
         return redirect(url_for("index"))
 
@@ -1,68 +1,270 @@
-import os
+import argparse
 import json
+import os
 import logging
 import sys
-from reviewer.rag_engine import load_guidelines, embed_guidelines, retrieve_top_matches
-from code_parser.chunker import extract_function_chunks
-from reviewer.llm_client import analyze_chunk
+from reviewer.rag_engine import load_guidelines, guideline_set_version
+from reviewer.hybrid_index import load_retrieval_index, RETRIEVAL_MODES
+from code_parser.chunker import chunk_files_parallel
+from code_parser.static_rules import static_guidelines
+from code_parser.utils import find_c_files
+from code_parser.diff_mapper import read_diff, git_diff, changed_lines_for_files
+from code_parser.include_graph import IncludeGraph
+from reviewer.pipeline import review_spans, collect_spans
+from reviewer.review_store import ChunkReviewStore, chunk_hash
+from reviewer.run_journal import RunJournal, unit_key
+from reviewer.response_cache import log_cache_stats
+from reviewer.scheduler import log_scheduler_stats
+from reviewer.gating import Gate
+from config import (MAX_IN_FLIGHT_REQUESTS, REFERENCE_TRACE_MODE, LITELLM_MODEL, PARSE_WORKERS, CHUNK_TOKEN_BUDGET,
+                    GATE_ENABLED, GATE_SCORE_THRESHOLD, GATE_AUDIT_RATE, RETRIEVAL_MODE, INCLUDE_DIRS,
+                    DEDUP_ENABLED, DEDUP_MAX_DISTANCE)
 from reviewer.html_generator import html_gen
+from reviewer.result_writer import JsonlResultWriter
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 GUIDELINE_FILE = "guidelines/guidelines.json"
-OUTPUT_FILE = "outputs/review.json"
+OUTPUT_FILE = "outputs/review.jsonl"
+JOURNAL_FILE = "outputs/review.journal.jsonl"
+INCLUDE_GRAPH_FILE = "outputs/include_graph.json"
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python main.py <path_to_code_file.c/.h>")
+def parse_args():
+    parser = argparse.ArgumentParser(description="🔍 RAG-based Embedded C Code Reviewer")
+    parser.add_argument("code_path", nargs="?", help="Path to input .c or .h file, or a directory to review recursively")
+    parser.add_argument(
+        "--html-only",
+        action="store_true",
+        help=f"Only regenerate the HTML report from {OUTPUT_FILE} and exit"
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=MAX_IN_FLIGHT_REQUESTS,
+        help="Maximum number of concurrent LLM requests"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=PARSE_WORKERS,
+        help="Worker processes for parsing and chunking in directory mode (default: CPU count)"
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=CHUNK_TOKEN_BUDGET,
+        help="Pack small functions together and split large ones to this many code tokens per request (0 disables)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only review functions that changed since the last run; reuse stored remarks for the rest"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"Continue an interrupted run: skip chunks already recorded in {JOURNAL_FILE}"
+    )
+    parser.add_argument(
+        "--include-dir", "-I",
+        action="append",
+        default=None,
+        help="Include root for resolving #include directives (repeatable; default: INCLUDE_DIRS in config)"
+    )
+    diff_group = parser.add_mutually_exclusive_group()
+    diff_group.add_argument(
+        "--diff",
+        metavar="PATCH",
+        help="Only review functions touched by this unified diff ('-' reads stdin); remarks are limited to changed lines"
+    )
+    diff_group.add_argument(
+        "--git-diff",
+        nargs="?",
+        const="",
+        metavar="REV",
+        help="Like --diff, using `git diff [REV]` of the repository holding code_path (no REV: unstaged changes)"
+    )
+    parser.add_argument(
+        "--retrieval",
+        choices=RETRIEVAL_MODES,
+        default=RETRIEVAL_MODE,
+        help="Guideline retrieval: sentence embeddings, lexical BM25 over code features (no torch), or a blend"
+    )
+    parser.add_argument(
+        "--gate",
+        action="store_true",
+        help="Skip the LLM for chunks unlikely to get remarks (see --gate-threshold); may lose some remarks"
+    )
+    parser.add_argument(
+        "--gate-threshold",
+        type=float,
+        default=GATE_SCORE_THRESHOLD,
+        help="Best guideline match score below which chunks without risky constructs skip the LLM"
+    )
+    parser.add_argument(
+        "--gate-audit",
+        type=float,
+        default=GATE_AUDIT_RATE,
+        help="Fraction of skippable chunks to review anyway, to estimate the gate's recall (0-1)"
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Review near-duplicate chunks separately instead of once per cluster"
+    )
+    parser.add_argument(
+        "--dedup-distance",
+        type=float,
+        default=DEDUP_MAX_DISTANCE,
+        help="Largest token-shingle distance (0-1) at which a chunk reuses the review of a near-duplicate"
+    )
+    args = parser.parse_args()
+    if not args.html_only and not args.code_path:
+        parser.print_usage()
         sys.exit(1)
+    return args
+
+
+def main():
+    args = parse_args()
+
+    if args.html_only:
+        html_gen(OUTPUT_FILE)
+        return
 
-    code_path = sys.argv[1]
-    if not os.path.isfile(code_path):
+    code_path = args.code_path
+    if os.path.isdir(code_path):
+        code_files = find_c_files(code_path)
+        if not code_files:
+            print(f"Error: No .c/.h files found under - {code_path}")
+            sys.exit(1)
+    elif os.path.isfile(code_path):
+        code_files = [code_path]
+    else:
         print(f"Error: File not found - {code_path}")
         sys.exit(1)
 
-    logging.info(f"🚀 Starting review for file: {code_path}")
+    # Diff mode: only files and functions the patch touches are reviewed
+    changed_lines = None
+    if args.diff or args.git_diff is not None:
+        diff_map = read_diff(args.diff) if args.diff else git_diff(code_path, args.git_diff or None)
+        changed_lines = changed_lines_for_files(diff_map, code_files)
+        code_files = [f for f in code_files if f in changed_lines]
+        logging.info("🩹 Diff mode: %d changed lines in %d file(s)",
+                     sum(len(lines) for lines in changed_lines.values()), len(code_files))
+        if not code_files:
+            print("✅ No changed C files in the diff, nothing to review")
+            return
 
-    # Step 1: Load and embed guidelines
+    logging.info(f"🚀 Starting review for {len(code_files)} file(s) under: {code_path}")
+
+    # Step 1: Load guidelines and build or sync their retrieval index
     logging.info("📘 Loading guidelines...")
-    guidelines, embeddings = embed_guidelines(load_guidelines(GUIDELINE_FILE))
+    guidelines = load_guidelines(GUIDELINE_FILE)
+    guideline_index = load_retrieval_index(GUIDELINE_FILE, guidelines, mode=args.retrieval)
+
+    # Step 2: Build the #include graph; every header is scanned once and its declarations shared
+    logging.info("🕸️ Building include graph...")
+    include_graph = IncludeGraph(args.include_dir if args.include_dir is not None else INCLUDE_DIRS)
+    for path in code_files:
+        include_graph.add_file(path)
+    fan_in = include_graph.fan_in(code_files)
+    # Widely included headers first: their remarks concern the most translation units
+    code_files.sort(key=lambda path: -fan_in.get(os.path.abspath(path), 0))
+    os.makedirs(os.path.dirname(INCLUDE_GRAPH_FILE), exist_ok=True)
+    with open(INCLUDE_GRAPH_FILE, "w") as f:
+        json.dump(include_graph.to_dict(code_files), f, indent=2)
+    graph_stats = include_graph.stats()
+    logging.info("🕸️ Include graph: %d files scanned once (%d reused), %d declarations, saved to %s",
+                 graph_stats["parsed"], graph_stats["reused"], graph_stats["declarations"], INCLUDE_GRAPH_FILE)
 
-    # Step 2: Chunk code
+    # Step 3: Chunk code (process pool for whole-tree runs)
     logging.info("🧩 Chunking input code...")
-    code_chunks = extract_function_chunks(code_path)
+    # Guidelines with a deterministic matcher are checked in the same pass and kept out of LLM prompts
+    static_rules = static_guidelines(guidelines)
+    chunked_files = chunk_files_parallel(code_files, max_workers=args.workers,
+                                         with_references=REFERENCE_TRACE_MODE == "static",
+                                         token_budget=args.token_budget, static_rules=static_rules,
+                                         changed_lines=changed_lines)
+    parsed = sum(1 for entry in chunked_files if entry.get("parsed"))
+    parse_ok = sum(1 for entry in chunked_files if entry.get("parse_ok"))
+    logging.info("🌳 Parsed %d of %d files (%d from the parse cache); parse success %d/%d (%.0f%%), "
+                 "failures fall back to line windows", parsed, len(chunked_files), len(chunked_files) - parsed,
+                 parse_ok, len(chunked_files), 100.0 * parse_ok / max(1, len(chunked_files)))
+    spans, related_files, static_results = collect_spans(chunked_files)
+    include_graph.annotate(spans, related_files)
+    if static_rules:
+        logging.info("📏 Static rules %s: %d remarks", ", ".join(g["id"] for g in static_rules),
+                     sum(len(r["remarks"]) for r in static_results))
 
-    if not code_chunks:
+    if not spans and changed_lines is None:
         logging.warning("⚠️ No chunks found. Possibly empty or unparseable file.")
         sys.exit(1)
 
-    # Step 3: Analyze each chunk
-    full_results = []
-    total_remarks = 0
-    total_refs = 0
+    # Step 4: Retrieve guidelines and review all chunks of all files in one shared pipeline,
+    # streaming each result to the JSONL output and the run journal as soon as it is ready
+    logging.info(f"📝 Streaming review results to {OUTPUT_FILE}")
+    guideline_version = f"{LITELLM_MODEL}:{args.retrieval}:{guideline_set_version(guidelines)}"
+    totals = {"remarks": 0, "refs": 0, "duplicates": 0}
+    store = ChunkReviewStore() if args.incremental else None
+    gate = Gate(args.gate_threshold, args.gate_audit) if GATE_ENABLED or args.gate else None
+    with JsonlResultWriter(OUTPUT_FILE) as writer, RunJournal(JOURNAL_FILE, resume=args.resume) as journal:
+        def emit(result):
+            totals["remarks"] += len(result.get("remarks", []))
+            totals["refs"] += len(result.get("related_files", {}).get("files", []))
+            totals["duplicates"] += "duplicate_of" in result
+            writer.write(result)
+
+        for result in static_results:
+            emit(result)
 
-    for idx, chunk in enumerate(code_chunks):
-        logging.info(f"\n🔍 Reviewing Chunk {idx+1}/{len(code_chunks)}...")
-        matched = retrieve_top_matches(chunk, guidelines, embeddings)
-        result = analyze_chunk(chunk, matched)
-        full_results.append(result)
-        total_remarks += len(result.get("remarks", []))
-        total_refs += len(result.get("related_files", {}).get("files", []))
+        # Units finished by an earlier, interrupted run are replayed from the journal
+        pending_spans, pending_related = [], []
+        for span, related in zip(spans, related_files):
+            span["chunk_hash"] = chunk_hash(span["code"], guideline_version)
+            # Diff-mode results only cover the changed lines, so they are journaled apart from full reviews
+            group = "retrieval" if "changed_lines" not in span else f"diff:{span['changed_lines']}"
+            span["unit"] = unit_key(span["file"], span["chunk_hash"], group, span["start_line"])
+            span["group"] = group
+            if span["unit"] in journal:
+                emit(journal.get(span["unit"]))
+            else:
+                pending_spans.append(span)
+                pending_related.append(related)
+        if args.resume:
+            logging.info("⏩ Resume: %d chunks already done, %d left", len(spans) - len(pending_spans), len(pending_spans))
 
-    # Step 4: Write output
-    logging.info(f"\n📝 Writing review to {OUTPUT_FILE}")
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(full_results, f, indent=2)
+        def on_result(i, result):
+            span = pending_spans[i]
+            if "error" not in result:
+                journal.record(span["unit"], span["file"], span["chunk_hash"], span["group"], result)
+            emit(result)
+
+        review_spans(pending_spans, guidelines, guideline_index, pending_related,
+                     max_in_flight=args.max_in_flight, store=store,
+                     guideline_version=guideline_version, on_result=on_result, gate=gate,
+                     dedup_distance=args.dedup_distance if DEDUP_ENABLED and not args.no_dedup else None,
+                     token_budget=args.token_budget)
+
+    log_cache_stats()
+    log_scheduler_stats()
+    if gate is not None:
+        gate.log_report()
 
     # Step 5: Summary
     print("\n✅ Review Complete")
-    print(f"📄 Chunks Reviewed: {len(code_chunks)}")
-    print(f"⚠️  Total Remarks Found: {total_remarks}")
-    print(f"📂 Referenced Files Detected: {total_refs}")
-    print(f"📁 Output JSON Saved To: {OUTPUT_FILE}")
+    print(f"🗂️  Files Reviewed: {len(code_files)}")
+    print(f"📄 Chunks Reviewed: {len(spans)}")
+    if gate is not None:
+        print(f"🚦 Chunks Skipped by Gate: {gate.report()['skipped']}")
+    if totals["duplicates"]:
+        print(f"🧬 Near-Duplicate Chunks Sharing a Review: {totals['duplicates']}")
+    print(f"⚠️  Total Remarks Found: {totals['remarks']}")
+    print(f"📂 Referenced Files Detected: {totals['refs']}")
+    print(f"📁 Output JSONL Saved To: {OUTPUT_FILE}")
     html_gen(OUTPUT_FILE)
-    
+
 
 if __name__ == "__main__":
     main()
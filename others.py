@@ -1,37 +1,31 @@
 import litellm
 import json
-import re
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from prompt_manager import buildPrompt
+from reviewer.json_stream import extract_json_array
+from reviewer.response_cache import cached_json_completion
 
 def runReview(prompt, model="ollama/llama3", max_tokens=2048):
     """
     Sends the prompt to the specified LLM using LiteLLM and returns JSON feedback.
     """
     try:
-        response = litellm.completion(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
+        output = cached_json_completion(
+            litellm.completion,
+            model,
+            [{"role": "user", "content": prompt}],
             temperature=0,
             max_tokens=max_tokens
         )
-        output = response['choices'][0]['message']['content']
 
-        # Extract first valid JSON array
-        json_match = re.search(r'\[\s*{.*?}\s*\]', output, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-            return json.loads(json_str)
-        else:
-            print("❌ Could not extract valid JSON array from LLM response.")
-            print("📝 Raw Output:\n", output)
-            return []
-
-    except json.JSONDecodeError:
-        print("❌ LLM response was not valid JSON.")
-        print("📝 Response:\n", output)
+        parsed = extract_json_array(output)
+        if parsed is not None:
+            return parsed
+        print("❌ Could not extract valid JSON array from LLM response.")
+        print("📝 Raw Output:\n", output)
         return []
+
     except Exception as e:
         print("❌ Error calling model:", str(e))
         return []
@@ -81,80 +75,3 @@ def saveReviewToFile(reviewData, outputPath="code_review.json"):
     with open(outputPath, 'w') as f:
         json.dump(reviewData, f, indent=4)
     print(f"✅ Review saved to: {outputPath}")
-
-
-def extract_json_array(text):
-    start = text.find("[")
-    if start == -1:
-        return None
-
-    array_str = ""
-    current_obj = ""
-    brace_count = 0
-    inside_array = False
-    valid_objects = []
-
-    for char in text[start:]:
-        array_str += char
-
-        if char == "{":
-            brace_count += 1
-            current_obj += char
-        elif char == "}":
-            brace_count -= 1
-            current_obj += char
-
-            if brace_count == 0:
-                # Complete JSON object
-                try:
-                    obj = json.loads(current_obj)
-                    valid_objects.append(obj)
-                except:
-                    pass  # Skip invalid object
-                current_obj = ""
-        elif brace_count > 0:
-            current_obj += char
-
-    return valid_objects if valid_objects else None
-
-##########################################################
-        def extract_json_array(text):
-            start = text.find("[")
-            if start == -1:
-                return []
-
-            array_str = ""
-            current_obj = ""
-            brace_count = 0
-            inside_array = False
-            valid_objects = []
-
-            for char in text[start:]:
-                array_str += char
-
-                if char == "{":
-                    brace_count += 1
-                    current_obj += char
-                elif char == "}":
-                    brace_count -= 1
-                    current_obj += char
-
-                    if brace_count == 0:
-                        # Try loading complete JSON object
-                        try:
-                            obj = json.loads(current_obj)
-                            valid_objects.append(obj)
-                        except:
-                            pass
-                        current_obj = ""
-                elif brace_count > 0:
-                    current_obj += char
-
-            return valid_objects  # returns [] if no objects parsed
-
-        parsed = extract_json_array(output)
-        return parsed if isinstance(parsed, list) else []
-
-    except Exception as e:
-        print("❌ Error during LLM review:", str(e))
-        return []
\ No newline at end of file
@@ -0,0 +1,143 @@
+# client.py
+
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+# Make config importable when run as `python reviewer/client.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import SERVER_HOST, SERVER_PORT
+from code_parser.diff_mapper import git_diff, changed_lines_for_files
+
+# Only the standard library (and stdlib-only helpers) is imported here: the client must start in milliseconds,
+# all heavy lifting (model, index, LLM calls) happens in reviewer/server.py.
+C_EXTENSIONS = (".c", ".h")
+
+
+def _request(base_url: str, method: str, path: str, body: dict = None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(req)
+
+
+def collect_files(paths, stdin_name: str = None):
+    """
+    Review inputs with their contents, so the server sees exactly what the
+    client has (including unsaved buffers piped in on stdin).
+    """
+    files = []
+    if stdin_name:
+        files.append({"path": stdin_name, "content": sys.stdin.read()})
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend({"path": os.path.join(root, n)} for n in sorted(names) if n.endswith(C_EXTENSIONS))
+        else:
+            files.append({"path": path})
+    for f in files:
+        if "content" not in f:
+            with open(f["path"], "r", encoding="utf-8") as src:
+                f["content"] = src.read()
+    return files
+
+
+def print_event(event: dict):
+    kind = event["event"]
+    if kind == "result":
+        result = event["result"]
+        if "error" in result:
+            print(f"{result.get('file')}:{result['start_line']}: error: {result['error']}", file=sys.stderr)
+        for remark in result.get("remarks", []):
+            print(f"{result.get('file')}:{remark.get('line')}: [{remark.get('guideline_id')}] {remark.get('issue')}")
+    elif kind == "file_error":
+        print(f"{event['file']}: {event['message']}", file=sys.stderr)
+    elif kind == "done":
+        print(f"✅ {event['chunks']} chunks, {event['remarks']} remarks, {event['skipped']} skipped "
+              f"in {event['seconds']:.2f}s", file=sys.stderr)
+    elif kind in ("cancelled", "error"):
+        print(f"🛑 {kind}: {event.get('reason') or event.get('message')}", file=sys.stderr)
+
+
+def review(base_url: str, files, options: dict, raw: bool) -> int:
+    """
+    Submits a job and prints its events as they stream in. Ctrl-C cancels the job.
+    Returns the number of remarks.
+    """
+    job_id, remarks = None, 0
+    try:
+        with _request(base_url, "POST", "/jobs", {"files": files, "options": options, "stream": True}) as resp:
+            for line in resp:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                job_id = event["job"]
+                if event["event"] == "result":
+                    remarks += len(event["result"].get("remarks", []))
+                if raw:
+                    print(json.dumps(event), flush=True)
+                else:
+                    print_event(event)
+    except KeyboardInterrupt:
+        if job_id is not None:
+            _request(base_url, "DELETE", f"/jobs/{job_id}").close()
+            print(f"🛑 Cancelled {job_id}", file=sys.stderr)
+        raise SystemExit(130)
+    return remarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="🔍 Submit files to a running review server")
+    parser.add_argument("paths", nargs="*", help="C files or directories to review")
+    parser.add_argument("--server", default=f"http://{SERVER_HOST}:{SERVER_PORT}")
+    parser.add_argument("--stdin", metavar="NAME", help="Also review source read from stdin, reported as NAME")
+    parser.add_argument("--git-diff", nargs="?", const="", metavar="REV",
+                        help="Only review functions changed in `git diff [REV]` (no REV: unstaged changes)")
+    parser.add_argument("--json", action="store_true", help="Print raw NDJSON events")
+    parser.add_argument("--gate", action="store_true", help="Let the server skip chunks unlikely to get remarks")
+    parser.add_argument("--full", action="store_true", help="Do not reuse stored remarks for unchanged functions")
+    parser.add_argument("--no-dedup", action="store_true", help="Review near-duplicate functions separately")
+    parser.add_argument("--fail-on-remarks", action="store_true", help="Exit with status 1 if any remark is found")
+    parser.add_argument("--cancel", metavar="JOB", help="Cancel a job and exit")
+    parser.add_argument("--status", action="store_true", help="Print server status and exit")
+    args = parser.parse_args()
+
+    base_url = args.server.rstrip("/")
+    try:
+        if args.status or args.cancel:
+            path = f"/jobs/{args.cancel}" if args.cancel else "/health"
+            with _request(base_url, "DELETE" if args.cancel else "GET", path) as resp:
+                print(json.dumps(json.load(resp), indent=2))
+            return
+        if not args.paths and not args.stdin:
+            parser.print_usage()
+            sys.exit(2)
+        options = {"incremental": not args.full, "dedup": not args.no_dedup}
+        if args.gate:
+            options["gate"] = True
+        files = collect_files(args.paths, args.stdin)
+        if args.git_diff is not None:
+            changed = changed_lines_for_files(git_diff(args.paths[0] if args.paths else ".", args.git_diff or None),
+                                              [f["path"] for f in files])
+            files = [dict(f, changed_lines=sorted(changed[f["path"]])) for f in files if f["path"] in changed]
+            if not files:
+                print("✅ No changed C files in the diff, nothing to review", file=sys.stderr)
+                return
+        remarks = review(base_url, files, options, args.json)
+    except urllib.error.HTTPError as e:
+        print(f"Error: server answered {e.code}: {e.read().decode('utf-8', 'replace')}", file=sys.stderr)
+        sys.exit(2)
+    except urllib.error.URLError as e:
+        print(f"Error: review server not reachable at {base_url} ({e.reason}); start it with "
+              f"`python reviewer/server.py`", file=sys.stderr)
+        sys.exit(2)
+    if args.fail_on_remarks and remarks:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
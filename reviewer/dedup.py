@@ -0,0 +1,143 @@
+# dedup.py
+
+import difflib
+import hashlib
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from code_parser.lexer import iter_tokens
+from config import DEDUP_SHINGLE_TOKENS, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_MIN_TOKENS
+
+logger = logging.getLogger(__name__)
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+DIGITS_RE = re.compile(r"\d+")
+
+# a, b < 2**32 and 32-bit shingle hashes keep a * x + b inside uint64
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 32, size=DEDUP_NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 32, size=DEDUP_NUM_PERM, dtype=np.uint64)
+
+
+def normalized_tokens(code: str) -> List[str]:
+    """
+    Tokens with literals abstracted and digits inside identifiers dropped, so
+    USART1_IRQHandler and USART2_IRQHandler look alike. Type names (*_t) keep
+    their digits: uint8_t and uint32_t are a real difference.
+    """
+    tokens = []
+    for kind, text, _, _ in iter_tokens(code):
+        if kind == "number":
+            tokens.append("0")
+        elif kind in ("string", "char"):
+            tokens.append(kind)
+        elif kind == "ident" and not text.endswith("_t"):
+            tokens.append(DIGITS_RE.sub("0", text))
+        else:
+            tokens.append(text)
+    return tokens
+
+
+def minhash(tokens: List[str]) -> np.ndarray:
+    """
+    MinHash signature (DEDUP_NUM_PERM values) of the token shingles.
+    """
+    n = DEDUP_SHINGLE_TOKENS
+    shingles = {" ".join(tokens[i:i + n]) for i in range(max(1, len(tokens) - n + 1))}
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                       for s in shingles], dtype=np.uint64)
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+
+def cluster_spans(spans: List[Dict], max_distance: float) -> Dict[int, List[int]]:
+    """
+    Groups near-duplicate spans. Returns {representative: [members]} (indices
+    into spans) for clusters with at least one member; every other span stands
+    alone. A span joins the closest earlier representative whose estimated
+    distance (1 - Jaccard similarity of token shingles) is at most
+    max_distance, so members are always close to the chunk actually reviewed,
+    never only to another member. Candidates come from LSH buckets, not from
+    comparing every pair.
+
+    Meant for single functions (review_spans clusters before packing): a
+    packed group of functions almost never has a near-duplicate. Diff-mode
+    spans (with "changed_lines"), tiny spans and spans whose files had
+    different static rules applied are never grouped.
+    """
+    rows = DEDUP_NUM_PERM // DEDUP_BANDS
+    buckets = defaultdict(list)  # (static rules, band, band values) -> representative indices
+    signatures = {}
+    clusters = {}
+    for i, span in enumerate(spans):
+        if span.get("changed_lines"):
+            continue
+        tokens = normalized_tokens(span["code"])
+        if len(tokens) < DEDUP_MIN_TOKENS:
+            continue
+        signature = minhash(tokens)
+        rules = tuple(sorted(span.get("static_rules", ())))
+        keys = [(rules, b, signature[b * rows:(b + 1) * rows].tobytes()) for b in range(DEDUP_BANDS)]
+
+        best, best_distance = None, None
+        for rep in sorted({r for key in keys for r in buckets.get(key, ())}):
+            distance = 1.0 - float(np.mean(signatures[rep] == signature))
+            if distance <= max_distance and (best is None or distance < best_distance):
+                best, best_distance = rep, distance
+        if best is not None:
+            clusters[best].append(i)
+            continue
+        signatures[i] = signature
+        clusters[i] = []
+        for key in keys:
+            buckets[key].append(i)
+
+    clusters = {rep: members for rep, members in clusters.items() if members}
+    if clusters:
+        logger.info("🧬 %d near-duplicate chunks share the review of %d representatives",
+                    sum(len(m) for m in clusters.values()), len(clusters))
+    return clusters
+
+
+def _line_map(source: str, target: str) -> List[int]:
+    """
+    For each line of source, the 0-based line of target it corresponds to.
+    Lines inside a changed block map proportionally into the block that replaced it.
+    """
+    a = [" ".join(normalized_tokens(line)) for line in source.splitlines()]
+    b = [" ".join(normalized_tokens(line)) for line in target.splitlines()]
+    mapping = [0] * len(a)
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        for k in range(i1, i2):
+            if tag == "equal":
+                mapping[k] = j1 + k - i1
+            elif j2 > j1:
+                mapping[k] = j1 + (k - i1) * (j2 - j1) // (i2 - i1)
+            else:
+                mapping[k] = max(0, j1 - 1)
+    return mapping
+
+
+def map_remarks(remarks: List[Dict], source: Dict, target: Dict) -> List[Dict]:
+    """
+    A representative's remarks moved onto the matching lines of a near-duplicate span.
+    """
+    mapping = _line_map(source["code"], target["code"])
+    last = target["end_line"] - target["start_line"]
+    moved = []
+    for remark in remarks:
+        remark = dict(remark)
+        try:
+            offset = int(remark["line"]) - source["start_line"]
+        except (KeyError, TypeError, ValueError):
+            moved.append(remark)
+            continue
+        if 0 <= offset < len(mapping):
+            offset = mapping[offset]
+        remark["line"] = target["start_line"] + min(max(offset, 0), last)
+        moved.append(remark)
+    return moved
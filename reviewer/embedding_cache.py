@@ -0,0 +1,180 @@
+# embedding_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, List
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"  # Used by caches written before the index named its vectors file
+LOCK_FILE = "index.lock"
+
+_thread_lock = threading.RLock()
+
+
+def text_key(text: str) -> str:
+    """
+    Content hash used as the cache key for one embedded text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store for one model.
+
+    Vectors live in a single .npy file that is opened memory-mapped, and a small
+    JSON index maps each text hash to its row. Unchanged texts are served from
+    the mapped file; only unseen texts are handed to the encoder.
+
+    Callers embedding a full rule set name themselves as its owner; the index
+    remembers each owner's keys and every save drops rows no owner still
+    needs, so edited or deleted rules do not pile up. Saves run under a lock
+    file and write a new vectors file that the index names, so the index and
+    the vectors it describes are always replaced together.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        self.model_name = model_name
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.dir = os.path.join(cache_dir, slug)
+        self.index_path = os.path.join(self.dir, INDEX_FILE)
+        self.lock_path = os.path.join(self.dir, LOCK_FILE)
+        self.vectors_path = None
+        self.rows = {}
+        self.owners = {}
+        self.vectors = None
+        self._load()
+
+    def _load(self):
+        self.rows, self.owners, self.vectors, self.vectors_path = {}, {}, None, None
+        if not os.path.isfile(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model") != self.model_name:
+                logger.warning("Embedding cache at %s belongs to %s, ignoring", self.dir, meta.get("model"))
+                return
+            vectors_path = os.path.join(self.dir, meta.get("vectors", VECTORS_FILE))
+            vectors = np.load(vectors_path, mmap_mode="r")
+            keys = meta.get("keys", [])
+            if len(keys) != vectors.shape[0]:
+                logger.warning("Embedding cache index and vectors disagree, ignoring cache")
+                return
+            self.rows = {k: i for i, k in enumerate(keys)}
+            self.owners = meta.get("owners", {})
+            self.vectors = vectors
+            self.vectors_path = vectors_path
+            logger.info("Embedding cache loaded: %d vectors from %s", len(keys), self.dir)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read embedding cache (%s), starting empty", e)
+            self.rows, self.owners, self.vectors, self.vectors_path = {}, {}, None, None
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.dir, exist_ok=True)
+        with _thread_lock:
+            with open(self.lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self, keys: List[str], vectors: np.ndarray):
+        fd, tmp_vectors = tempfile.mkstemp(prefix="vectors-", suffix=".npy", dir=self.dir)
+        os.close(fd)
+        fd, tmp_index = tempfile.mkstemp(prefix=".tmp-", dir=self.dir)
+        os.close(fd)
+        try:
+            out = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=vectors.shape)
+            out[:] = vectors
+            out.flush()
+            del out
+            with open(tmp_index, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": int(vectors.shape[1]), "keys": keys,
+                           "vectors": os.path.basename(tmp_vectors), "owners": self.owners}, f)
+            # The index names its vectors file, so replacing the index switches both at once
+            os.replace(tmp_index, self.index_path)
+        except BaseException:
+            for tmp in (tmp_vectors, tmp_index):
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+            raise
+        # Readers that already mapped the old file keep it until they close it
+        if self.vectors_path and os.path.exists(self.vectors_path):
+            os.unlink(self.vectors_path)
+        self.vectors_path = tmp_vectors
+
+    def get_or_compute(self, texts: List[str], encode: Callable[[List[str]], np.ndarray],
+                       owner: str = None) -> np.ndarray:
+        """
+        Returns one float32 row per text, encoding only the texts not already cached.
+        With an owner, texts are that owner's complete set: the owner's previous
+        keys that are not among them are released and pruned on the next save.
+        """
+        keys = [text_key(t) for t in texts]
+        released = owner is not None and self.owners.get(owner) != sorted(set(keys))
+        if released or any(k not in self.rows for k in keys):
+            with self._locked():
+                # Another process may have saved since this cache was loaded
+                self._load()
+                self._update(texts, keys, encode, owner)
+        else:
+            logger.info("All %d embeddings served from cache", len(texts))
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.asarray(self.vectors[[self.rows[k] for k in keys]])
+
+    def _update(self, texts: List[str], keys: List[str], encode: Callable[[List[str]], np.ndarray], owner: str):
+        missing = {}
+        for k, t in zip(keys, texts):
+            if k not in self.rows and k not in missing:
+                missing[k] = t
+        released = owner is not None and self.owners.get(owner) != sorted(set(keys))
+        if not missing and not released:
+            return
+        if owner is not None:
+            self.owners[owner] = sorted(set(keys))
+        fresh = None
+        if missing:
+            logger.info("Embedding %d new or changed texts (%d cached)", len(missing), len(texts) - len(missing))
+            fresh = np.asarray(encode(list(missing.values())), dtype=np.float32)
+
+        # Keep what some owner still uses, plus the texts of this call
+        live = set(keys).union(*self.owners.values())
+        kept = [k for k in self.rows if k in live]
+        parts = [np.asarray(self.vectors[[self.rows[k] for k in kept]])] if kept else []
+        if fresh is not None:
+            parts.append(fresh)
+        if not parts:
+            return
+        all_keys = kept + list(missing.keys())
+        merged = np.concatenate(parts)
+        if len(kept) < len(self.rows):
+            logger.info("Embedding cache: pruned %d vectors no longer used", len(self.rows) - len(kept))
+        self.rows = {k: i for i, k in enumerate(all_keys)}
+        try:
+            self._save(all_keys, merged)
+            self.vectors = np.load(self.vectors_path, mmap_mode="r")
+        except OSError as e:
+            logger.warning("Could not write embedding cache (%s), keeping vectors in memory", e)
+            self.vectors = merged
@@ -0,0 +1,156 @@
+# gating.py
+
+import hashlib
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from code_parser.lexer import iter_tokens
+from config import GATE_SCORE_THRESHOLD, GATE_MAX_TRIVIAL_STATEMENTS, GATE_AUDIT_RATE
+
+logger = logging.getLogger(__name__)
+
+LOOP_KEYWORDS = {"for", "while", "do", "goto"}
+TYPE_WORDS = {"char", "short", "int", "long", "float", "double", "signed", "unsigned", "void",
+              "const", "volatile", "struct", "union", "enum", "_Bool"}
+
+
+def _is_pointer_op(tokens, i: int) -> bool:
+    # Unary * or & (dereference, address-of) or a * in a declaration such as "T *p"
+    prev = tokens[i - 1][1] if i else ""
+    if prev in ("", "(", ",", "=", "return", "{", "}", ";") or tokens[i][1] == "*" and prev in TYPE_WORDS:
+        return True
+    before = tokens[i - 2][1] if i > 1 else ""
+    nxt_kind = tokens[i + 1][0] if i + 1 < len(tokens) else ""
+    return tokens[i][1] == "*" and tokens[i - 1][0] == "ident" and nxt_kind == "ident" and before in ("", "(", ",", "{", "}", ";")
+
+
+def chunk_features(code: str) -> Dict:
+    """
+    Cheap lexical features of a chunk: statement count and the constructs most
+    guidelines are about (macros, pointers, loops, casts, inline assembly).
+    """
+    features = {"statements": 0, "macros": 0, "pointers": 0, "loops": 0, "casts": 0, "asm": 0, "calls": 0}
+    tokens = [(kind, text) for kind, text, _, _ in iter_tokens(code)]
+    depth = 0
+    for i, (kind, text) in enumerate(tokens):
+        nxt = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+        if text in ("{", "}"):
+            depth += 1 if text == "{" else -1
+        elif text == ";":
+            features["statements"] += 1
+        elif text in ("#", "##"):
+            features["macros"] += 1
+        elif text in ("*", "&") and _is_pointer_op(tokens, i):
+            features["pointers"] += 1
+        elif text in LOOP_KEYWORDS:
+            features["loops"] += 1
+        elif text in ("asm", "__asm__", "__asm"):
+            features["asm"] += 1
+        elif kind == "ident" and nxt == "(" and depth > 0:
+            if text.isupper():
+                features["macros"] += 1  # function-like macro by convention
+            else:
+                features["calls"] += 1
+        elif text == "(" and (nxt in TYPE_WORDS or nxt.endswith("_t")):
+            # "(type ...)" followed by an operand is a cast
+            parens, j = 1, i + 1
+            while j < len(tokens) and parens:
+                parens += {"(": 1, ")": -1}.get(tokens[j][1], 0)
+                j += 1
+            if j < len(tokens) and (tokens[j][0] in ("ident", "number", "string", "char") or tokens[j][1] in ("(", "*", "&")):
+                features["casts"] += 1
+    return features
+
+
+class Gate:
+    """
+    Decides per chunk whether an LLM review is worth its cost.
+
+    Chunks with any of the risky constructs (macros, pointers, loops, casts,
+    assembly) are always reviewed. Others are skipped when their best
+    guideline match scores below the threshold, or below twice the threshold
+    if they are trivial boilerplate (a few statements and no calls). With an
+    audit rate, that fraction of skipped
+    chunks (chosen deterministically by content) is reviewed anyway, and the
+    share of audited chunks that did get remarks estimates the recall lost.
+    """
+
+    def __init__(self, threshold: float = GATE_SCORE_THRESHOLD, audit_rate: float = GATE_AUDIT_RATE,
+                 max_trivial_statements: int = GATE_MAX_TRIVIAL_STATEMENTS):
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.max_trivial_statements = max_trivial_statements
+        self.checked = 0
+        self.skipped = Counter()
+        self.audited = 0
+        self.audit_hits = 0
+        self._lock = threading.Lock()
+
+    def reason_to_skip(self, code: str, matches: List[dict]) -> Optional[str]:
+        """
+        Why the chunk can be skipped, or None if it needs a review.
+        """
+        features = chunk_features(code)
+        risky = [name for name in ("macros", "pointers", "loops", "casts", "asm") if features[name]]
+        if risky:
+            return None
+        top_score = max((m.get("match_score", 0.0) for m in matches), default=0.0)
+        if top_score < self.threshold:
+            return "low relevance"
+        trivial = features["statements"] <= self.max_trivial_statements and not features["calls"]
+        if trivial and top_score < 2 * self.threshold:
+            return "trivial"
+        return None
+
+    def _audit(self, code: str) -> bool:
+        if self.audit_rate <= 0:
+            return False
+        digest = hashlib.sha256(code.encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 2 ** 32 < self.audit_rate
+
+    def decide(self, code: str, matches: List[dict]) -> Dict:
+        """
+        {"review": bool, "reason": str or None, "audit": bool} for one chunk.
+        """
+        reason = self.reason_to_skip(code, matches)
+        with self._lock:
+            self.checked += 1
+            if reason is None:
+                return {"review": True, "reason": None, "audit": False}
+            if self._audit(code):
+                self.audited += 1
+                return {"review": True, "reason": reason, "audit": True}
+            self.skipped[reason] += 1
+        return {"review": False, "reason": reason, "audit": False}
+
+    def record_audit(self, result: Dict):
+        """
+        Notes the outcome of reviewing a chunk the gate would have skipped.
+        """
+        if result.get("remarks") and "error" not in result:
+            with self._lock:
+                self.audit_hits += 1
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "skipped": sum(self.skipped.values()),
+                "by_reason": dict(self.skipped),
+                "audited": self.audited,
+                "audit_hits": self.audit_hits,
+                "estimated_miss_rate": self.audit_hits / self.audited if self.audited else None,
+            }
+
+    def log_report(self):
+        report = self.report()
+        if not report["checked"]:
+            return
+        reasons = ", ".join(f"{n} {reason}" for reason, n in sorted(report["by_reason"].items())) or "none"
+        logger.info("🚦 Gate: skipped %d of %d chunks (%s), threshold %.2f",
+                    report["skipped"], report["checked"], reasons, self.threshold)
+        if report["audited"]:
+            logger.info("🚦 Gate audit: %d skippable chunks reviewed, %d had remarks (estimated miss rate %.0f%%)",
+                        report["audited"], report["audit_hits"], report["estimated_miss_rate"] * 100)
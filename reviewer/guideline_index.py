@@ -0,0 +1,203 @@
+# guideline_index.py
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+import numpy as np
+
+from config import (GUIDELINE_INDEX_BACKEND, GUIDELINE_INDEX_DIR, EMBEDDING_MODEL_NAME, FAISS_IVF_NLIST,
+                    FAISS_IVF_NPROBE, FAISS_HNSW_M)
+from reviewer.embedding_cache import text_key
+from reviewer.rag_engine import load_guidelines, guideline_text, embed_texts
+from reviewer.vector_index import create_index, load_index
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_thread_lock = threading.RLock()
+
+
+def _index_paths(guideline_path: str, backend: str):
+    # In the cache dir, not next to the guidelines, where *.json files are read as rule chunks
+    path = os.path.abspath(guideline_path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(GUIDELINE_INDEX_DIR, f"{name}-{hashlib.sha256(path.encode('utf-8')).hexdigest()[:12]}")
+    return f"{base}.{backend}.index.json", f"{base}.{backend}.index"
+
+
+@contextmanager
+def _locked(manifest_path: str):
+    """
+    Exclusive lock on one guideline index, held from loading it to saving it,
+    so concurrent updates (e.g. two viewer edits) apply one after the other.
+    """
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with _thread_lock:
+        with open(manifest_path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _temp_path(path: str) -> str:
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    os.close(fd)
+    return tmp
+
+
+def _faiss_options(backend: str) -> dict:
+    if backend == "exact":
+        return {}
+    return {"nlist": FAISS_IVF_NLIST, "nprobe": FAISS_IVF_NPROBE, "hnsw_m": FAISS_HNSW_M}
+
+
+class GuidelineIndex:
+    """
+    Persistent vector index over a guideline file.
+
+    Each guideline gets a stable integer row id recorded in a manifest (in
+    GUIDELINE_INDEX_DIR), together with the hash of its embedded text. Syncing
+    against a new guideline list only removes and re-adds rows whose text
+    changed, so the index is built once and then updated incrementally.
+    """
+
+    def __init__(self, guideline_path: str, backend: str = GUIDELINE_INDEX_BACKEND):
+        self.guideline_path = guideline_path
+        self.backend = backend
+        self.manifest_path, self.index_path = _index_paths(guideline_path, backend)
+        self.entries = {}   # guideline id -> {"row": int, "key": str}
+        self.next_row = 0
+        self.index = None
+        self.positions = {}  # row id -> position in the current guideline list
+        self._load()
+
+    def _load(self):
+        if not (os.path.isfile(self.manifest_path) and os.path.isfile(self.index_path)):
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("backend") != self.backend or manifest.get("model") != EMBEDDING_MODEL_NAME:
+                logger.info("Guideline index was built with a different backend or model, rebuilding")
+                return
+            self.index = load_index(self.backend, self.index_path, manifest["dim"], **_faiss_options(self.backend))
+            self.entries = manifest["entries"]
+            self.next_row = manifest["next_row"]
+            logger.info("Loaded %s guideline index with %d rows", self.backend, len(self.entries))
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            logger.warning("Could not load guideline index (%s), rebuilding", e)
+            self.index = None
+            self.entries = {}
+            self.next_row = 0
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_index = _temp_path(self.index_path)
+        tmp_manifest = _temp_path(self.manifest_path)
+        try:
+            self.index.save(tmp_index)
+            with open(tmp_manifest, "w", encoding="utf-8") as f:
+                json.dump({
+                    "backend": self.backend,
+                    "model": EMBEDDING_MODEL_NAME,
+                    "dim": self.index.dim,
+                    "next_row": self.next_row,
+                    "entries": self.entries,
+                }, f, indent=2)
+            os.replace(tmp_index, self.index_path)
+            os.replace(tmp_manifest, self.manifest_path)
+        finally:
+            for tmp in (tmp_index, tmp_manifest):
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+
+    def sync(self, guidelines: List[dict]) -> "GuidelineIndex":
+        """
+        Brings the index in line with the given guideline list, embedding only added or edited rules.
+        """
+        current = {g["id"]: text_key(guideline_text(g)) for g in guidelines}
+        stale = [gid for gid, entry in self.entries.items() if current.get(gid) != entry["key"]]
+        fresh = [g for g in guidelines if g["id"] not in self.entries or g["id"] in stale]
+
+        if stale and self.index is not None:
+            if self.index.supports_remove:
+                self.index.remove(np.array([self.entries[gid]["row"] for gid in stale]))
+                for gid in stale:
+                    del self.entries[gid]
+            else:
+                logger.info("%s cannot remove rows, rebuilding from cached embeddings", self.backend)
+                self.index = None
+                self.entries = {}
+                fresh = list(guidelines)
+
+        if stale or fresh:
+            # The whole set is passed (cached rows cost nothing) so the cache can drop rules no longer used
+            all_vectors = embed_texts([guideline_text(g) for g in guidelines],
+                                      owner=os.path.abspath(self.guideline_path))
+        if fresh:
+            positions = {id(g): pos for pos, g in enumerate(guidelines)}
+            vectors = all_vectors[[positions[id(g)] for g in fresh]]
+            if self.index is None:
+                self.index = create_index(self.backend, vectors.shape[1], **_faiss_options(self.backend))
+                self.backend = self.index.backend
+                self.manifest_path, self.index_path = _index_paths(self.guideline_path, self.backend)
+            rows = np.arange(self.next_row, self.next_row + len(fresh))
+            self.index.add(rows, vectors)
+            for g, row in zip(fresh, rows):
+                self.entries[g["id"]] = {"row": int(row), "key": current[g["id"]]}
+            self.next_row += len(fresh)
+
+            if self.index.needs_retrain():
+                # Lists trained on the first, smaller rule set; train again on all rules
+                logger.info("Retraining %s guideline index for %d rules", self.backend, len(guidelines))
+                self.index = create_index(self.backend, all_vectors.shape[1], **_faiss_options(self.backend))
+                self.index.add(np.array([self.entries[g["id"]]["row"] for g in guidelines]), all_vectors)
+
+        if stale or fresh:
+            logger.info("Guideline index updated: %d removed/changed, %d embedded", len(stale), len(fresh))
+            try:
+                self._save()
+            except OSError as e:
+                logger.warning("Could not persist guideline index (%s)", e)
+
+        self.positions = {self.entries[g["id"]]["row"]: pos for pos, g in enumerate(guidelines)}
+        return self
+
+    def search(self, queries: np.ndarray, top_k: int):
+        """
+        Returns (scores, positions) where positions index into the synced guideline list.
+        """
+        if self.index is None:
+            return (np.full((len(queries), top_k), -np.inf, dtype=np.float32),
+                    np.full((len(queries), top_k), -1, dtype=np.int64))
+        scores, rows = self.index.search(queries, top_k)
+        positions = np.vectorize(lambda r: self.positions.get(int(r), -1), otypes=[np.int64])(rows)
+        return scores, positions
+
+
+def load_guideline_index(guideline_path: str, guidelines: Optional[List[dict]] = None,
+                         backend: str = GUIDELINE_INDEX_BACKEND) -> GuidelineIndex:
+    """
+    Loads the persisted index for a guideline file and syncs it with the given
+    guidelines (default: the file's contents, read under the lock). Runs under
+    the index's lock, so the saved index and manifest always come from the
+    same update.
+    """
+    with _locked(_index_paths(guideline_path, backend)[0]):
+        if guidelines is None:
+            guidelines = load_guidelines(guideline_path)
+        return GuidelineIndex(guideline_path, backend).sync(guidelines)
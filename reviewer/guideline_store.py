@@ -0,0 +1,186 @@
+# guideline_store.py
+
+import copy
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ID_RE = re.compile(r"^G(\d+)$")
+
+
+class GuidelineStore:
+    """
+    Shared access to a guideline JSON file for several editors at once.
+
+    Guidelines are cached in memory with an id index and reloaded only when
+    the file's mtime or size changes. Every change is a read-modify-write
+    done under an exclusive lock file against the latest file contents, then
+    written to a temporary file and atomically renamed over the original,
+    so concurrent edits are serialized instead of overwriting each other.
+
+    The next id number is kept in a sidecar file (<file>.next_id) and only
+    ever grows, so the id of a deleted rule is never reused for a new one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.next_id_path = path + ".next_id"
+        self._thread_lock = threading.RLock()
+        self._stamp = None
+        self._items: List[Dict] = []
+        self._by_id: Dict[str, Dict] = {}
+        self.next_id = 1
+
+    # --- disk state ---
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp and self._stamp is not None:
+            return
+        items = []
+        if stamp is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            logger.info("Loaded %d guidelines from %s", len(items), self.path)
+        self._items = items
+        self._by_id = {g["id"]: g for g in items}
+        self._stamp = stamp
+        self._load_next_id()
+
+    def _load_next_id(self):
+        try:
+            with open(self.next_id_path, "r", encoding="utf-8") as f:
+                self.next_id = int(f.read().strip())
+        except (OSError, ValueError):
+            self.next_id = 1
+        # Ids of rules added by hand outside the store are taken too
+        self.next_id = max(self.next_id, self._max_number(self._items) + 1)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            with open(self.lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _atomic_write(self, path: str, data):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+                f.write("\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(path):
+                os.chmod(tmp, os.stat(path).st_mode & 0o777)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def _modify(self, change: Callable[[List[Dict]], Optional[List[str]]]):
+        """
+        Applies change(items) to the latest contents under the lock and writes
+        the result. change returns the ids it touched (None means nothing changed).
+        """
+        with self._locked():
+            self._refresh()
+            self._load_next_id()
+            items = copy.deepcopy(self._items)
+            touched = change(items)
+            if touched is None:
+                return None
+            self._atomic_write(self.path, items)
+            self.next_id = max(self.next_id, self._max_number(items) + 1)
+            self._atomic_write(self.next_id_path, self.next_id)
+            self._items = items
+            self._by_id = {g["id"]: g for g in items}
+            self._stamp = self._file_stamp()
+            return touched
+
+    # --- reads ---
+
+    def all(self) -> List[Dict]:
+        with self._thread_lock:
+            self._refresh()
+            return copy.deepcopy(self._items)
+
+    def get(self, guideline_id: str) -> Optional[Dict]:
+        with self._thread_lock:
+            self._refresh()
+            entry = self._by_id.get(guideline_id)
+            return copy.deepcopy(entry) if entry is not None else None
+
+    # --- writes ---
+
+    @staticmethod
+    def _max_number(items: List[Dict]) -> int:
+        return max((int(m.group(1)) for m in (ID_RE.match(g["id"]) for g in items) if m), default=0)
+
+    def _next_id(self, items: List[Dict]) -> str:
+        return f"G{max(self.next_id, self._max_number(items) + 1):03d}"
+
+    def add(self, fields: Dict) -> str:
+        """
+        Appends a guideline with a new id (one above the highest ever handed
+        out, so a deleted rule's id is not reused) and returns the id.
+        """
+        new_id = []
+
+        def change(items):
+            entry = {"id": self._next_id(items), **fields}
+            items.append(entry)
+            new_id.append(entry["id"])
+            return [entry["id"]]
+
+        self._modify(change)
+        return new_id[0]
+
+    def update(self, guideline_id: str, fields: Dict) -> bool:
+        def change(items):
+            for entry in items:
+                if entry["id"] == guideline_id:
+                    if all(entry.get(k) == v for k, v in fields.items()):
+                        return None
+                    entry.update(fields)
+                    return [guideline_id]
+            return None
+
+        return self._modify(change) is not None
+
+    def delete(self, guideline_id: str) -> bool:
+        def change(items):
+            kept = [g for g in items if g["id"] != guideline_id]
+            if len(kept) == len(items):
+                return None
+            items[:] = kept
+            return [guideline_id]
+
+        return self._modify(change) is not None
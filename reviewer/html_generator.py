@@ -1,15 +1,147 @@
+import html
 import json
 from json2html import *
 import os
+import shutil
+import tempfile
+from config import HTML_ROWS_PER_PAGE
 
 OUTPUT_HTML = "outputs/review.html"
 CSS_PATH = "static/styles.css"
 
+
+def _css_tag():
+    if os.path.exists(CSS_PATH):
+        with open(CSS_PATH, "r") as css_file:
+            return f"<style>\n{css_file.read()}\n</style>"
+    return ""
+
+
+def _page_header(title, css_tag):
+    return f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{html.escape(title)}</title>
+    {css_tag}
+</head>
+<body>
+"""
+
+
+PAGE_FOOTER = """
+</body>
+</html>
+"""
+
+
+def _render_row(record):
+    lines = f"{record.get('start_line', '?')}–{record.get('end_line', '?')}"
+    function = html.escape(str(record.get("function") or ""))
+    remarks = record.get("remarks", [])
+    remarks_html = json2html.convert(json=remarks, table_attributes="class=\"table table-bordered\"") if remarks else "—"
+    files = record.get("related_files", {}).get("files", [])
+    files_html = json2html.convert(json=files, table_attributes="class=\"table table-bordered\"") if files else "—"
+    if "error" in record:
+        status = "error: " + html.escape(str(record["error"]))
+    elif record.get("static"):
+        status = "static rules"
+    elif record.get("skipped"):
+        status = "skipped: " + html.escape(str(record["skipped"]))
+    else:
+        status = "reused" if record.get("reused") else "reviewed"
+    return f"<tr><td>{lines}</td><td>{function}</td><td>{remarks_html}</td><td>{files_html}</td><td>{status}</td></tr>\n"
+
+
+def html_gen_stream(path, output_html=OUTPUT_HTML, rows_per_page=HTML_ROWS_PER_PAGE):
+    """
+    Renders a JSONL result stream without loading it into memory: one index page
+    plus per-file pages of at most rows_per_page rows, written row by row.
+    Pages are written to a fresh directory that replaces the old one when
+    done, so pages from earlier runs never linger.
+    """
+    if not os.path.isfile(path):
+        print(f"❌ Error: {path} not found")
+        return
+
+    # Pass 1: remember where each file's records are, not the records themselves
+    by_file = {}
+    with open(path, "rb") as f:
+        offset = f.tell()
+        for raw in iter(f.readline, b""):
+            try:
+                record = json.loads(raw)
+                entry = by_file.setdefault(record.get("file") or "(unknown)", {"rows": [], "remarks": 0, "errors": 0})
+                entry["rows"].append((record.get("start_line") or 0, offset))
+                entry["remarks"] += len(record.get("remarks", []))
+                entry["errors"] += "error" in record
+            except json.JSONDecodeError:
+                pass
+            offset = f.tell()
+
+    css_tag = _css_tag()
+    pages_dir = os.path.splitext(output_html)[0] + "_pages"
+    out_dir = os.path.dirname(os.path.abspath(output_html))
+    os.makedirs(out_dir, exist_ok=True)
+    new_pages = tempfile.mkdtemp(prefix=os.path.basename(pages_dir) + ".tmp-", dir=out_dir)
+    fd, new_index = tempfile.mkstemp(prefix=".tmp-", suffix=".html", dir=out_dir)
+    os.close(fd)
+
+    # Pass 2: per-file pages, seeking to each record in line order
+    try:
+        with open(path, "rb") as src, open(new_index, "w", encoding="utf-8") as index:
+            index.write(_page_header("AI Review Report", css_tag))
+            index.write("<h1>🔍 Code Review Summary</h1>\n<table class=\"table table-bordered\">\n"
+                        "<tr><th>File</th><th>Chunks</th><th>Remarks</th><th>Errors</th><th>Pages</th></tr>\n")
+            for file_no, (file_name, entry) in enumerate(sorted(by_file.items())):
+                rows = sorted(entry["rows"])
+                page_links = []
+                for page_no, first in enumerate(range(0, len(rows), rows_per_page), start=1):
+                    page_name = f"{file_no + 1:05d}_{page_no}.html"
+                    page_links.append(f"<a href=\"{os.path.basename(pages_dir)}/{page_name}\">{page_no}</a>")
+                    with open(os.path.join(new_pages, page_name), "w", encoding="utf-8") as page:
+                        page.write(_page_header(f"Review: {file_name}", css_tag))
+                        page.write(f"<h1>{html.escape(file_name)}</h1>\n<p>Page {page_no} of "
+                                   f"{(len(rows) + rows_per_page - 1) // rows_per_page}</p>\n")
+                        page.write("<table class=\"table table-bordered\">\n<tr><th>Lines</th><th>Function</th>"
+                                   "<th>Remarks</th><th>Related files</th><th>Status</th></tr>\n")
+                        for _, row_offset in rows[first:first + rows_per_page]:
+                            src.seek(row_offset)
+                            page.write(_render_row(json.loads(src.readline())))
+                        page.write("</table>\n" + PAGE_FOOTER)
+                index.write(f"<tr><td>{html.escape(file_name)}</td><td>{len(rows)}</td><td>{entry['remarks']}</td>"
+                            f"<td>{entry['errors']}</td><td>{' '.join(page_links)}</td></tr>\n")
+            index.write("</table>\n" + PAGE_FOOTER)
+    except BaseException:
+        shutil.rmtree(new_pages, ignore_errors=True)
+        os.unlink(new_index)
+        raise
+
+    # Swap the new pages in, then the index that links to them
+    old_pages = None
+    if os.path.exists(pages_dir):
+        old_pages = tempfile.mkdtemp(prefix=os.path.basename(pages_dir) + ".old-", dir=out_dir)
+        os.replace(pages_dir, os.path.join(old_pages, "pages"))
+    os.replace(new_pages, pages_dir)
+    os.chmod(pages_dir, 0o755)
+    os.replace(new_index, output_html)
+    os.chmod(output_html, 0o644)
+    if old_pages is not None:
+        shutil.rmtree(old_pages, ignore_errors=True)
+
+    print(f"✅ HTML review generated at {output_html}")
+
+
 def html_gen(path):
     if not os.path.isfile(path):
         print(f"❌ Error: {path} not found")
         return
 
+    if path.endswith(".jsonl"):
+        html_gen_stream(path)
+        return
+
     # Read JSON
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
@@ -18,11 +150,7 @@ def html_gen(path):
     html_body = json2html.convert(json=data, table_attributes="class=\"table table-bordered\"")
 
     # Read CSS
-    css_tag = ""
-    if os.path.exists(CSS_PATH):
-        with open(CSS_PATH, "r") as css_file:
-            css_content = css_file.read()
-            css_tag = f"<style>\n{css_content}\n</style>"
+    css_tag = _css_tag()
 
     # Final HTML structure
     final_html = f"""
@@ -0,0 +1,166 @@
+# hybrid_index.py
+
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import List, Optional
+
+import numpy as np
+
+from config import (RETRIEVAL_MODE, HYBRID_EMBEDDING_WEIGHT, BM25_K1, BM25_B, BM25_SCORE_SCALE,
+                    GUIDELINE_INDEX_BACKEND)
+from code_parser.features import code_tags, identifier_terms
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("embedding", "lexical", "hybrid")
+
+WORD_RE = re.compile(r"[a-z][a-z0-9]+")
+STOPWORDS = {
+    "the", "and", "for", "are", "can", "use", "used", "using", "with", "into", "that", "this", "its", "it's",
+    "lead", "leads", "avoid", "should", "must", "may", "not", "all", "only", "than", "more", "make", "makes",
+    "their", "them", "when", "where", "before", "after", "inside", "instead", "other", "such", "like",
+}
+
+# Phrases in guideline text that point at a code feature tag (see code_parser.features)
+KEYWORD_TAGS = [
+    (r"##|token.pasting", "pp_paste"),
+    (r"macro|preprocessor|#define", "macro"),
+    (r"\binclude", "include"),
+    (r"\bgoto\b", "goto"),
+    (r"dynamic memory|malloc|allocation", "dyn_alloc"),
+    (r"recurs", "recursion"),
+    (r"volatile", "volatile"),
+    (r"\bcast", "cast"),
+    (r"void pointer", "void_ptr"),
+    (r"function pointer", "func_ptr"),
+    (r"pointer", "pointer"),
+    (r"\bbit", "bitop"),
+    (r"polling|busy.wait", "loop"),
+    (r"busy.wait", "busy_wait"),
+    (r"delay|timer", "delay"),
+    (r"printf|blocking", "print"),
+    (r"\bisrs?\b|interrupt", "isr"),
+    (r"disable .*interrupts|critical section", "irq_control"),
+    (r"hardware|driver", "hw_access"),
+    (r"state machine|switch", "switch"),
+    (r"nest", "deep_nesting"),
+    (r"magic number|hardcod", "magic_number"),
+    (r"rtos|task|semaphore|mutex|queue", "rtos"),
+    (r"global variable", "global"),
+    (r"function size|loc\b|long function", "long_function"),
+    (r"\bconst\b|\bstatic\b", "const_static"),
+    (r"initiali[sz]e", "uninit"),
+    (r"return value", "return_ignored"),
+]
+KEYWORD_TAG_RES = [(re.compile(pattern), tag) for pattern, tag in KEYWORD_TAGS]
+# Tags stated by the guideline text count this many times more than a single word
+TAG_BOOST = 3
+
+
+def _words(text: str) -> List[str]:
+    return [w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def guideline_terms(guideline: dict) -> List[str]:
+    """
+    Index terms of a guideline: words of its rule, description and example,
+    feature tags named by its text (or its explicit "tags"), and the tags of
+    its example code.
+    """
+    text = f"{guideline['rule']}. {guideline['description']}"
+    terms = _words(text) + _words(guideline.get("example", ""))
+    stated = set(guideline.get("tags") or [tag for regex, tag in KEYWORD_TAG_RES if regex.search(text.lower())])
+    for tag in stated:
+        terms.extend([f"tag:{tag}"] * TAG_BOOST)
+    terms.extend(f"tag:{tag}" for tag in code_tags(guideline.get("example", "")) - stated)
+    return terms
+
+
+def chunk_terms(code_chunk: str) -> List[str]:
+    """
+    Query terms of a code chunk: distinct identifier sub-words plus its feature tags.
+    """
+    return sorted(set(identifier_terms(code_chunk))) + [f"tag:{tag}" for tag in sorted(code_tags(code_chunk))]
+
+
+class HybridIndex:
+    """
+    BM25 inverted index over guideline terms, queried with code chunks
+    directly - no model is needed, so lexical retrieval runs without torch.
+
+    With an embedding index, the final score is a weighted blend of the
+    embedding cosine and the BM25 score squashed to [0, 1) as s / (s + scale).
+    """
+
+    def __init__(self, guidelines: List[dict], embedding_index=None, embedding_weight: float = HYBRID_EMBEDDING_WEIGHT,
+                 k1: float = BM25_K1, b: float = BM25_B, scale: float = BM25_SCORE_SCALE):
+        self.size = len(guidelines)
+        self.embedding_index = embedding_index
+        self.embedding_weight = embedding_weight if embedding_index is not None else 0.0
+        self.scale = scale
+
+        docs = [guideline_terms(g) for g in guidelines]
+        lengths = np.array([len(d) for d in docs], dtype=np.float32)
+        avg_length = float(lengths.mean()) if self.size else 0.0
+        self.postings = defaultdict(list)  # term -> [(position, weight)]
+        df = Counter(term for doc in docs for term in set(doc))
+        for pos, doc in enumerate(docs):
+            norm = k1 * (1 - b + b * lengths[pos] / avg_length) if avg_length else k1
+            for term, tf in Counter(doc).items():
+                idf = math.log(1 + (self.size - df[term] + 0.5) / (df[term] + 0.5))
+                self.postings[term].append((pos, idf * tf * (k1 + 1) / (tf + norm)))
+        logger.info("Built lexical guideline index: %d guidelines, %d terms", self.size, len(self.postings))
+
+    def lexical_scores(self, code_chunks: List[str]) -> np.ndarray:
+        scores = np.zeros((len(code_chunks), self.size), dtype=np.float32)
+        for row, chunk in enumerate(code_chunks):
+            for term in chunk_terms(chunk):
+                for pos, weight in self.postings.get(term, ()):
+                    scores[row, pos] += weight
+        return scores / (scores + self.scale)
+
+    def _embedding_scores(self, code_chunks: List[str]) -> np.ndarray:
+        from reviewer.rag_engine import get_model
+        queries = get_model().encode(code_chunks, convert_to_numpy=True)
+        scores, positions = self.embedding_index.search(np.asarray(queries, dtype=np.float32), self.size)
+        dense = np.zeros((len(code_chunks), self.size), dtype=np.float32)
+        for row in range(len(code_chunks)):
+            valid = positions[row] >= 0
+            dense[row, positions[row][valid]] = scores[row][valid]
+        return dense
+
+    def search_text(self, code_chunks: List[str], top_k: int):
+        """
+        Returns (scores, positions) of the top_k guidelines for each chunk.
+        """
+        scores = self.lexical_scores(code_chunks)
+        if self.embedding_weight:
+            scores = (1 - self.embedding_weight) * scores + self.embedding_weight * self._embedding_scores(code_chunks)
+        k = min(top_k, self.size)
+        out_scores = np.full((len(code_chunks), top_k), -np.inf, dtype=np.float32)
+        out_positions = np.full((len(code_chunks), top_k), -1, dtype=np.int64)
+        if k:
+            order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+            out_positions[:, :k] = order
+            out_scores[:, :k] = np.take_along_axis(scores, order, axis=1)
+        return out_scores, out_positions
+
+
+def load_retrieval_index(guideline_path: str, guidelines: Optional[List[dict]] = None, mode: str = RETRIEVAL_MODE,
+                         backend: str = GUIDELINE_INDEX_BACKEND):
+    """
+    The guideline index for a retrieval mode: "embedding" (vector index only),
+    "lexical" (BM25 over terms and feature tags, no model) or "hybrid" (both, blended).
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {', '.join(RETRIEVAL_MODES)}")
+    from reviewer.guideline_index import load_guideline_index
+    from reviewer.rag_engine import load_guidelines
+    if guidelines is None:
+        guidelines = load_guidelines(guideline_path)
+    if mode == "embedding":
+        return load_guideline_index(guideline_path, guidelines, backend)
+    embedding_index = load_guideline_index(guideline_path, guidelines, backend) if mode == "hybrid" else None
+    return HybridIndex(guidelines, embedding_index)
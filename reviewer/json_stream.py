@@ -0,0 +1,195 @@
+# json_stream.py
+
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Characters that can change the scanner state; everything else is skipped in bulk
+_SPECIAL = re.compile(r'["\\\[\]{}]')
+_OPENERS = "[{"
+_CLOSERS = {"[": "]", "{": "}"}
+
+
+class JsonStreamParser:
+    """
+    Incremental parser for JSON embedded in LLM output.
+
+    Text is fed as it arrives (one streamed delta at a time). Prose before the
+    first [ or { is ignored. The objects of the first array - the root array,
+    or the first array value of a root object such as {"remarks": [...]} - are
+    returned from feed() as soon as each one closes, and `done` turns true when
+    the root closes so the caller can stop generation. Anything after the root
+    is ignored.
+
+    Scanning is linear: each character is looked at once, and item and root
+    text is joined from the received pieces only when it is needed.
+    """
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self._pieces: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._root_start = None      # (piece index, offset)
+        self._root_end = None
+        self._container_depth = None  # stack depth inside the item array
+        self._item_start = None
+        self._safe = None            # (piece index, offset, closers) where truncation is recoverable
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Consumes the next piece of output and returns the items completed by it.
+        """
+        if self.done or not text:
+            return []
+        index = len(self._pieces)
+        self._pieces.append(text)
+        completed = []
+        skip = -1
+        if self._escape:
+            self._escape = False
+            skip = 0
+
+        for match in _SPECIAL.finditer(text):
+            pos = match.start()
+            if pos == skip:
+                continue
+            char = match.group(0)
+
+            if self._root_start is None:
+                # Before the root only an opening bracket matters
+                if char in _OPENERS:
+                    self._root_start = (index, pos)
+                    self._stack.append(char)
+                    if char == "[":
+                        self._open_container(index, pos)
+                continue
+
+            if self._in_string:
+                if char == "\\":
+                    if pos + 1 < len(text):
+                        skip = pos + 1
+                    else:
+                        self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in _OPENERS:
+                depth = len(self._stack)
+                self._stack.append(char)
+                if char == "{" and depth == self._container_depth:
+                    self._item_start = (index, pos)
+                elif char == "[" and self._container_depth is None and depth == 1:
+                    self._open_container(index, pos)
+            elif char in "]}":
+                if not self._stack or _CLOSERS[self._stack[-1]] != char:
+                    continue  # unbalanced bracket in junk; leave the structure alone
+                self._stack.pop()
+                depth = len(self._stack)
+                if self._item_start is not None and depth == self._container_depth:
+                    item = self._complete_item(index, pos)
+                    if item is not None:
+                        completed.append(item)
+                if not self._stack:
+                    self._root_end = (index, pos + 1)
+                    self.done = True
+                    break
+
+        self.items.extend(completed)
+        return completed
+
+    def _open_container(self, index: int, pos: int):
+        self._container_depth = len(self._stack)
+        self._mark_safe(index, pos + 1)
+
+    def _mark_safe(self, index: int, pos: int):
+        closers = "".join(_CLOSERS[c] for c in reversed(self._stack))
+        self._safe = (index, pos, closers)
+
+    def _complete_item(self, index: int, pos: int):
+        text = self._slice(self._item_start, (index, pos + 1))
+        self._item_start = None
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            logger.debug("Skipping malformed item in LLM output: %.80s", text)
+            return None
+        self._mark_safe(index, pos + 1)
+        return item
+
+    def _slice(self, start, end) -> str:
+        (si, so), (ei, eo) = start, end
+        if si == ei:
+            return self._pieces[si][so:eo]
+        return self._pieces[si][so:] + "".join(self._pieces[si + 1:ei]) + self._pieces[ei][:eo]
+
+    def raw(self) -> str:
+        """
+        Everything fed so far, for error reporting.
+        """
+        return "".join(self._pieces)
+
+    def text(self) -> Optional[str]:
+        """
+        The root JSON text: complete if the root closed, otherwise repaired by
+        cutting after the last complete item and closing the open brackets.
+        """
+        if self._root_start is None:
+            return None
+        if self._root_end is not None:
+            return self._slice(self._root_start, self._root_end)
+        if self._safe is None:
+            return None
+        index, pos, closers = self._safe
+        return self._slice(self._root_start, (index, pos)) + closers
+
+    def result(self) -> Optional[Any]:
+        """
+        The parsed root value, recovering what it can from truncated or malformed output.
+        """
+        text = self.text()
+        if text is not None:
+            try:
+                return json.loads(text)
+            except json.JSONDecodeError:
+                pass
+            if self._root_end is not None and self._safe is not None:
+                # The root closed but something after the last good item is broken
+                index, pos, closers = self._safe
+                try:
+                    return json.loads(self._slice(self._root_start, (index, pos)) + closers)
+                except json.JSONDecodeError:
+                    pass
+        if self._container_depth is not None:
+            return self.items if self._container_depth == 1 else None
+        return None
+
+
+def parse_json_response(text: str) -> Optional[Any]:
+    """
+    Parses a complete LLM response, tolerating surrounding prose, code fences,
+    trailing junk and truncation. Returns None if no JSON value is recoverable.
+    """
+    parser = JsonStreamParser()
+    parser.feed(text or "")
+    return parser.result()
+
+
+def extract_json_array(text: str) -> Optional[List[Dict]]:
+    """
+    The first JSON array in an LLM response, or the objects recovered from it.
+    """
+    parser = JsonStreamParser()
+    parser.feed(text or "")
+    result = parser.result()
+    if isinstance(result, list):
+        return result
+    return parser.items or None
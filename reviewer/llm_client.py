@@ -1,51 +1,78 @@
-import json
+import asyncio
 import logging
 from typing import Dict
-import litellm
-from prompt_builder import build_prompt, build_reference_trace_prompt
+from reviewer.prompt_builder import build_prompt, build_reference_trace_prompt
 
 # Load from config
-from config import MODEL_NAME, LITELLM_API_BASE, LITELLM_API_KEY
+from config import LITELLM_MODEL as MODEL_NAME, LITELLM_API_BASE, LITELLM_API_KEY, REFERENCE_TRACE_MODE
+from code_parser.references import REFERENCE_LIST_NAME, extract_references
+from reviewer.response_cache import cached_json_completion, acached_json_completion
+from reviewer.json_stream import parse_json_response
 
 logger = logging.getLogger(__name__)
 
-# LiteLLM settings
-litellm.api_base = LITELLM_API_BASE
-litellm.api_key = LITELLM_API_KEY
+_litellm = None
+
+
+def get_litellm():
+    """
+    Imports and configures litellm on first use; the import alone costs seconds.
+    """
+    global _litellm
+    if _litellm is None:
+        import litellm
+        # LiteLLM settings
+        litellm.api_base = LITELLM_API_BASE
+        litellm.api_key = LITELLM_API_KEY
+        _litellm = litellm
+    return _litellm
 
 
 def _safe_parse_json(response_text: str) -> Dict:
     """
-    Parses LLM response text to JSON safely.
+    Parses LLM response text to JSON safely, recovering from prose, truncation and trailing junk.
     """
-    try:
-        return json.loads(response_text)
-    except json.JSONDecodeError as e:
-        logger.error("❌ JSON parsing failed: %s", e)
+    parsed = parse_json_response(response_text)
+    if parsed is None:
+        logger.error("❌ JSON parsing failed: no JSON found in LLM response")
         logger.debug("Raw LLM response:\n%s", response_text)
         return {}
+    return parsed
 
 
-def review_code_chunk(code_chunk: str, matched_guidelines: list) -> Dict:
+def review_code_chunk(code_chunk: str, matched_guidelines: list, start_line: int = 1, changed_lines=None,
+                      declarations=None) -> Dict:
     """
     Sends code + guideline match prompt to the LLM and returns the structured remarks JSON.
+    changed_lines (diff mode) are highlighted in the prompt; declarations from
+    the include graph are shown before the code.
     """
-    prompt = build_prompt(code_chunk, matched_guidelines)
+    prompt = build_prompt(code_chunk, matched_guidelines, start_line, changed_lines, declarations)
     logger.info("Sending review prompt to LLM (length=%d chars)", len(prompt))
 
     try:
-        response = litellm.completion(model=MODEL_NAME, messages=[
+        content = cached_json_completion(get_litellm().completion, MODEL_NAME, [
             {"role": "user", "content": prompt}
-        ])
-        content = response.choices[0].message.content
+        ], temperature=0)
         parsed = _safe_parse_json(content)
-        return parsed if isinstance(parsed, dict) else {"remarks": []}
+        if not isinstance(parsed, dict) or "remarks" not in parsed:
+            return {"remarks": [], "error": "LLM response had no 'remarks' field"}
+        return parsed
     except Exception as e:
         logger.exception("❌ LLM review request failed")
-        return {"remarks": []}
+        return {"remarks": [], "error": str(e)}
 
 
-def trace_code_references(code_chunk: str) -> Dict:
+def trace_code_references(code_chunk: str, start_line: int = 1, local_names=(), depth: int = 0) -> Dict:
+    """
+    Finds includes, extern declarations and external calls in the chunk without an LLM call.
+    depth is the brace depth the chunk starts at (1 inside a function body).
+    """
+    files = extract_references(code_chunk, start_line, local_names, depth)
+    return {"name": REFERENCE_LIST_NAME, "files": files}
+
+
+def trace_code_references_llm(code_chunk: str) -> Dict:
     """
     Sends file-reference prompt to the LLM and returns the structured JSON of file links.
     """
@@ -53,26 +80,110 @@ def trace_code_references(code_chunk: str) -> Dict:
     logger.info("Sending file reference prompt to LLM (length=%d chars)", len(prompt))
 
     try:
-        response = litellm.completion(model=MODEL_NAME, messages=[
+        content = cached_json_completion(get_litellm().completion, MODEL_NAME, [
             {"role": "user", "content": prompt}
-        ])
-        content = response.choices[0].message.content
+        ], temperature=0)
         parsed = _safe_parse_json(content)
         return parsed if isinstance(parsed, dict) else {"files": []}
     except Exception as e:
         logger.exception("❌ LLM file reference request failed")
-        return {"files": []}
+        return {"files": [], "error": str(e)}
 
 
-def analyze_chunk(code_chunk: str, matched_guidelines: list) -> Dict:
+def analyze_chunk(code_chunk: str, matched_guidelines: list, related_files: Dict = None, start_line: int = 1,
+                  changed_lines=None, declarations=None) -> Dict:
     """
-    High-level function that combines both LLM prompts into a single result JSON.
+    High-level function that combines the review and the reference trace into a single result JSON.
+    related_files may be precomputed for the whole file (see code_parser.references).
     """
     logger.info("Analyzing one code chunk...")
+    if related_files is None:
+        if REFERENCE_TRACE_MODE == "llm":
+            related_files = trace_code_references_llm(code_chunk)
+        else:
+            related_files = trace_code_references(code_chunk, start_line)
+    review = review_code_chunk(code_chunk, matched_guidelines, start_line, changed_lines, declarations)
+    result = {
+        "remarks": review.get("remarks", []),
+        "related_files": related_files
+    }
+    error = review.get("error") or related_files.get("error")
+    if error:
+        result["error"] = error
+    logger.info("Analysis complete: %d remarks, %d related files",
+                len(result["remarks"]), len(result["related_files"].get("files", [])))
+    return result
+
+
+async def review_code_chunk_async(code_chunk: str, matched_guidelines: list, start_line: int = 1,
+                                  changed_lines=None, declarations=None) -> Dict:
+    """
+    Async variant of review_code_chunk built on litellm.acompletion.
+    """
+    prompt = build_prompt(code_chunk, matched_guidelines, start_line, changed_lines, declarations)
+    logger.info("Sending review prompt to LLM (length=%d chars)", len(prompt))
+
+    try:
+        content = await acached_json_completion(get_litellm().acompletion, MODEL_NAME, [
+            {"role": "user", "content": prompt}
+        ], temperature=0)
+        parsed = _safe_parse_json(content)
+        if not isinstance(parsed, dict) or "remarks" not in parsed:
+            return {"remarks": [], "error": "LLM response had no 'remarks' field"}
+        return parsed
+    except Exception as e:
+        logger.exception("❌ LLM review request failed")
+        return {"remarks": [], "error": str(e)}
+
+
+async def trace_code_references_llm_async(code_chunk: str) -> Dict:
+    """
+    Async variant of trace_code_references_llm built on litellm.acompletion.
+    """
+    prompt = build_reference_trace_prompt(code_chunk)
+    logger.info("Sending file reference prompt to LLM (length=%d chars)", len(prompt))
+
+    try:
+        content = await acached_json_completion(get_litellm().acompletion, MODEL_NAME, [
+            {"role": "user", "content": prompt}
+        ], temperature=0)
+        parsed = _safe_parse_json(content)
+        return parsed if isinstance(parsed, dict) else {"files": []}
+    except Exception as e:
+        logger.exception("❌ LLM file reference request failed")
+        return {"files": [], "error": str(e)}
+
+
+async def analyze_chunk_async(code_chunk: str, matched_guidelines: list, limiter: asyncio.Semaphore = None,
+                              related_files: Dict = None, start_line: int = 1, changed_lines=None,
+                              declarations=None) -> Dict:
+    """
+    Async variant of analyze_chunk. In "llm" trace mode the two prompts run concurrently.
+    If a limiter is given, each LLM request holds one of its slots while in flight.
+    """
+    limiter = limiter or asyncio.Semaphore(2)
+
+    async def limited(coro_fn, *args):
+        async with limiter:
+            return await coro_fn(*args)
+
+    if related_files is None and REFERENCE_TRACE_MODE == "llm":
+        review, related_files = await asyncio.gather(
+            limited(review_code_chunk_async, code_chunk, matched_guidelines, start_line, changed_lines, declarations),
+            limited(trace_code_references_llm_async, code_chunk),
+        )
+    else:
+        if related_files is None:
+            related_files = trace_code_references(code_chunk, start_line)
+        review = await limited(review_code_chunk_async, code_chunk, matched_guidelines, start_line, changed_lines,
+                               declarations)
     result = {
-        "remarks": review_code_chunk(code_chunk, matched_guidelines).get("remarks", []),
-        "related_files": trace_code_references(code_chunk)
+        "remarks": review.get("remarks", []),
+        "related_files": related_files
     }
+    error = review.get("error") or related_files.get("error")
+    if error:
+        result["error"] = error
     logger.info("Analysis complete: %d remarks, %d related files",
                 len(result["remarks"]), len(result["related_files"].get("files", [])))
     return result
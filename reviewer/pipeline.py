@@ -0,0 +1,287 @@
+# pipeline.py
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+from config import MAX_IN_FLIGHT_REQUESTS
+from code_parser.references import REFERENCE_LIST_NAME, span_start_depth
+from reviewer.llm_client import analyze_chunk_async, trace_code_references
+from reviewer.rag_engine import retrieve_top_matches_batch
+from reviewer.review_store import ChunkReviewStore
+from reviewer.gating import Gate
+from reviewer.dedup import cluster_spans, map_remarks
+from code_parser.diff_mapper import filter_remarks
+from code_parser.packer import pack_groups, merge_group
+
+logger = logging.getLogger(__name__)
+
+STOP_POLL_SECONDS = 0.1  # How often a cancellable review checks should_stop
+
+
+async def analyze_chunks_async(code_chunks: List[str], all_matches: List[List[dict]],
+                               max_in_flight: int = MAX_IN_FLIGHT_REQUESTS,
+                               related_files: List[Dict] = None, start_lines: List[int] = None,
+                               on_result: Callable[[int, Dict], None] = None,
+                               should_stop: Callable[[], bool] = None,
+                               changed_lines: List[List[int]] = None,
+                               declarations: List[List[Dict]] = None) -> List[Dict]:
+    """
+    Reviews all chunks concurrently with at most max_in_flight LLM requests open at once.
+    Results are returned in the original chunk order. With on_result, each result is
+    handed over as soon as it finishes instead (and not kept).
+
+    should_stop is polled while reviews run; once it returns True, queued and
+    in-flight requests are cancelled and unfinished chunks come back as None.
+    """
+    related_files = related_files or [None] * len(code_chunks)
+    start_lines = start_lines or [1] * len(code_chunks)
+    changed_lines = changed_lines or [None] * len(code_chunks)
+    declarations = declarations or [None] * len(code_chunks)
+    limiter = asyncio.Semaphore(max(1, max_in_flight))
+    done = 0
+
+    async def run(idx: int, chunk: str, matched: list) -> Dict:
+        nonlocal done
+        result = await analyze_chunk_async(chunk, matched, limiter, related_files[idx], start_lines[idx],
+                                           changed_lines[idx], declarations[idx])
+        done += 1
+        logger.info("🔍 Reviewed chunk %d (%d/%d done)", idx + 1, done, len(code_chunks))
+        if on_result is not None:
+            on_result(idx, result)
+            return None
+        return result
+
+    tasks = [asyncio.ensure_future(run(idx, chunk, matched))
+             for idx, (chunk, matched) in enumerate(zip(code_chunks, all_matches))]
+    if should_stop is None:
+        return await asyncio.gather(*tasks)
+    pending = set(tasks)
+    while pending:
+        _, pending = await asyncio.wait(pending, timeout=STOP_POLL_SECONDS)
+        if pending and should_stop():
+            logger.warning("🛑 Review cancelled with %d of %d chunks unfinished", len(pending), len(tasks))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            break
+    return [None if task.cancelled() else task.result() for task in tasks]
+
+
+def analyze_chunks(code_chunks: List[str], all_matches: List[List[dict]],
+                   max_in_flight: int = MAX_IN_FLIGHT_REQUESTS,
+                   related_files: List[Dict] = None, start_lines: List[int] = None,
+                   on_result: Callable[[int, Dict], None] = None,
+                   should_stop: Callable[[], bool] = None,
+                   changed_lines: List[List[int]] = None,
+                   declarations: List[List[Dict]] = None) -> List[Dict]:
+    """
+    Synchronous entry point for analyze_chunks_async.
+    """
+    return asyncio.run(analyze_chunks_async(code_chunks, all_matches, max_in_flight, related_files, start_lines,
+                                            on_result, should_stop, changed_lines, declarations))
+
+
+def collect_spans(chunked_files: List[Dict]):
+    """
+    Flattens chunk_files_parallel entries into (spans, related_files, static_results).
+    Each span is labelled with its file and the static rule ids already checked there;
+    each file with static remarks gets one whole-file result marked "static".
+    """
+    spans, related_files, static_results = [], [], []
+    for entry in chunked_files:
+        for span in entry["spans"]:
+            span["file"] = entry["file"]
+            span["static_rules"] = entry["static_rules"]
+        spans.extend(entry["spans"])
+        related_files.extend(entry["related_files"] or [None] * len(entry["spans"]))
+        if entry["static_remarks"]:
+            static_results.append({
+                "remarks": entry["static_remarks"],
+                "related_files": {"name": REFERENCE_LIST_NAME, "files": []},
+                "file": entry["file"],
+                "function": None,
+                "start_line": 1,
+                "end_line": entry["line_count"],
+                "static": True,
+            })
+    return spans, related_files, static_results
+
+
+def _trace(span: Dict) -> Dict:
+    return trace_code_references(span["code"], span["start_line"], depth=span_start_depth(span))
+
+
+def _merge_related(related: List[Optional[Dict]]) -> Optional[Dict]:
+    if len(related) == 1 or any(r is None for r in related):
+        return related[0] if len(related) == 1 else None
+    return {"name": REFERENCE_LIST_NAME, "files": [f for r in related for f in r.get("files", [])]}
+
+
+def _split_result(result: Dict, members: List[Dict], related: List[Optional[Dict]]) -> List[Dict]:
+    """
+    One result per member span of a packed chunk. Each remark goes to the
+    member whose lines (or the file lines just before it) hold it; each
+    member keeps its own references.
+    """
+    if len(members) == 1:
+        if result.get("related_files") is None:
+            result["related_files"] = related[0] or _trace(members[0])
+        return [result]
+    parts = []
+    for span, own in zip(members, related):
+        part = {key: value for key, value in result.items() if key not in ("remarks", "related_files")}
+        part["remarks"] = []
+        part["related_files"] = own or _trace(span)
+        parts.append(part)
+    for remark in result.get("remarks", []):
+        try:
+            line = int(remark.get("line"))
+        except (TypeError, ValueError):
+            parts[0]["remarks"].append(remark)
+            continue
+        k = next((k for k, span in enumerate(members) if line <= span["end_line"]), len(members) - 1)
+        parts[k]["remarks"].append(remark)
+    return parts
+
+
+def review_spans(spans: List[Dict], guidelines: List[dict], guideline_index, related_files: List[Dict] = None,
+                 max_in_flight: int = MAX_IN_FLIGHT_REQUESTS, store: ChunkReviewStore = None,
+                 guideline_version: str = None, on_result: Callable[[int, Dict], None] = None,
+                 gate: Gate = None, should_stop: Callable[[], bool] = None,
+                 dedup_distance: float = None, token_budget: int = None) -> List[Dict]:
+    """
+    Retrieves guidelines for and reviews every span, returning results in span order.
+    Guideline ids listed in a span's "static_rules" were checked locally and are
+    not retrieved for it.
+
+    With a store, spans whose normalized code was already reviewed under the
+    same guideline version reuse their stored remarks (re-based onto the
+    span's current start line) and skip retrieval and the LLM entirely.
+
+    With a gate, chunks it deems not worth a review get an empty result marked
+    "skipped" with the reason; audited chunks are reviewed and marked "gate_audit".
+
+    With on_result, results are streamed as on_result(span_index, result) in
+    completion order and nothing is returned, so large runs do not hold every
+    result in memory.
+
+    Spans with "changed_lines" (diff mode) get those lines highlighted in the
+    prompt and keep only remarks on them; their remarks are not stored, since
+    they cover the changed lines only.
+
+    Header declarations a span uses ("declarations", see
+    code_parser.include_graph) are added to its prompt.
+
+    With should_stop, the run is abandoned once it returns True (see
+    analyze_chunks_async); spans not finished by then get no result.
+
+    With dedup_distance, near-duplicate spans still to review are clustered
+    (see reviewer.dedup.cluster_spans), function by function and before any
+    packing, and only one representative per cluster is retrieved for,
+    gated and reviewed. Each member gets the
+    representative's outcome with remark lines moved onto its own code,
+    marked "duplicate_of" the representative.
+
+    With a token_budget, neighbouring spans of a file that are still to be
+    reviewed after all of the above are packed into one request (see
+    code_parser.packer.pack_groups); its remarks are split back per span, so
+    results, the store and the journal stay per function.
+    """
+    related_files = related_files or [None] * len(spans)
+    results = [None] * len(spans) if on_result is None else None
+    members = {}
+
+    def finish(i: int, result: Dict, fresh: bool):
+        span = spans[i]
+        for m in members.get(i, ()):
+            duplicate = {key: value for key, value in result.items() if key in ("skipped", "error", "gate_audit")}
+            duplicate["remarks"] = map_remarks(result.get("remarks", []), span, spans[m])
+            duplicate["related_files"] = related_files[m] or _trace(spans[m])
+            duplicate["duplicate_of"] = {"file": span.get("file"), "function": span.get("name"),
+                                         "start_line": span["start_line"]}
+            finish(m, duplicate, fresh)
+        changed = span.get("changed_lines")
+        if fresh and store is not None and "error" not in result and not changed:
+            store.put(span["code"], span["start_line"], guideline_version, result["remarks"])
+        if changed:
+            result["remarks"] = filter_remarks(result["remarks"], changed)
+            result["changed_lines"] = changed
+        if "file" in span:
+            result["file"] = span["file"]
+        result["function"] = span.get("name")
+        result["start_line"] = span["start_line"]
+        result["end_line"] = span["end_line"]
+        if on_result is not None:
+            on_result(i, result)
+        else:
+            results[i] = result
+
+    todo = list(range(len(spans)))
+    if store is not None:
+        todo = []
+        for i, span in enumerate(spans):
+            remarks = store.get(span["code"], span["start_line"], guideline_version)
+            if remarks is None:
+                todo.append(i)
+                continue
+            finish(i, {
+                "remarks": remarks,
+                "related_files": related_files[i] or _trace(span),
+                "reused": True,
+            }, fresh=False)
+        logger.info("♻️ Incremental mode: %d of %d chunks unchanged, %d to review",
+                    len(spans) - len(todo), len(spans), len(todo))
+
+    if dedup_distance is not None and len(todo) > 1:
+        clusters = cluster_spans([spans[i] for i in todo], dedup_distance)
+        members = {todo[rep]: [todo[m] for m in group] for rep, group in clusters.items()}
+        duplicates = {m for group in members.values() for m in group}
+        todo = [i for i in todo if i not in duplicates]
+
+    if todo and not (should_stop and should_stop()):
+        # Neighbouring functions still to review share a request; reused ones are never re-sent
+        groups = ([[todo[k] for k in group] for group in pack_groups([spans[i] for i in todo], token_budget)]
+                  if token_budget else [[i] for i in todo])
+        units = [merge_group([spans[i] for i in group]) for group in groups]
+        chunks = [unit["code"] for unit in units]
+        logger.info("🔎 Matching guidelines for %d chunks...", len(chunks))
+        all_matches = retrieve_top_matches_batch(chunks, guidelines, guideline_index,
+                                                 exclude=[set(unit.get("static_rules", ())) for unit in units])
+
+        def finish_group(group: List[int], result: Dict, fresh: bool):
+            for i, part in zip(group, _split_result(result, [spans[i] for i in group],
+                                                    [related_files[i] for i in group])):
+                finish(i, part, fresh)
+
+        audits = {}
+        reviewed = list(range(len(groups)))
+        if gate is not None:
+            reviewed = []
+            for j, (chunk, matches) in enumerate(zip(chunks, all_matches)):
+                decision = gate.decide(chunk, matches)
+                if not decision["review"]:
+                    finish_group(groups[j], {"remarks": [], "related_files": None,
+                                             "skipped": decision["reason"]}, fresh=False)
+                    continue
+                if decision["audit"]:
+                    audits[j] = decision["reason"]
+                reviewed.append(j)
+
+        def on_reviewed(k: int, result: Dict):
+            j = reviewed[k]
+            if j in audits:
+                gate.record_audit(result)
+                result["gate_audit"] = audits[j]
+            finish_group(groups[j], result, fresh=True)
+
+        if reviewed:
+            logger.info("🤖 Reviewing %d chunks (max %d requests in flight)...", len(reviewed), max_in_flight)
+            analyze_chunks([chunks[j] for j in reviewed], [all_matches[j] for j in reviewed],
+                           max_in_flight=max_in_flight,
+                           related_files=[_merge_related([related_files[i] for i in groups[j]]) for j in reviewed],
+                           start_lines=[units[j]["start_line"] for j in reviewed],
+                           on_result=on_reviewed, should_stop=should_stop,
+                           changed_lines=[units[j].get("changed_lines") for j in reviewed],
+                           declarations=[units[j].get("declarations") for j in reviewed])
+    return results
@@ -1,6 +1,7 @@
 # prompt_builder.py
 
 import logging
+import os
 from typing import List, Dict
 
 logger = logging.getLogger(__name__)
@@ -8,10 +9,16 @@ logger = logging.getLogger(__name__)
 REVIEW_INSTRUCTION = (
     "Analyze the provided C code chunk below in the context of the listed guidelines. "
     "Flag any violations or issues. For each violation, include the line number, the matched guideline ID, and a brief suggestion. "
+    "Each code line is prefixed with its line number in the original file; use that number for 'line'. "
     "If no violations are found, return an empty list in the 'remarks' field. "
     "Response must strictly follow the JSON format shown."
 )
 
+CHANGED_LINES_INSTRUCTION = (
+    "This review covers a patch: lines whose number is followed by '+' were added or changed, the others are "
+    "unchanged context. Only report issues on changed lines."
+)
+
 OUTPUT_FORMAT_NOTE = """
 {
   "remarks": [
@@ -26,7 +33,32 @@ OUTPUT_FORMAT_NOTE = """
 }
 """
 
-def build_prompt(code_chunk: str, matched_guidelines: List[Dict]) -> str:
+def number_lines(code_chunk: str, start_line: int = 1, changed_lines=None) -> str:
+    """
+    Prefixes every line with its line number in the original file, followed by
+    '+' for lines in changed_lines (diff mode).
+    """
+    lines = code_chunk.rstrip().splitlines()
+    changed = set(changed_lines or ())
+    return "\n".join(f"{start_line + i:>4}{'+' if start_line + i in changed else ''}: {line}"
+                     for i, line in enumerate(lines))
+
+
+def format_declarations(declarations: List[Dict]) -> str:
+    """
+    Declarations grouped under a comment naming the file they come from.
+    """
+    lines, current = [], None
+    for decl in declarations:
+        if decl.get("file") != current:
+            current = decl.get("file")
+            lines.append(f"// {os.path.relpath(current)}" if current else "// (unknown file)")
+        lines.append(decl["text"])
+    return "\n".join(lines)
+
+
+def build_prompt(code_chunk: str, matched_guidelines: List[Dict], start_line: int = 1,
+                 changed_lines=None, declarations: List[Dict] = None) -> str:
     """
     Assemble the final prompt string from the code chunk and relevant guidelines.
     """
@@ -39,15 +71,24 @@ def build_prompt(code_chunk: str, matched_guidelines: List[Dict]) -> str:
     for g in matched_guidelines:
         prompt_sections.append(f"- {g['id']} [{g['severity']} | {g['category']}]: {g['rule']}\n  {g['description']}\n")
 
+    # Declarations the code uses from its headers, so the model does not have to guess types and macros
+    if declarations:
+        prompt_sections.append("\nDeclarations Used by the Code (from its file and included headers):\n")
+        prompt_sections.append("```c\n")
+        prompt_sections.append(format_declarations(declarations))
+        prompt_sections.append("\n```\n")
+
     # Code Section (avoid triple backtick inside f-string)
     prompt_sections.append("\nCode to Review:\n")
     prompt_sections.append("```c\n")
-    prompt_sections.append(code_chunk.strip())
+    prompt_sections.append(number_lines(code_chunk, start_line, changed_lines))
     prompt_sections.append("\n```\n")
 
     # Review instruction
     prompt_sections.append("\nReview Instruction:\n")
     prompt_sections.append(REVIEW_INSTRUCTION)
+    if changed_lines:
+        prompt_sections.append(CHANGED_LINES_INSTRUCTION)
 
     # Output format hint
     prompt_sections.append("\nOutput Format:\n")
@@ -1,18 +1,31 @@
 # rag_engine.py
 
+import hashlib
 import json
 import os
 import logging
 from typing import List, Tuple
-from sentence_transformers import SentenceTransformer, util
-from config import GUIDELINE_JSON_PATH, MAX_GUIDELINE_MATCHES
+import numpy as np
+from config import GUIDELINE_JSON_PATH, MAX_GUIDELINE_MATCHES, EMBEDDING_MODEL_NAME, EMBEDDING_CACHE_DIR
+from reviewer.embedding_cache import EmbeddingCache
+from reviewer.vector_index import ExactIndex
 
 logger = logging.getLogger(__name__)
 
-# Load sentence transformer model once
-logger.info("Loading sentence-transformer model (all-MiniLM-L6-v2)...")
-model = SentenceTransformer("all-MiniLM-L6-v2")
-logger.info("Model loaded successfully")
+_model = None
+
+
+def get_model():
+    """
+    Loads the sentence transformer model on first use, so importing this module stays cheap.
+    """
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        logger.info("Loading sentence-transformer model (%s)...", EMBEDDING_MODEL_NAME)
+        _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        logger.info("Model loaded successfully")
+    return _model
 
 
 def load_guidelines(guideline_path: str) -> List[dict]:
@@ -22,26 +35,89 @@ def load_guidelines(guideline_path: str) -> List[dict]:
     return data
 
 
+def guideline_set_version(guidelines: List[dict]) -> str:
+    """
+    Hash of the full guideline set; any added, edited or removed rule changes it.
+    """
+    payload = json.dumps(guidelines, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def guideline_text(guideline: dict) -> str:
+    return f"{guideline['rule']}. {guideline['description']}"
+
+
+def embed_texts(texts: List[str], owner: str = None) -> np.ndarray:
+    """
+    Embeds texts through the on-disk cache, encoding only texts not seen before.
+    With an owner (e.g. a guideline file), texts are its complete set and
+    cached vectors it no longer uses are pruned (see EmbeddingCache).
+    """
+    cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL_NAME)
+    return cache.get_or_compute(texts, lambda batch: get_model().encode(batch, convert_to_numpy=True), owner)
+
+
 def embed_guidelines(guidelines: List[dict]) -> Tuple[List[dict], List[List[float]]]:
-    texts = [f"{g['rule']}. {g['description']}" for g in guidelines]
+    texts = [guideline_text(g) for g in guidelines]
     logger.info("Generating embeddings for %d guidelines", len(texts))
-    embeddings = model.encode(texts, convert_to_tensor=True)
+    embeddings = embed_texts(texts)
     return guidelines, embeddings
 
 
-def retrieve_top_matches(code_chunk: str, guideline_data: List[dict], guideline_embeddings, top_k=MAX_GUIDELINE_MATCHES) -> List[dict]:
-    query = model.encode(code_chunk, convert_to_tensor=True)
-    logger.debug("Embedding code chunk of %d characters", len(code_chunk))
+def _as_index(guideline_embeddings):
+    """
+    Accepts a GuidelineIndex, a HybridIndex or a plain embedding matrix (searched exactly).
+    """
+    if hasattr(guideline_embeddings, "search") or hasattr(guideline_embeddings, "search_text"):
+        return guideline_embeddings
+    embeddings = np.asarray(guideline_embeddings, dtype=np.float32)
+    index = ExactIndex(embeddings.shape[1] if embeddings.ndim == 2 else 0)
+    if len(embeddings):
+        index.add(np.arange(len(embeddings)), embeddings)
+    return index
+
+
+def retrieve_top_matches_batch(code_chunks: List[str], guideline_data: List[dict], guideline_embeddings,
+                               top_k=MAX_GUIDELINE_MATCHES, batch_size=32, exclude: List[set] = None) -> List[List[dict]]:
+    """
+    Encodes all chunks in one batched pass and ranks guidelines for every chunk
+    in a single index search (one chunk x guideline matrix product for exact search).
+    exclude[i] holds guideline ids to leave out for chunk i (e.g. rules already checked statically).
+    """
+    if not code_chunks:
+        return []
+    exclude = exclude or [()] * len(code_chunks)
+    # Over-fetch so that dropping excluded ids still leaves top_k matches
+    extra = max((len(ids) for ids in exclude), default=0)
 
-    scores = util.cos_sim(query, guideline_embeddings)[0]
-    top_results = scores.topk(top_k)
+    index = _as_index(guideline_embeddings)
+    if hasattr(index, "search_text"):
+        # Lexical/hybrid index (see reviewer.hybrid_index) scores the code directly
+        scores, positions = index.search_text(code_chunks, top_k + extra)
+    else:
+        logger.info("Embedding %d code chunks (batch size %d)", len(code_chunks), batch_size)
+        queries = get_model().encode(code_chunks, batch_size=batch_size, convert_to_numpy=True)
+        scores, positions = index.search(np.asarray(queries, dtype=np.float32), top_k + extra)
 
-    matches = []
-    for idx, score in zip(top_results.indices, top_results.values):
-        guideline = guideline_data[idx]
-        guideline_copy = guideline.copy()
-        guideline_copy["match_score"] = float(score)
-        matches.append(guideline_copy)
+    all_matches = []
+    for row in range(len(code_chunks)):
+        matches = []
+        for idx, score in zip(positions[row], scores[row]):
+            if idx < 0 or guideline_data[idx]["id"] in exclude[row]:
+                continue
+            if len(matches) == top_k:
+                break
+            guideline_copy = guideline_data[idx].copy()
+            guideline_copy["match_score"] = float(score)
+            matches.append(guideline_copy)
+        all_matches.append(matches)
+        if matches:
+            logger.debug("Chunk %d matched top %d guidelines (min score: %.4f)", row, len(matches), matches[-1]["match_score"])
 
-    logger.info("Matched top %d guidelines (min score: %.4f)", top_k, float(top_results.values[-1]))
-    return matches
+    logger.info("Matched top %d guidelines for %d chunks", top_k, len(code_chunks))
+    return all_matches
+
+
+def retrieve_top_matches(code_chunk: str, guideline_data: List[dict], guideline_embeddings, top_k=MAX_GUIDELINE_MATCHES) -> List[dict]:
+    logger.debug("Embedding code chunk of %d characters", len(code_chunk))
+    return retrieve_top_matches_batch([code_chunk], guideline_data, guideline_embeddings, top_k=top_k)[0]
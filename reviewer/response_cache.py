@@ -0,0 +1,301 @@
+# response_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from code_parser.packer import count_tokens
+from config import (RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES,
+                    RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_AGE_DAYS)
+from reviewer.json_stream import JsonStreamParser
+from reviewer.scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Run eviction every N writes rather than on each one
+EVICT_EVERY = 100
+# Completion size assumed for rate limiting when the call sets no max_tokens
+DEFAULT_COMPLETION_TOKENS = 1024
+
+
+def cache_key(model: str, messages: List[Dict], params: Dict) -> str:
+    """
+    Content hash of everything that determines a completion: model, prompt and sampling parameters.
+    """
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed LLM response cache with size- and age-based eviction.
+
+    A single connection is shared across threads and guarded by a lock, so it is
+    safe to use from ThreadPoolExecutor workers. WAL mode lets several review
+    processes share the same file.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_age_days: float = RESPONSE_CACHE_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+            " size INTEGER, created REAL, accessed REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict_locked()
+
+    def evict(self):
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        """
+        Drops expired rows, then least-recently-used rows until both size limits hold.
+        """
+        cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+        removed = cur.rowcount
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            drop, freed = 0, 0
+            for size, in self._conn.execute("SELECT size FROM responses ORDER BY accessed ASC"):
+                if count - drop <= self.max_entries and total - freed <= self.max_bytes:
+                    break
+                drop += 1
+                freed += size
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)", (drop,)
+            )
+            removed += drop
+        self._conn.commit()
+        if removed:
+            logger.info("LLM response cache evicted %d entries", removed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Process-wide cache instance, or None when caching is disabled or the store cannot be opened.
+    """
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ResponseCache()
+            except sqlite3.Error as e:
+                logger.warning("LLM response cache unavailable (%s), continuing without it", e)
+                return None
+        return _cache
+
+
+def _content(response) -> str:
+    try:
+        return response.choices[0].message.content
+    except AttributeError:
+        return response["choices"][0]["message"]["content"]
+
+
+def _prompt_tokens(messages: List[Dict]) -> int:
+    return sum(count_tokens(m.get("content") or "") for m in messages)
+
+
+def _estimate_tokens(messages: List[Dict], params: Dict) -> int:
+    return _prompt_tokens(messages) + params.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+
+def _streamed_usage(messages: List[Dict]) -> Callable[[JsonStreamParser], int]:
+    """
+    Token usage of a streamed answer: the prompt plus the text actually received
+    (the stream is cut once the JSON closes, before any usage report arrives).
+    """
+    prompt = _prompt_tokens(messages)
+    return lambda parser: prompt + count_tokens(parser.raw())
+
+
+def cached_completion(completion_fn: Callable, model: str, messages: List[Dict], **params) -> str:
+    """
+    Returns the completion text for (model, messages, params), calling completion_fn only on a cache miss.
+    Misses go through the per-model scheduler (rate limits, retries with backoff).
+    """
+    cache = get_response_cache()
+    key = cache_key(model, messages, params)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug("LLM cache hit %s", key[:12])
+            return cached
+    response = get_scheduler(model).call(
+        lambda: completion_fn(model=model, messages=messages, **params), _estimate_tokens(messages, params)
+    )
+    content = _content(response)
+    if cache is not None and content:
+        cache.put(key, model, content)
+    return content
+
+
+async def acached_completion(acompletion_fn: Callable, model: str, messages: List[Dict], **params) -> str:
+    """
+    Async variant of cached_completion for litellm.acompletion.
+    """
+    cache = get_response_cache()
+    key = cache_key(model, messages, params)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug("LLM cache hit %s", key[:12])
+            return cached
+    response = await get_scheduler(model).acall(
+        lambda: acompletion_fn(model=model, messages=messages, **params), _estimate_tokens(messages, params)
+    )
+    content = _content(response)
+    if cache is not None and content:
+        cache.put(key, model, content)
+    return content
+
+
+def _delta(chunk) -> str:
+    try:
+        return chunk.choices[0].delta.content or ""
+    except AttributeError:
+        return chunk["choices"][0]["delta"].get("content") or ""
+
+
+def _json_result(cache, key: str, model: str, parser: JsonStreamParser) -> str:
+    text = parser.text()
+    if text is None:
+        return parser.raw()
+    if cache is not None and parser.done:
+        cache.put(key, model, text)
+    return text
+
+
+def cached_json_completion(completion_fn: Callable, model: str, messages: List[Dict], **params) -> str:
+    """
+    Streaming variant of cached_completion for answers that are JSON. The
+    stream is parsed as it arrives and cancelled once the top-level JSON value
+    closes, so the model is not billed for text after it. Returns the JSON
+    text (repaired if the stream was cut short); only complete answers are cached.
+    """
+    cache = get_response_cache()
+    key = cache_key(model, messages, params)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug("LLM cache hit %s", key[:12])
+            return cached
+
+    def consume():
+        parser = JsonStreamParser()
+        stream = completion_fn(model=model, messages=messages, stream=True, **params)
+        try:
+            for chunk in stream:
+                parser.feed(_delta(chunk))
+                if parser.done:
+                    break
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        return parser
+
+    parser = get_scheduler(model).call(consume, _estimate_tokens(messages, params), _streamed_usage(messages))
+    return _json_result(cache, key, model, parser)
+
+
+async def acached_json_completion(acompletion_fn: Callable, model: str, messages: List[Dict], **params) -> str:
+    """
+    Async variant of cached_json_completion for litellm.acompletion.
+    """
+    cache = get_response_cache()
+    key = cache_key(model, messages, params)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug("LLM cache hit %s", key[:12])
+            return cached
+
+    async def consume():
+        parser = JsonStreamParser()
+        stream = await acompletion_fn(model=model, messages=messages, stream=True, **params)
+        try:
+            async for chunk in stream:
+                parser.feed(_delta(chunk))
+                if parser.done:
+                    break
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        return parser
+
+    parser = await get_scheduler(model).acall(consume, _estimate_tokens(messages, params),
+                                              _streamed_usage(messages))
+    return _json_result(cache, key, model, parser)
+
+
+def log_cache_stats():
+    cache = _cache
+    if cache is not None:
+        stats = cache.stats()
+        logger.info("LLM response cache: %d hits, %d misses (%.0f%% hit rate), %d entries",
+                    stats["hits"], stats["misses"], stats["hit_rate"] * 100, stats["entries"])
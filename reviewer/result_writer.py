@@ -0,0 +1,64 @@
+# result_writer.py
+
+import json
+import logging
+import os
+from typing import Dict, Iterator
+
+from config import RESULT_FSYNC_EVERY
+
+logger = logging.getLogger(__name__)
+
+
+class JsonlResultWriter:
+    """
+    Appends one JSON record per line as results arrive. Every line is flushed
+    immediately and the file is fsync'ed every fsync_every records and on
+    close, so a crash loses at most the last checkpoint's worth of results.
+    """
+
+    def __init__(self, path: str, fsync_every: int = RESULT_FSYNC_EVERY, append: bool = False):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.count = 0
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+        if self.count % self.fsync_every == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+            logger.info("Wrote %d records to %s", self.count, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """
+    Streams records back from a JSONL file, skipping a torn last line left by a crash.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Skipping unreadable record at %s:%d", path, line_no)
@@ -0,0 +1,85 @@
+# review_store.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import REVIEW_STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_chunk(code_chunk: str) -> str:
+    """
+    Collapses whitespace within each line so that re-indentation does not
+    count as a change. Line structure is kept, since stored remarks are
+    addressed by their line offset inside the chunk.
+    """
+    lines = [" ".join(line.split()) for line in code_chunk.rstrip().splitlines()]
+    return "\n".join(lines)
+
+
+def chunk_hash(code_chunk: str, guideline_version: str) -> str:
+    payload = guideline_version + "\0" + normalize_chunk(code_chunk)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _shift_remarks(remarks: List[Dict], delta: int) -> List[Dict]:
+    shifted = []
+    for remark in remarks:
+        remark = dict(remark)
+        try:
+            remark["line"] = int(remark["line"]) + delta
+        except (KeyError, TypeError, ValueError):
+            pass
+        shifted.append(remark)
+    return shifted
+
+
+class ChunkReviewStore:
+    """
+    Remarks of previously reviewed function chunks, keyed by the hash of the
+    normalized chunk and the guideline-set version.
+
+    Remark line numbers are stored relative to the chunk start, so a function
+    that only moved within (or between) files gets its remarks back on the
+    correct lines.
+    """
+
+    def __init__(self, path: str = REVIEW_STORE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_reviews ("
+            " key TEXT PRIMARY KEY, remarks TEXT, updated REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, code_chunk: str, start_line: int, guideline_version: str) -> Optional[List[Dict]]:
+        """
+        Stored remarks for an unchanged chunk, re-based onto start_line, or None.
+        """
+        key = chunk_hash(code_chunk, guideline_version)
+        with self._lock:
+            row = self._conn.execute("SELECT remarks FROM chunk_reviews WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return _shift_remarks(json.loads(row[0]), start_line - 1)
+
+    def put(self, code_chunk: str, start_line: int, guideline_version: str, remarks: List[Dict]):
+        key = chunk_hash(code_chunk, guideline_version)
+        relative = _shift_remarks(remarks, 1 - start_line)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunk_reviews (key, remarks, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(relative), time.time()),
+            )
+            self._conn.commit()
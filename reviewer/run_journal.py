@@ -0,0 +1,87 @@
+# run_journal.py
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from reviewer.result_writer import JsonlResultWriter
+
+logger = logging.getLogger(__name__)
+
+
+def unit_key(file: str, chunk_hash: str, group: str, start_line: int = 1) -> str:
+    """
+    Identity of one unit of review work: a chunk of a file, at a given line,
+    reviewed against one guideline group.
+    """
+    return hashlib.sha256(f"{file}\0{start_line}\0{chunk_hash}\0{group}".encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """
+    Append-only log of completed review units.
+
+    Every completed unit is written and fsync'ed immediately. On resume the
+    journal is scanned once to index finished units by byte offset; their
+    results are read back lazily, so a large journal is never held in memory.
+    Without resume the journal starts empty.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.offsets = {}
+        self._lock = threading.Lock()
+        if resume and os.path.isfile(path):
+            self._index()
+            logger.info("Resuming: %d completed units found in %s", len(self.offsets), path)
+            self._terminate_torn_line()
+        self._writer = JsonlResultWriter(path, fsync_every=1, append=resume)
+
+    def _index(self):
+        with open(self.path, "rb") as f:
+            offset = f.tell()
+            for raw in iter(f.readline, b""):
+                try:
+                    self.offsets[json.loads(raw)["unit"]] = offset
+                except (json.JSONDecodeError, KeyError):
+                    logger.warning("Ignoring torn journal entry at byte %d", offset)
+                offset = f.tell()
+
+    def _terminate_torn_line(self):
+        # A crash mid-write leaves a partial last line; start new entries on a fresh line
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get(self, key: str) -> Optional[Dict]:
+        offset = self.offsets.get(key)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())["result"]
+
+    def record(self, key: str, file: str, chunk_hash: str, group: str, result):
+        with self._lock:
+            self._writer.write({"unit": key, "file": file, "chunk_hash": chunk_hash, "group": group, "result": result})
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,307 @@
+# scheduler.py
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from config import (LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MODEL_LIMITS, LLM_MAX_RETRIES,
+                    LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_MAX_CONCURRENCY, LLM_MIN_CONCURRENCY,
+                    LLM_TARGET_LATENCY)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+# litellm maps provider errors onto these exception classes
+RETRYABLE_NAMES = ("RateLimit", "Timeout", "APIConnection", "ServiceUnavailable", "InternalServer", "Overloaded")
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    True for throttling, timeouts, connection failures and 5xx responses.
+    """
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        try:
+            return int(status) in RETRYABLE_STATUS
+        except (TypeError, ValueError):
+            pass
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    return any(name in type(exc).__name__ for name in RETRYABLE_NAMES)
+
+
+def usage_tokens(response) -> Optional[int]:
+    """
+    Total tokens a completion response reports having used, or None if it has no usage.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get("usage")
+    total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+    try:
+        return int(total) if total is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, exc: Exception = None) -> float:
+    """
+    Exponential backoff with full jitter; a server-sent Retry-After wins if longer.
+    """
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    retry_after = getattr(exc, "retry_after", None)
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    if retry_after is None:
+        retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        delay = max(delay, min(LLM_BACKOFF_MAX, float(retry_after)))
+    except (TypeError, ValueError):
+        pass
+    return delay
+
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class TokenBucket:
+    """
+    Refills at rate_per_min units per minute up to one minute's worth. reserve()
+    takes the units immediately (the balance may go negative) and returns how
+    long the caller must wait before using them, so waiting callers are served
+    in arrival order.
+    """
+
+    def __init__(self, rate_per_min: float):
+        self.rate = rate_per_min / 60.0
+        self.capacity = float(rate_per_min)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount: float):
+        """
+        Gives back units reserved but not used (amount > 0) or takes extra ones
+        used beyond the reservation (amount < 0), without waiting.
+        """
+        if self.rate <= 0 or not amount:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ModelScheduler:
+    """
+    Admission control for one model: request and token rate limits, plus an
+    AIMD concurrency limit. The limit grows by one slot per window of healthy
+    requests and halves on a throttling error or when latency exceeds twice
+    LLM_TARGET_LATENCY.
+
+    The token bucket is charged the estimate up front and reconciled with the
+    usage reported after the call. Async callers waiting for a slot sleep on
+    a future that _leave resolves on their own event loop, so they wake as
+    soon as a slot frees up.
+    """
+
+    def __init__(self, model: str):
+        limits = LLM_MODEL_LIMITS.get(model, {})
+        self.model = model
+        self.requests = TokenBucket(limits.get("requests_per_minute", LLM_REQUESTS_PER_MINUTE))
+        self.tokens = TokenBucket(limits.get("tokens_per_minute", LLM_TOKENS_PER_MINUTE))
+        self.max_limit = limits.get("max_concurrency", LLM_MAX_CONCURRENCY)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, future) of async callers waiting for a slot
+
+    # --- concurrency gate ---
+
+    def _try_enter(self) -> bool:
+        if self.in_flight < max(LLM_MIN_CONCURRENCY, int(self.limit)):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _wait(self):
+        with self._cond:
+            if self._try_enter():
+                return
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            while not self._try_enter():
+                self._cond.wait()
+            self.queued -= 1
+
+    async def _await(self):
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._try_enter():
+                return
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        waiter = None
+        try:
+            while True:
+                with self._cond:
+                    if self._try_enter():
+                        self.queued -= 1
+                        return
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+                await waiter
+        except asyncio.CancelledError:
+            with self._cond:
+                self.queued -= 1
+                if (loop, waiter) in self._async_waiters:
+                    self._async_waiters.remove((loop, waiter))
+            raise
+
+    def _wake(self):
+        # Called with _cond held
+        self._cond.notify_all()
+        for loop, waiter in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:  # the waiter's loop has been closed
+                pass
+        self._async_waiters.clear()
+
+    def _leave(self, latency: float = None, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled or (latency is not None and latency > 2 * LLM_TARGET_LATENCY):
+                self.limit = max(LLM_MIN_CONCURRENCY, self.limit / 2)
+                logger.debug("%s: concurrency limit down to %.1f", self.model, self.limit)
+            elif latency is not None and latency <= LLM_TARGET_LATENCY:
+                self.limit = min(self.max_limit, self.limit + 1 / max(1.0, self.limit))
+            if latency is not None:
+                self.calls += 1
+                self.total_latency += latency
+            self._wake()
+
+    def _admission_delay(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def _reconcile(self, tokens: int, result, usage: Callable):
+        used = usage(result)
+        if used is not None:
+            self.tokens.adjust(min(tokens, self.tokens.capacity) - used)
+
+    # --- calls ---
+
+    def call(self, fn: Callable, tokens: int = 0, usage: Callable = usage_tokens):
+        """
+        Runs fn() under the limits, retrying retryable errors with backoff.
+        tokens is the estimated cost; usage(result) gives the actual one (None
+        if unknown), and the difference goes back to the token bucket.
+        The last error is re-raised once retries are exhausted.
+        """
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            time.sleep(self._admission_delay(tokens))
+            self._wait()
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                retry = is_retryable(e)
+                self._leave(throttled=retry)
+                if not retry or attempt == LLM_MAX_RETRIES:
+                    self.failures += 1
+                    raise
+                self._note_retry(attempt, e)
+                time.sleep(backoff_delay(attempt, e))
+                continue
+            self._leave(latency=time.monotonic() - started)
+            self._reconcile(tokens, result, usage)
+            return result
+
+    async def acall(self, fn: Callable, tokens: int = 0, usage: Callable = usage_tokens):
+        """
+        Async variant of call; fn returns an awaitable.
+        """
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await asyncio.sleep(self._admission_delay(tokens))
+            await self._await()
+            started = time.monotonic()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                # Cancelled by the caller (e.g. a cancelled server job): free the slot
+                self._leave()
+                raise
+            except Exception as e:
+                retry = is_retryable(e)
+                self._leave(throttled=retry)
+                if not retry or attempt == LLM_MAX_RETRIES:
+                    self.failures += 1
+                    raise
+                self._note_retry(attempt, e)
+                await asyncio.sleep(backoff_delay(attempt, e))
+                continue
+            self._leave(latency=time.monotonic() - started)
+            self._reconcile(tokens, result, usage)
+            return result
+
+    def _note_retry(self, attempt: int, exc: Exception):
+        self.retries += 1
+        logger.warning("⏳ %s: retryable error (%s), attempt %d/%d",
+                       self.model, type(exc).__name__, attempt + 1, LLM_MAX_RETRIES)
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.limit, 2),
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "avg_latency": self.total_latency / self.calls if self.calls else 0.0,
+        }
+
+
+_schedulers: Dict[str, ModelScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(model: str) -> ModelScheduler:
+    with _schedulers_lock:
+        if model not in _schedulers:
+            _schedulers[model] = ModelScheduler(model)
+        return _schedulers[model]
+
+
+def scheduler_stats() -> Dict[str, Dict]:
+    """
+    Per-model queue depth, concurrency and retry counters.
+    """
+    with _schedulers_lock:
+        return {model: s.stats() for model, s in _schedulers.items()}
+
+
+def log_scheduler_stats():
+    for stats in scheduler_stats().values():
+        logger.info("LLM scheduler %s: %d calls, %d retries, %d failures, avg %.1fs, peak queue %d, limit %.1f",
+                    stats["model"], stats["calls"], stats["retries"], stats["failures"],
+                    stats["avg_latency"], stats["max_queued"], stats["concurrency_limit"])
@@ -0,0 +1,392 @@
+# server.py
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Make the top-level modules importable when run as `python reviewer/server.py`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import (SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_JOB_TTL, LITELLM_MODEL, RETRIEVAL_MODE,
+                    MAX_IN_FLIGHT_REQUESTS, CHUNK_TOKEN_BUDGET, REFERENCE_TRACE_MODE, GATE_ENABLED,
+                    GATE_SCORE_THRESHOLD, GATE_AUDIT_RATE, INCLUDE_DIRS, DEDUP_ENABLED, DEDUP_MAX_DISTANCE)
+from code_parser.chunker import chunk_source, chunk_files_parallel
+from code_parser.include_graph import IncludeGraph
+from code_parser.static_rules import static_guidelines
+from reviewer.gating import Gate
+from reviewer.guideline_store import GuidelineStore
+from reviewer.hybrid_index import load_retrieval_index, RETRIEVAL_MODES
+from reviewer.pipeline import review_spans, collect_spans
+from reviewer.rag_engine import guideline_set_version, get_model
+from reviewer.review_store import ChunkReviewStore
+from reviewer.scheduler import scheduler_stats
+
+logger = logging.getLogger(__name__)
+
+GUIDELINE_FILE = "guidelines/guidelines.json"
+FINISHED = ("done", "cancelled", "error")
+
+
+class ReviewJob:
+    """
+    One submitted review. Events (queued, started, one per chunk result, then
+    done / cancelled / error) are kept in order so any number of clients can
+    stream them from the start, including after the job finished.
+    """
+
+    def __init__(self, job_id: str, files: List[Dict], options: Dict):
+        self.id = job_id
+        self.files = files
+        self.options = options
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.events: List[Dict] = []
+        self.cancelled = threading.Event()
+        self._cond = threading.Condition()
+
+    def emit(self, event: str, **data):
+        with self._cond:
+            self.events.append({"event": event, "job": self.id, **data})
+            if event in FINISHED:
+                self.status = event
+                self.finished = time.time()
+            elif event == "started":
+                self.status = "running"
+            self._cond.notify_all()
+
+    def begin(self) -> bool:
+        """
+        Marks the job running, unless it was cancelled while queued.
+        """
+        with self._cond:
+            if self.status in FINISHED:
+                return False
+            self.emit("started")
+            return True
+
+    def cancel(self) -> bool:
+        with self._cond:
+            if self.status in FINISHED:
+                return False
+            self.cancelled.set()
+            # A job still in the queue never starts, so close its stream here
+            if self.status == "queued":
+                self.emit("cancelled", reason="cancelled before start")
+            return True
+
+    def stream(self, heartbeat: float = 1.0):
+        """
+        Yields events from the first one until the job finishes, and None
+        whenever heartbeat seconds pass without one.
+        """
+        position = 0
+        while True:
+            with self._cond:
+                if position >= len(self.events):
+                    if self.status in FINISHED:
+                        return
+                    self._cond.wait(heartbeat)
+                pending = self.events[position:]
+                position = len(self.events)
+            if pending:
+                yield from pending
+            else:
+                yield None
+
+    def summary(self) -> Dict:
+        with self._cond:
+            results = [e for e in self.events if e["event"] == "result"]
+        return {
+            "job": self.id,
+            "status": self.status,
+            "files": len(self.files),
+            "results": len(results),
+            "remarks": sum(len(e["result"].get("remarks", [])) for e in results),
+        }
+
+
+class ReviewService:
+    """
+    Keeps the embedding model and the guideline index loaded between reviews.
+    Jobs wait in a FIFO queue and run on a small worker pool; every worker
+    shares the process-wide LLM scheduler, response cache and chunk store, so
+    concurrent jobs respect the same rate limits and reuse each other's work.
+    The guideline index is rebuilt only when guidelines.json changes.
+    """
+
+    def __init__(self, guideline_path: str = GUIDELINE_FILE, retrieval: str = RETRIEVAL_MODE,
+                 workers: int = SERVER_WORKERS, max_in_flight: int = MAX_IN_FLIGHT_REQUESTS,
+                 token_budget: int = CHUNK_TOKEN_BUDGET, job_ttl: float = SERVER_JOB_TTL,
+                 include_dirs: List[str] = INCLUDE_DIRS):
+        self.store = GuidelineStore(guideline_path)
+        self.guideline_path = guideline_path
+        self.retrieval = retrieval
+        self.max_in_flight = max_in_flight
+        self.token_budget = token_budget
+        self.job_ttl = job_ttl
+        self.jobs: Dict[str, ReviewJob] = {}
+        self.queue = queue.Queue()
+        self.chunk_store = None
+        # Shared by all jobs: headers are rescanned only when they change on disk
+        self.include_graph = IncludeGraph(include_dirs)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._loaded_version = None
+        self._guidelines = self._index = self._static_rules = None
+        # Spawned, not forked: forking this multithreaded process could copy locks held by other threads
+        self._chunk_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        self._workers = [threading.Thread(target=self._worker, name=f"review-worker-{n}", daemon=True)
+                         for n in range(max(1, workers))]
+
+    def start(self):
+        self.warm()
+        for worker in self._workers:
+            worker.start()
+        logger.info("🧵 %d review workers ready", len(self._workers))
+
+    def close(self):
+        self._chunk_pool.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self):
+        """
+        Loads everything a review needs up front, so the first job is as fast as the rest.
+        """
+        started = time.monotonic()
+        self._current_guidelines()
+        if self.retrieval != "lexical":
+            get_model()
+        self.chunk_store = ChunkReviewStore()
+        logger.info("🔥 Warm start done in %.1fs", time.monotonic() - started)
+
+    def _current_guidelines(self):
+        with self._index_lock:
+            guidelines = self.store.all()
+            version = guideline_set_version(guidelines)
+            if version != self._loaded_version:
+                logger.info("📘 Loading %d guidelines into the %s index", len(guidelines), self.retrieval)
+                self._index = load_retrieval_index(self.guideline_path, guidelines, mode=self.retrieval)
+                self._guidelines = guidelines
+                self._static_rules = static_guidelines(guidelines)
+                self._loaded_version = version
+            return self._guidelines, self._index, self._static_rules, version
+
+    # --- jobs ---
+
+    def submit(self, files: List[Dict], options: Dict = None) -> ReviewJob:
+        for f in files:
+            if "path" not in f:
+                raise ValueError("Each file needs a 'path' (and optionally its 'content')")
+        job = ReviewJob(f"job-{next(self._ids)}", files, options or {})
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+        job.emit("queued", position=self.queue.qsize() + 1)
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ReviewJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [j.id for j in self.jobs.values() if j.finished and now - j.finished > self.job_ttl]:
+            del self.jobs[job_id]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [j.status for j in self.jobs.values()]
+        return {
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "workers": len(self._workers),
+            "retrieval": self.retrieval,
+            "include_graph": self.include_graph.stats(),
+            "llm": scheduler_stats(),
+        }
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job.begin():
+                    self._run(job)
+            except Exception as e:
+                logger.exception("Review job %s failed", job.id)
+                job.emit("error", message=str(e))
+            finally:
+                self.queue.task_done()
+
+    def _chunk(self, job: ReviewJob, static_rules: List[Dict]) -> List[Dict]:
+        with_references = REFERENCE_TRACE_MODE == "static"
+        changed = {f["path"]: set(f["changed_lines"]) for f in job.files if f.get("changed_lines") is not None}
+        on_disk = [f["path"] for f in job.files if f.get("content") is None]
+        from_disk = iter(chunk_files_parallel(on_disk, with_references=with_references,
+                                              token_budget=self.token_budget, static_rules=static_rules,
+                                              changed_lines=changed or None, pool=self._chunk_pool))
+        # Sent contents (e.g. unsaved editor buffers) are chunked in memory, files on disk as usual
+        return [chunk_source(f["path"], f["content"], with_references, self.token_budget, static_rules,
+                             changed.get(f["path"]))
+                if f.get("content") is not None else next(from_disk) for f in job.files]
+
+    def _run(self, job: ReviewJob):
+        started = time.monotonic()
+        options = job.options
+        guidelines, index, static_rules, version = self._current_guidelines()
+        chunked = self._chunk(job, static_rules)
+        for entry in chunked:
+            if "error" in entry:
+                job.emit("file_error", file=entry["file"], message=entry["error"])
+        for f in job.files:
+            self.include_graph.add_file(f["path"], f.get("content"))
+        spans, related_files, static_results = collect_spans(chunked)
+        self.include_graph.annotate(spans, related_files)
+        for result in static_results:
+            job.emit("result", result=result)
+
+        gate = None
+        if options.get("gate", GATE_ENABLED):
+            gate = Gate(options.get("gate_threshold", GATE_SCORE_THRESHOLD), options.get("gate_audit", GATE_AUDIT_RATE))
+        review_spans(spans, guidelines, index, related_files,
+                     max_in_flight=options.get("max_in_flight", self.max_in_flight),
+                     store=self.chunk_store if options.get("incremental", True) else None,
+                     guideline_version=f"{LITELLM_MODEL}:{self.retrieval}:{version}",
+                     on_result=lambda i, result: job.emit("result", result=result),
+                     gate=gate, should_stop=job.cancelled.is_set,
+                     dedup_distance=options.get("dedup_distance", DEDUP_MAX_DISTANCE)
+                     if DEDUP_ENABLED and options.get("dedup", True) else None,
+                     token_budget=self.token_budget)
+
+        elapsed = round(time.monotonic() - started, 3)
+        if job.cancelled.is_set():
+            job.emit("cancelled", reason="cancelled by client", seconds=elapsed)
+            logger.info("🛑 %s cancelled after %.2fs", job.id, elapsed)
+            return
+        summary = job.summary()
+        job.emit("done", chunks=len(spans), remarks=summary["remarks"], seconds=elapsed,
+                 skipped=gate.report()["skipped"] if gate is not None else 0)
+        logger.info("✅ %s: %d files, %d chunks, %d remarks in %.2fs",
+                    job.id, len(job.files), len(spans), summary["remarks"], elapsed)
+
+
+class ReviewRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST   /jobs              {"files": [{"path", "content"?, "changed_lines"?}], "options": {...}, "stream": true}
+                              streams NDJSON events; with "stream": false answers 202 {"job": id}
+    GET    /jobs/<id>         job summary
+    GET    /jobs/<id>/events  NDJSON events from the start (live until the job finishes)
+    DELETE /jobs/<id>         cancels the job
+    GET    /health            queue and LLM scheduler state
+    """
+
+    service: ReviewService = None
+
+    def log_message(self, fmt, *args):
+        logger.debug("%s - %s", self.address_string(), fmt % args)
+
+    def _send_json(self, status: int, body: Dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, job: ReviewJob, cancel_on_disconnect: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            for event in job.stream():
+                # Blank heartbeat lines let a dropped client be noticed (and its job cancelled) mid-review
+                self.wfile.write(json.dumps(event).encode("utf-8") + b"\n" if event else b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            if cancel_on_disconnect and job.cancel():
+                logger.info("🛑 Client of %s went away, cancelling", job.id)
+
+    def _job_path(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            return job, parts[2:]
+        return None, parts
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self._send_json(200, {"status": "ok", **self.service.stats()})
+        job, rest = self._job_path()
+        if job is None:
+            return self._send_json(404, {"error": "unknown job"})
+        if rest == ["events"]:
+            return self._stream(job, cancel_on_disconnect=False)
+        return self._send_json(200, job.summary())
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            job = self.service.submit(body.get("files") or [], body.get("options"))
+        except (ValueError, TypeError, AttributeError) as e:
+            return self._send_json(400, {"error": str(e)})
+        if body.get("stream", True):
+            return self._stream(job, cancel_on_disconnect=True)
+        return self._send_json(202, {"job": job.id})
+
+    def do_DELETE(self):
+        job, _ = self._job_path()
+        if job is None:
+            return self._send_json(404, {"error": "unknown job"})
+        return self._send_json(200, {"job": job.id, "cancelled": job.cancel(), "status": job.status})
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, **service_options):
+    service = ReviewService(**service_options)
+    service.start()
+    handler = type("Handler", (ReviewRequestHandler,), {"service": service})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    logger.info("🚀 Review server listening on http://%s:%d", host, port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down review server")
+    finally:
+        httpd.server_close()
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="🔍 Review server: keeps the model and guideline index warm")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Review jobs run at once")
+    parser.add_argument("--retrieval", choices=RETRIEVAL_MODES, default=RETRIEVAL_MODE)
+    parser.add_argument("--guidelines", default=GUIDELINE_FILE)
+    parser.add_argument("--include-dir", "-I", action="append", default=None,
+                        help="Include root for resolving #include directives (repeatable)")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT_REQUESTS,
+                        help="Maximum concurrent LLM requests per job")
+    args = parser.parse_args()
+    serve(args.host, args.port, guideline_path=args.guidelines, retrieval=args.retrieval,
+          workers=args.workers, max_in_flight=args.max_in_flight,
+          include_dirs=args.include_dir if args.include_dir is not None else INCLUDE_DIRS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# vector_index.py
+
+import logging
+from typing import Tuple
+
+import numpy as np
+
+from config import FAISS_IVF_RETRAIN_FACTOR
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("exact", "faiss-flat", "faiss-ivf", "faiss-hnsw")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class ExactIndex:
+    """
+    Brute-force inner-product index over normalized vectors (cosine similarity).
+    """
+    backend = "exact"
+    supports_remove = True
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids = np.zeros((0,), dtype=np.int64)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.vectors = np.concatenate([self.vectors, normalize(vectors)])
+
+    def needs_retrain(self) -> bool:
+        return False
+
+    def remove(self, ids: np.ndarray):
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64))
+        self.ids = self.ids[keep]
+        self.vectors = self.vectors[keep]
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (scores, ids) of shape (n_queries, top_k); missing slots hold id -1.
+        """
+        n = len(queries)
+        k = min(top_k, len(self.ids))
+        scores = np.full((n, top_k), -np.inf, dtype=np.float32)
+        ids = np.full((n, top_k), -1, dtype=np.int64)
+        if k == 0:
+            return scores, ids
+        sims = normalize(queries) @ self.vectors.T
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        for row, candidates in enumerate(top):
+            ranked = candidates[np.argsort(-sims[row, candidates])]
+            scores[row, :k] = sims[row, ranked]
+            ids[row, :k] = self.ids[ranked]
+        return scores, ids
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, ids=self.ids, vectors=self.vectors)
+
+    @classmethod
+    def load(cls, path: str, dim: int) -> "ExactIndex":
+        data = np.load(path)
+        index = cls(dim)
+        index.ids = data["ids"]
+        index.vectors = data["vectors"]
+        return index
+
+
+class FaissIndex:
+    """
+    FAISS-backed inner-product index. kind is one of "flat", "ivf" or "hnsw".
+    """
+    supports_remove = True
+
+    def __init__(self, dim: int, kind: str = "flat", nlist: int = 64, nprobe: int = 8, hnsw_m: int = 32):
+        import faiss
+        self.faiss = faiss
+        self.dim = dim
+        self.kind = kind
+        self.backend = f"faiss-{kind}"
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.index = None
+        # HNSW graphs cannot drop vectors; callers rebuild instead
+        self.supports_remove = kind != "hnsw"
+
+    def __len__(self):
+        return 0 if self.index is None else self.index.ntotal
+
+    def _target_nlist(self, n: int) -> int:
+        # Keep roughly 39+ training points per list, as FAISS recommends
+        return max(1, min(self.nlist, n // 39))
+
+    def needs_retrain(self) -> bool:
+        """
+        True when an IVF index trained on few vectors has grown enough to
+        support FAISS_IVF_RETRAIN_FACTOR times as many lists.
+        """
+        if self.kind != "ivf" or self.index is None:
+            return False
+        return self._target_nlist(self.index.ntotal) >= FAISS_IVF_RETRAIN_FACTOR * self.index.nlist
+
+    def _create(self, train_vectors: np.ndarray):
+        faiss = self.faiss
+        if self.kind == "flat":
+            return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        if self.kind == "hnsw":
+            return faiss.IndexIDMap2(faiss.IndexHNSWFlat(self.dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT))
+        if self.kind == "ivf":
+            nlist = self._target_nlist(len(train_vectors))
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index = faiss.IndexIVFFlat(quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(train_vectors)
+            index.nprobe = min(self.nprobe, nlist)
+            logger.info("Trained IVF index with %d lists on %d vectors", nlist, len(train_vectors))
+            return index
+        raise ValueError(f"Unknown FAISS index kind: {self.kind}")
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        vectors = normalize(vectors)
+        if self.index is None:
+            self.index = self._create(vectors)
+        self.index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+
+    def remove(self, ids: np.ndarray):
+        if not self.supports_remove:
+            raise NotImplementedError("faiss-hnsw does not support removal")
+        if self.index is not None:
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+
+    def search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.index is None or self.index.ntotal == 0:
+            return (np.full((len(queries), top_k), -np.inf, dtype=np.float32),
+                    np.full((len(queries), top_k), -1, dtype=np.int64))
+        scores, ids = self.index.search(normalize(queries), top_k)
+        scores[ids < 0] = -np.inf
+        return scores, ids
+
+    def save(self, path: str):
+        if self.index is not None:
+            self.faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(cls, path: str, dim: int, kind: str = "flat", **kwargs) -> "FaissIndex":
+        index = cls(dim, kind, **kwargs)
+        index.index = index.faiss.read_index(path)
+        if kind == "ivf":
+            index.index.nprobe = min(index.nprobe, index.index.nlist)
+        return index
+
+
+def create_index(backend: str, dim: int, **kwargs):
+    """
+    Builds an empty index for the given backend, falling back to exact search
+    when faiss-cpu is not installed.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend}', expected one of {BACKENDS}")
+    if backend == "exact":
+        return ExactIndex(dim)
+    try:
+        return FaissIndex(dim, backend.split("-", 1)[1], **kwargs)
+    except ImportError:
+        logger.warning("faiss-cpu is not installed, falling back to exact guideline search")
+        return ExactIndex(dim)
+
+
+def load_index(backend: str, path: str, dim: int, **kwargs):
+    if backend == "exact":
+        return ExactIndex.load(path, dim)
+    return FaissIndex.load(path, dim, backend.split("-", 1)[1], **kwargs)
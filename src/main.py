@@ -4,13 +4,16 @@ import glob
 import json
 import logging
 from code_loader import readCodeFile
-from prompt_manager import buildPrompt
-from review_engine import runParallelReviews, saveReviewToFile
+from review_engine import runParallelReviews, saveReviewToFile, splitStaticRules, runStaticChecks
+from reviewer.response_cache import log_cache_stats
+from reviewer.scheduler import log_scheduler_stats
+from reviewer.run_journal import RunJournal
 
 # Set up basic logging
 logging.basicConfig(
     level=logging.INFO,
-    format="🔹 [%(levelname)s] %(message)s"
+    format="🔹 [%(levelname)s] %(message)s",
+    force=True
 )
 
 def main():
@@ -31,6 +34,16 @@ def main():
         default="code_review.json",
         help="Path to save merged JSON review result"
     )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip guideline groups already completed by an interrupted run (see --journal)"
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="Run journal path (default: <output>.journal.jsonl)"
+    )
     args = parser.parse_args()
 
     try:
@@ -46,15 +59,35 @@ def main():
         for path in chunk_paths:
             with open(path, "r") as f:
                 chunk = json.load(f)
-                all_guideline_chunks.append(chunk)
-                logging.info("Loaded %d rules from %s", len(chunk), os.path.basename(path))
+            # Other JSON files that match the pattern (indexes, caches) are not rule chunks
+            if not isinstance(chunk, list) or not all(isinstance(rule, dict) for rule in chunk):
+                logging.warning("Skipping %s: not a list of guideline rules", os.path.basename(path))
+                continue
+            all_guideline_chunks.append(chunk)
+            logging.info("Loaded %d rules from %s", len(chunk), os.path.basename(path))
+
+        # Rules with a deterministic matcher are checked locally and kept out of the prompts
+        llm_chunks, static_rules = splitStaticRules(all_guideline_chunks)
+        static_review, unchecked = runStaticChecks(args.filepath, static_rules)
+        if static_rules:
+            logging.info("Static rules checked locally: %d rules, %d violations",
+                         len(static_rules) - len(unchecked), len(static_review))
+        if unchecked:
+            llm_chunks.append(unchecked)
 
-        logging.info("Running %d parallel AI agents using model: %s", len(all_guideline_chunks), args.model)
-        final_review = runParallelReviews(code_lines, all_guideline_chunks, model=args.model)
+        logging.info("Running %d parallel AI agents using model: %s", len(llm_chunks), args.model)
+        journal_path = args.journal or os.path.splitext(args.output)[0] + ".journal.jsonl"
+        with RunJournal(journal_path, resume=args.resume) as journal:
+            final_review = static_review + runParallelReviews(
+                code_lines, llm_chunks, model=args.model,
+                journal=journal, filePath=os.path.abspath(args.filepath)
+            ) if llm_chunks else static_review
 
         logging.info("Saving merged review results to: %s", args.output)
         saveReviewToFile(final_review, args.output)
 
+        log_cache_stats()
+        log_scheduler_stats()
         logging.info("✅ Review process completed successfully.")
 
     except Exception as e:
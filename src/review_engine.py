@@ -1,50 +1,47 @@
-def runReview(prompt, model="ollama/llama3", max_tokens=2048):
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from prompt_manager import buildPrompt
+
+# The response cache lives in the top-level reviewer package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from code_parser.static_rules import check_code, static_guidelines
+from code_parser.utils import read_code_file, remove_comments
+from reviewer.json_stream import extract_json_array
+from reviewer.response_cache import cached_json_completion
+from reviewer.run_journal import unit_key
+
+_litellm = None
+
+
+def getLitellm():
+    """
+    Imports litellm on first use so that argument errors and --help exit immediately.
+    """
+    global _litellm
+    if _litellm is None:
+        import litellm
+        _litellm = litellm
+    return _litellm
+
+
+def runReview(prompt, model="ollama/llama3", max_tokens=2048, strict=False):
     """
     Sends the prompt to the specified LLM using LiteLLM and returns JSON feedback.
     Gracefully handles incomplete or malformed JSON arrays.
+    With strict=True a failed call or unparseable output raises instead of
+    returning an empty list, so the caller can tell it apart from a clean review.
     """
     try:
-        response = litellm.completion(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
+        output = cached_json_completion(
+            getLitellm().completion,
+            model,
+            [{"role": "user", "content": prompt}],
             temperature=0,
             max_tokens=max_tokens
         )
-        output = response['choices'][0]['message']['content']
-
-        # --- Robust JSON Array Extraction ---
-        def extract_json_array(text):
-            start = text.find("[")
-            if start == -1:
-                return None  # No JSON array found
-
-            bracket_count = 0
-            in_object = False
-            array_str = ""
-
-            for i in range(start, len(text)):
-                char = text[i]
-                array_str += char
-
-                if char == "{":
-                    in_object = True
-                    bracket_count += 1
-                elif char == "}":
-                    bracket_count -= 1
-                elif char == "]" and bracket_count == 0 and in_object:
-                    # likely end of array
-                    break
-
-            # Try parsing what we have
-            try:
-                return json.loads(array_str)
-            except json.JSONDecodeError:
-                # Try to clean up trailing commas and retry
-                array_str = array_str.rstrip(", \n\r") + "]"
-                try:
-                    return json.loads(array_str)
-                except:
-                    return None
 
         parsed_json = extract_json_array(output)
         if parsed_json is not None:
@@ -52,8 +49,123 @@ def runReview(prompt, model="ollama/llama3", max_tokens=2048):
         else:
             print("❌ Could not parse JSON array from model output.")
             print("📝 Raw Output:\n", output)
+            if strict:
+                raise ValueError("unparseable model output")
             return []
 
     except Exception as e:
+        if strict:
+            raise
         print("❌ Error calling model:", str(e))
         return []
+
+
+def _digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def runParallelReviews(code_lines, guideline_chunks, model="ollama/llama3", journal=None, filePath=None):
+    """
+    Runs multiple LLM reviews in parallel using guideline chunks.
+
+    Args:
+        code_lines (list): Parsed source code lines.
+        guideline_chunks (list): List of guideline subsets (per agent).
+        model (str): Model identifier.
+        journal (RunJournal): Optional run journal; guideline groups already
+            reviewed for this code are taken from it instead of the model.
+        filePath (str): Source file name recorded in the journal.
+
+    Returns:
+        list: Merged review results from all agents.
+    """
+    results = []
+    codeHash = _digest([model, code_lines])
+    pending = {}
+
+    for chunk in guideline_chunks:
+        key = unit_key(filePath or "", codeHash, _digest(chunk))
+        if journal is not None and key in journal:
+            results.extend(journal.get(key))
+        else:
+            pending[key] = chunk
+    if journal is not None and len(pending) < len(guideline_chunks):
+        print(f"⏩ Resume: {len(guideline_chunks) - len(pending)} guideline groups already done, {len(pending)} left")
+
+    def agent_task(key, chunk):
+        prompt = buildPrompt(code_lines, chunk)
+        result = runReview(prompt, model=model, strict=journal is not None)
+        if journal is not None:
+            journal.record(key, filePath or "", codeHash, _digest(chunk), result)
+        return result
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            future_to_chunk = {executor.submit(agent_task, key, chunk): chunk for key, chunk in pending.items()}
+            for future in as_completed(future_to_chunk):
+                try:
+                    result = future.result()
+                    results.extend(result)
+                except Exception as e:
+                    print(f"❌ Agent failed with error: {str(e)}")
+
+    # Optional: Deduplicate violations (based on line + rule ID)
+    unique_reviews = []
+    seen = set()
+    for item in results:
+        key = (item.get("lineNumber"), item.get("ruleViolated"))
+        if key not in seen:
+            unique_reviews.append(item)
+            seen.add(key)
+
+    return unique_reviews
+
+
+def splitStaticRules(guideline_chunks):
+    """
+    Separates guidelines with a deterministic matcher (checked locally by
+    runStaticChecks) from the guideline chunks sent to the LLM agents.
+
+    Returns:
+        tuple: (LLM guideline chunks without static rules, list of static rules)
+    """
+    staticRules = []
+    llmChunks = []
+    for chunk in guideline_chunks:
+        rules = static_guidelines(chunk)
+        staticIds = {rule["id"] for rule in rules}
+        staticRules.extend(rules)
+        remaining = [rule for rule in chunk if rule["id"] not in staticIds]
+        if remaining:
+            llmChunks.append(remaining)
+    return llmChunks, staticRules
+
+
+def runStaticChecks(filePath, staticRules):
+    """
+    Runs static rules over the file and returns violations in the agents' output format,
+    plus the rules that could not be checked (e.g. AST rules on an unparseable file).
+    """
+    if not staticRules:
+        return [], []
+    remarks, applied = check_code(remove_comments(read_code_file(filePath)), staticRules)
+    byId = {rule["id"]: rule for rule in staticRules}
+    violations = [{
+        "lineNumber": remark["line"],
+        "ruleViolated": remark["guideline_id"],
+        "description": byId[remark["guideline_id"]]["rule"],
+        "severity": byId[remark["guideline_id"]].get("severity", ""),
+        "explanation": remark["issue"],
+        "suggestedFix": byId[remark["guideline_id"]].get("suggestion", remark["suggestion"]),
+    } for remark in remarks]
+    unchecked = [rule for rule in staticRules if rule["id"] not in applied]
+    return violations, unchecked
+
+
+def saveReviewToFile(reviewData, outputPath="code_review.json"):
+    """
+    Saves the final review remarks to a JSON file.
+    """
+    with open(outputPath, 'w') as f:
+        json.dump(reviewData, f, indent=4)
+    print(f"✅ Review saved to: {outputPath}")
@@ -0,0 +1,12 @@
+# test_features.py
+
+from code_parser.features import _lexical_tags
+
+
+def test_lexical_tags_trailing_hash():
+    # Line-window and split chunks can end on a lone "#"
+    assert "macro" in _lexical_tags("int x;\n#")
+
+
+def test_lexical_tags_stringize():
+    assert "pp_stringize" in _lexical_tags("#define S(x) f(#x)")